@@ -5,6 +5,7 @@ from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any
 
+from app.locks import FileLock
 from app.config import (
     ANALYTICS_WRITE_SQLITE,
     ANALYTICS_SQLITE_SYNCHRONOUS,
@@ -14,7 +15,10 @@ from app.config import (
 
 SYSTEM_DIR = (BASE_DIR / "_system").resolve()
 DB_PATH = (SYSTEM_DIR / "analytics.sqlite3").resolve()
-SCHEMA_VERSION = 2
+SCHEMA_VERSION = 5
+# Cities are counted the way the legacy analytics counts them: trimmed, with
+# "本地" folded into unknown (''). The profile city is the most common one.
+_CITY_KEY_SQL = "CASE WHEN TRIM({col}) IN ('', '本地') THEN '' ELSE TRIM({col}) END"
 _VISITOR_SALT = (os.environ.get("ANALYTICS_VISITOR_SALT") or "photo-analytics-2026").strip() or "photo-analytics-2026"
 
 
@@ -76,6 +80,8 @@ def init_analytics_store() -> None:
                 ON visit_events(stats_key, visited_at DESC);
             CREATE INDEX IF NOT EXISTS idx_visit_events_filtered_time
                 ON visit_events(is_filtered, visited_at DESC);
+            CREATE INDEX IF NOT EXISTS idx_visit_events_owner_time
+                ON visit_events(owner_id, is_filtered, visited_at, id);
 
             CREATE TABLE IF NOT EXISTS unique_visitors (
                 owner_id TEXT NOT NULL,
@@ -101,33 +107,76 @@ def init_analytics_store() -> None:
                 last_visit TEXT,
                 PRIMARY KEY (owner_id, stats_key)
             );
+
+            CREATE TABLE IF NOT EXISTS visitor_albums (
+                owner_id TEXT NOT NULL,
+                visitor_hash TEXT NOT NULL,
+                stats_key TEXT NOT NULL,
+                visits INTEGER NOT NULL DEFAULT 0,
+                last_seen_at TEXT NOT NULL,
+                PRIMARY KEY (owner_id, visitor_hash, stats_key)
+            );
+
+            CREATE TABLE IF NOT EXISTS visitor_profiles (
+                owner_id TEXT NOT NULL,
+                visitor_hash TEXT NOT NULL,
+                ip_norm TEXT NOT NULL,
+                city TEXT NOT NULL DEFAULT '',
+                album_count INTEGER NOT NULL DEFAULT 0,
+                total_visits INTEGER NOT NULL DEFAULT 0,
+                last_seen_at TEXT NOT NULL,
+                PRIMARY KEY (owner_id, visitor_hash)
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_visitor_profiles_busiest
+                ON visitor_profiles(owner_id, total_visits DESC, album_count);
+
+            CREATE TABLE IF NOT EXISTS visitor_cities (
+                owner_id TEXT NOT NULL,
+                visitor_hash TEXT NOT NULL,
+                city TEXT NOT NULL,
+                visits INTEGER NOT NULL DEFAULT 0,
+                first_seen_at TEXT NOT NULL,
+                PRIMARY KEY (owner_id, visitor_hash, city)
+            );
             """
         )
-        now = _utc_now()
-        _ = conn.execute(
-            """
-            INSERT INTO schema_meta (key, value, updated_at)
-            VALUES (?, ?, ?)
-            ON CONFLICT(key) DO UPDATE SET
-                value = excluded.value,
-                updated_at = excluded.updated_at
-            """,
-            ("schema_version", str(SCHEMA_VERSION), now),
-        )
-        _ = conn.execute(
-            """
-            INSERT INTO schema_meta (key, value, updated_at)
-            VALUES (?, ?, ?)
-            ON CONFLICT(key) DO NOTHING
-            """,
-            ("initialized_at", now, now),
-        )
-        conn.commit()
+        # Every worker runs this at startup: the file lock lets one of them do
+        # the upgrade while the others wait and then find it done.
+        with FileLock(SYSTEM_DIR / ".analytics_schema.lock"):
+            _ = conn.execute("BEGIN IMMEDIATE")
+            stored = conn.execute("SELECT value FROM schema_meta WHERE key = 'schema_version'").fetchone()
+            if stored is not None and int(stored["value"] or 0) < 5:
+                _rebuild_visitor_index(conn)
+            _stamp_schema(conn)
+            conn.commit()
         _ = conn.execute("PRAGMA optimize")
     finally:
         conn.close()
 
 
+def _stamp_schema(conn: sqlite3.Connection) -> None:
+    now = _utc_now()
+    _ = conn.execute(
+        """
+        INSERT INTO schema_meta (key, value, updated_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT(key) DO UPDATE SET
+            value = excluded.value,
+            updated_at = excluded.updated_at
+        """,
+        ("schema_version", str(SCHEMA_VERSION), now),
+    )
+    _ = conn.execute(
+        """
+        INSERT INTO schema_meta (key, value, updated_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT(key) DO NOTHING
+        """,
+        ("initialized_at", now, now),
+    )
+
+
 def _hash_visitor(ip_norm: str) -> str:
     raw = f"{_VISITOR_SALT}:{ip_norm}"
     return hashlib.sha256(raw.encode("utf-8")).hexdigest()
@@ -221,6 +270,16 @@ def record_sqlite_visit(
                 ),
             )
             unique_created = existing_unique is None
+        if visitor_hash and not filter_reason and inserted_event:
+            _record_visitor_album(
+                conn,
+                owner_id=owner_id,
+                visitor_hash=visitor_hash,
+                stats_key=stats_key,
+                ip_norm=normalized_ip,
+                city=city or "",
+                visited_at=visited_at,
+            )
         if inserted_event:
             _ = conn.execute(
                 """
@@ -249,6 +308,532 @@ def record_sqlite_visit(
         conn.close()
 
 
+def _record_visitor_album(
+    conn: sqlite3.Connection,
+    *,
+    owner_id: str,
+    visitor_hash: str,
+    stats_key: str,
+    ip_norm: str,
+    city: str,
+    visited_at: str,
+) -> None:
+    existing_album = conn.execute(
+        "SELECT 1 FROM visitor_albums WHERE owner_id = ? AND visitor_hash = ? AND stats_key = ?",
+        (owner_id, visitor_hash, stats_key),
+    ).fetchone()
+    _ = conn.execute(
+        """
+        INSERT INTO visitor_albums (owner_id, visitor_hash, stats_key, visits, last_seen_at)
+        VALUES (?, ?, ?, 1, ?)
+        ON CONFLICT(owner_id, visitor_hash, stats_key) DO UPDATE SET
+            visits = visitor_albums.visits + 1,
+            last_seen_at = CASE
+                WHEN excluded.last_seen_at > visitor_albums.last_seen_at THEN excluded.last_seen_at
+                ELSE visitor_albums.last_seen_at
+            END
+        """,
+        (owner_id, visitor_hash, stats_key, visited_at),
+    )
+    _ = conn.execute(
+        f"""
+        INSERT INTO visitor_cities (owner_id, visitor_hash, city, visits, first_seen_at)
+        VALUES (?, ?, {_CITY_KEY_SQL.format(col="?")}, 1, ?)
+        ON CONFLICT(owner_id, visitor_hash, city) DO UPDATE SET
+            visits = visitor_cities.visits + 1,
+            first_seen_at = MIN(visitor_cities.first_seen_at, excluded.first_seen_at)
+        """,
+        (owner_id, visitor_hash, city, city, visited_at),
+    )
+    top_city = conn.execute(
+        """
+        SELECT city FROM visitor_cities
+        WHERE owner_id = ? AND visitor_hash = ?
+        ORDER BY visits DESC, first_seen_at ASC, city ASC
+        LIMIT 1
+        """,
+        (owner_id, visitor_hash),
+    ).fetchone()
+    city = str(top_city["city"]) if top_city is not None else ""
+    _ = conn.execute(
+        """
+        INSERT INTO visitor_profiles (
+            owner_id, visitor_hash, ip_norm, city, album_count, total_visits, last_seen_at
+        )
+        VALUES (?, ?, ?, ?, 1, 1, ?)
+        ON CONFLICT(owner_id, visitor_hash) DO UPDATE SET
+            city = excluded.city,
+            album_count = visitor_profiles.album_count + ?,
+            total_visits = visitor_profiles.total_visits + 1,
+            last_seen_at = CASE
+                WHEN excluded.last_seen_at > visitor_profiles.last_seen_at THEN excluded.last_seen_at
+                ELSE visitor_profiles.last_seen_at
+            END
+        """,
+        (owner_id, visitor_hash, ip_norm, city, visited_at, 0 if existing_album else 1),
+    )
+
+
+def _refresh_profile_cities(conn: sqlite3.Connection, owner_id: str | None, visitors_sql: str = "", params: tuple[str, ...] = ()) -> None:
+    """Set visitor_profiles.city to each visitor's most common city.
+
+    ``visitors_sql`` optionally narrows the update to ``visitor_hash IN (...)``;
+    ties go to the city seen first, as with the legacy Counter.
+    """
+    scope = "" if owner_id is None else " AND owner_id = ?"
+    scope_params: tuple[str, ...] = () if owner_id is None else (owner_id,)
+    narrow = f" AND visitor_hash IN ({visitors_sql})" if visitors_sql else ""
+    _ = conn.execute(
+        f"""
+        WITH top AS (
+            SELECT
+                owner_id,
+                visitor_hash,
+                city,
+                ROW_NUMBER() OVER (
+                    PARTITION BY owner_id, visitor_hash
+                    ORDER BY visits DESC, first_seen_at ASC, city ASC
+                ) AS city_rank
+            FROM visitor_cities
+            WHERE 1 = 1{scope}{narrow}
+        )
+        UPDATE visitor_profiles
+        SET city = top.city
+        FROM top
+        WHERE top.city_rank = 1
+            AND visitor_profiles.owner_id = top.owner_id
+            AND visitor_profiles.visitor_hash = top.visitor_hash
+        """,
+        (*scope_params, *params),
+    )
+
+
+def _rebuild_visitor_index(conn: sqlite3.Connection, owner_id: str | None = None) -> None:
+    """Recompute visitor_albums/visitor_cities/visitor_profiles from visit_events in SQL."""
+    scope = "" if owner_id is None else " AND owner_id = ?"
+    params: tuple[str, ...] = () if owner_id is None else (owner_id,)
+    _ = conn.execute(f"DELETE FROM visitor_albums WHERE 1 = 1{scope}", params)
+    _ = conn.execute(f"DELETE FROM visitor_cities WHERE 1 = 1{scope}", params)
+    _ = conn.execute(f"DELETE FROM visitor_profiles WHERE 1 = 1{scope}", params)
+    _ = conn.execute(
+        f"""
+        INSERT INTO visitor_albums (owner_id, visitor_hash, stats_key, visits, last_seen_at)
+        SELECT owner_id, visitor_hash, stats_key, COUNT(*), MAX(visited_at)
+        FROM visit_events
+        WHERE is_filtered = 0 AND visitor_hash <> ''{scope}
+        GROUP BY owner_id, visitor_hash, stats_key
+        """,
+        params,
+    )
+    _ = conn.execute(
+        f"""
+        INSERT INTO visitor_cities (owner_id, visitor_hash, city, visits, first_seen_at)
+        SELECT owner_id, visitor_hash, {_CITY_KEY_SQL.format(col="city")} AS city_key, COUNT(*), MIN(visited_at)
+        FROM visit_events
+        WHERE is_filtered = 0 AND visitor_hash <> ''{scope}
+        GROUP BY owner_id, visitor_hash, city_key
+        """,
+        params,
+    )
+    # Grouped passes only: a per-visitor lookup would rescan visit_events for
+    # every visitor, since no index covers visitor_hash.
+    _ = conn.execute(
+        f"""
+        INSERT INTO visitor_profiles (
+            owner_id, visitor_hash, ip_norm, city, album_count, total_visits, last_seen_at
+        )
+        SELECT owner_id, visitor_hash, MAX(ip_norm), '', COUNT(DISTINCT stats_key), COUNT(*), MAX(visited_at)
+        FROM visit_events
+        WHERE is_filtered = 0 AND visitor_hash <> ''{scope}
+        GROUP BY owner_id, visitor_hash
+        """,
+        params,
+    )
+    _refresh_profile_cities(conn, owner_id)
+
+
+def rebuild_visitor_index(owner_id: str | None = None) -> None:
+    conn = _connect()
+    try:
+        _rebuild_visitor_index(conn, owner_id)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def get_cross_visits(owner_id: str, *, limit: int = 50, offset: int = 0, min_albums: int = 2) -> dict[str, Any]:
+    """Page through visitors who opened at least ``min_albums`` albums, busiest first."""
+    limit = max(1, min(int(limit or 50), 1000))
+    offset = max(0, int(offset or 0))
+    min_albums = max(1, int(min_albums or 2))
+    conn = _connect()
+    try:
+        total = int(
+            conn.execute(
+                "SELECT COUNT(*) AS c FROM visitor_profiles WHERE owner_id = ? AND album_count >= ?",
+                (owner_id, min_albums),
+            ).fetchone()["c"]
+        )
+        profiles = conn.execute(
+            """
+            SELECT visitor_hash, ip_norm, city, album_count, total_visits, last_seen_at
+            FROM visitor_profiles
+            WHERE owner_id = ? AND album_count >= ?
+            ORDER BY total_visits DESC, ip_norm ASC
+            LIMIT ? OFFSET ?
+            """,
+            (owner_id, min_albums, limit, offset),
+        ).fetchall()
+        items: list[dict[str, Any]] = []
+        for row in profiles:
+            albums = conn.execute(
+                """
+                SELECT stats_key FROM visitor_albums
+                WHERE owner_id = ? AND visitor_hash = ?
+                ORDER BY visits DESC, stats_key ASC
+                """,
+                (owner_id, row["visitor_hash"]),
+            ).fetchall()
+            items.append(
+                {
+                    "visitor": str(row["visitor_hash"]),
+                    "ip": str(row["ip_norm"] or ""),
+                    "city": str(row["city"] or ""),
+                    "tokens": [str(a["stats_key"]) for a in albums if a["stats_key"]],
+                    "count": int(row["total_visits"] or 0),
+                    "last_seen_at": str(row["last_seen_at"] or ""),
+                }
+            )
+    finally:
+        conn.close()
+    return {"items": items, "total": total, "limit": limit, "offset": offset}
+
+
+_BULK_STAGING_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS _bulk_visits (
+    source_key TEXT PRIMARY KEY,
+    album_key TEXT NOT NULL,
+    stats_key TEXT NOT NULL,
+    ip_norm TEXT NOT NULL,
+    visitor_hash TEXT NOT NULL,
+    ua TEXT NOT NULL,
+    city TEXT NOT NULL,
+    region TEXT NOT NULL,
+    country TEXT NOT NULL,
+    visited_at TEXT NOT NULL,
+    filter_reason TEXT NOT NULL
+)
+"""
+
+
+def _staging_row(owner_id: str, visit: dict[str, Any]) -> tuple[str, ...]:
+    normalized_ip = str(visit.get("ip_norm") or "").strip() or "unknown"
+    album_key = str(visit.get("album_key") or "")
+    stats_key = str(visit.get("stats_key") or album_key)
+    ua = str(visit.get("ua") or "")
+    visited_at = str(visit.get("visited_at") or "")
+    filter_reason = str(visit.get("filter_reason") or "")
+    source_key = str(visit.get("source_key") or "") or _make_source_key(
+        owner_id, album_key, stats_key, normalized_ip, ua, visited_at, filter_reason
+    )
+    visitor_hash = _hash_visitor(normalized_ip) if normalized_ip not in {"", "unknown"} else ""
+    return (
+        source_key,
+        album_key,
+        stats_key,
+        normalized_ip,
+        visitor_hash,
+        ua,
+        str(visit.get("city") or ""),
+        str(visit.get("region") or ""),
+        str(visit.get("country") or ""),
+        visited_at,
+        filter_reason,
+    )
+
+
+def _relocate_known_visits(conn: sqlite3.Connection, owner_id: str) -> int:
+    """Copy staged locations onto events already stored; returns the number of events changed.
+
+    The per-album city/region/country in unique_visitors and the city counts
+    behind visitor_profiles are then recomputed for the visitors concerned,
+    in grouped passes over their events.
+    """
+    _ = conn.execute("DROP TABLE IF EXISTS temp._relocated")
+    _ = conn.execute(
+        """
+        CREATE TEMP TABLE _relocated AS
+        SELECT e.id, b.city, b.region, b.country, e.visitor_hash
+        FROM _bulk_visits b
+        JOIN main.visit_events e ON e.source_key = b.source_key
+        WHERE e.owner_id = ?
+            AND (b.city <> '' OR b.region <> '' OR b.country <> '')
+            AND (e.city, e.region, e.country) IS NOT (b.city, b.region, b.country)
+        """,
+        (owner_id,),
+    )
+    changed = int(conn.execute("SELECT COUNT(*) AS c FROM _relocated").fetchone()["c"])
+    if not changed:
+        return 0
+    _ = conn.execute(
+        """
+        UPDATE visit_events
+        SET city = r.city, region = r.region, country = r.country
+        FROM _relocated r
+        WHERE visit_events.id = r.id
+        """
+    )
+    _ = conn.execute(
+        """
+        WITH ranked AS (
+            SELECT
+                album_key,
+                visitor_hash,
+                city,
+                region,
+                country,
+                ROW_NUMBER() OVER (w ORDER BY city <> '' DESC, visited_at DESC, id DESC) AS city_rank,
+                ROW_NUMBER() OVER (w ORDER BY region <> '' DESC, visited_at DESC, id DESC) AS region_rank,
+                ROW_NUMBER() OVER (w ORDER BY country <> '' DESC, visited_at DESC, id DESC) AS country_rank
+            FROM visit_events
+            WHERE owner_id = ? AND is_filtered = 0
+                AND visitor_hash IN (SELECT visitor_hash FROM _relocated WHERE visitor_hash <> '')
+            WINDOW w AS (PARTITION BY album_key, visitor_hash)
+        ),
+        latest AS (
+            SELECT
+                album_key,
+                visitor_hash,
+                MAX(CASE WHEN city_rank = 1 THEN city ELSE '' END) AS city,
+                MAX(CASE WHEN region_rank = 1 THEN region ELSE '' END) AS region,
+                MAX(CASE WHEN country_rank = 1 THEN country ELSE '' END) AS country
+            FROM ranked
+            GROUP BY album_key, visitor_hash
+        )
+        UPDATE unique_visitors
+        SET city = latest.city, region = latest.region, country = latest.country
+        FROM latest
+        WHERE unique_visitors.owner_id = ?
+            AND unique_visitors.album_key = latest.album_key
+            AND unique_visitors.visitor_hash = latest.visitor_hash
+        """,
+        (owner_id, owner_id),
+    )
+    relocated_visitors = "SELECT visitor_hash FROM _relocated WHERE visitor_hash <> ''"
+    _ = conn.execute(f"DELETE FROM visitor_cities WHERE owner_id = ? AND visitor_hash IN ({relocated_visitors})", (owner_id,))
+    _ = conn.execute(
+        f"""
+        INSERT INTO visitor_cities (owner_id, visitor_hash, city, visits, first_seen_at)
+        SELECT owner_id, visitor_hash, {_CITY_KEY_SQL.format(col="city")} AS city_key, COUNT(*), MIN(visited_at)
+        FROM visit_events
+        WHERE owner_id = ? AND is_filtered = 0 AND visitor_hash IN ({relocated_visitors})
+        GROUP BY owner_id, visitor_hash, city_key
+        """,
+        (owner_id,),
+    )
+    _refresh_profile_cities(conn, owner_id, relocated_visitors)
+    _ = conn.execute("DROP TABLE IF EXISTS temp._relocated")
+    return changed
+
+
+def _merge_bulk_visits(conn: sqlite3.Connection, owner_id: str) -> int:
+    """Merge the staged batch into the analytics tables; returns new event count."""
+    _ = conn.execute("DELETE FROM _bulk_visits WHERE source_key IN (SELECT source_key FROM main.visit_events)")
+    inserted = int(conn.execute("SELECT COUNT(*) AS c FROM _bulk_visits").fetchone()["c"])
+    if not inserted:
+        return 0
+    _ = conn.execute(
+        """
+        INSERT INTO visit_events (
+            source_key, owner_id, album_key, stats_key, ip_norm, visitor_hash,
+            ua, city, region, country, visited_at, is_filtered, filter_reason
+        )
+        SELECT source_key, ?, album_key, stats_key, ip_norm, visitor_hash,
+            ua, city, region, country, visited_at,
+            CASE WHEN filter_reason <> '' THEN 1 ELSE 0 END, filter_reason
+        FROM _bulk_visits
+        ORDER BY visited_at ASC, source_key ASC
+        """,
+        (owner_id,),
+    )
+    _ = conn.execute(
+        """
+        INSERT INTO unique_visitors (
+            owner_id, album_key, visitor_hash, ip_norm,
+            first_seen_at, last_seen_at, city, region, country
+        )
+        SELECT ?, b.album_key, b.visitor_hash, MAX(b.ip_norm), MIN(b.visited_at), MAX(b.visited_at),
+            COALESCE((SELECT x.city FROM _bulk_visits x
+                      WHERE x.album_key = b.album_key AND x.visitor_hash = b.visitor_hash
+                        AND x.filter_reason = '' AND x.city <> ''
+                      ORDER BY x.visited_at DESC LIMIT 1), ''),
+            COALESCE((SELECT x.region FROM _bulk_visits x
+                      WHERE x.album_key = b.album_key AND x.visitor_hash = b.visitor_hash
+                        AND x.filter_reason = '' AND x.region <> ''
+                      ORDER BY x.visited_at DESC LIMIT 1), ''),
+            COALESCE((SELECT x.country FROM _bulk_visits x
+                      WHERE x.album_key = b.album_key AND x.visitor_hash = b.visitor_hash
+                        AND x.filter_reason = '' AND x.country <> ''
+                      ORDER BY x.visited_at DESC LIMIT 1), '')
+        FROM _bulk_visits b
+        WHERE b.visitor_hash <> '' AND b.filter_reason = ''
+        GROUP BY b.album_key, b.visitor_hash
+        ON CONFLICT(owner_id, album_key, visitor_hash) DO UPDATE SET
+            first_seen_at = CASE
+                WHEN excluded.first_seen_at < unique_visitors.first_seen_at THEN excluded.first_seen_at
+                ELSE unique_visitors.first_seen_at
+            END,
+            last_seen_at = CASE
+                WHEN excluded.last_seen_at > unique_visitors.last_seen_at THEN excluded.last_seen_at
+                ELSE unique_visitors.last_seen_at
+            END,
+            city = CASE WHEN excluded.city <> '' THEN excluded.city ELSE unique_visitors.city END,
+            region = CASE WHEN excluded.region <> '' THEN excluded.region ELSE unique_visitors.region END,
+            country = CASE WHEN excluded.country <> '' THEN excluded.country ELSE unique_visitors.country END
+        """,
+        (owner_id,),
+    )
+    _ = conn.execute(
+        """
+        INSERT INTO stats_rollups (owner_id, stats_key, views, first_visit, last_visit)
+        SELECT ?, stats_key, COUNT(*), MIN(visited_at), MAX(visited_at)
+        FROM _bulk_visits
+        WHERE true
+        GROUP BY stats_key
+        ON CONFLICT(owner_id, stats_key) DO UPDATE SET
+            views = stats_rollups.views + excluded.views,
+            first_visit = CASE
+                WHEN stats_rollups.first_visit IS NULL OR stats_rollups.first_visit = '' THEN excluded.first_visit
+                WHEN excluded.first_visit < stats_rollups.first_visit THEN excluded.first_visit
+                ELSE stats_rollups.first_visit
+            END,
+            last_visit = CASE
+                WHEN stats_rollups.last_visit IS NULL OR stats_rollups.last_visit = '' THEN excluded.last_visit
+                WHEN excluded.last_visit > stats_rollups.last_visit THEN excluded.last_visit
+                ELSE stats_rollups.last_visit
+            END
+        """,
+        (owner_id,),
+    )
+    _ = conn.execute(
+        """
+        INSERT INTO visitor_albums (owner_id, visitor_hash, stats_key, visits, last_seen_at)
+        SELECT ?, visitor_hash, stats_key, COUNT(*), MAX(visited_at)
+        FROM _bulk_visits
+        WHERE visitor_hash <> '' AND filter_reason = ''
+        GROUP BY visitor_hash, stats_key
+        ON CONFLICT(owner_id, visitor_hash, stats_key) DO UPDATE SET
+            visits = visitor_albums.visits + excluded.visits,
+            last_seen_at = CASE
+                WHEN excluded.last_seen_at > visitor_albums.last_seen_at THEN excluded.last_seen_at
+                ELSE visitor_albums.last_seen_at
+            END
+        """,
+        (owner_id,),
+    )
+    _ = conn.execute(
+        """
+        INSERT INTO visitor_profiles (
+            owner_id, visitor_hash, ip_norm, city, album_count, total_visits, last_seen_at
+        )
+        SELECT ?, b.visitor_hash, MAX(b.ip_norm), '',
+            (SELECT COUNT(*) FROM visitor_albums a WHERE a.owner_id = ? AND a.visitor_hash = b.visitor_hash),
+            COUNT(*), MAX(b.visited_at)
+        FROM _bulk_visits b
+        WHERE b.visitor_hash <> '' AND b.filter_reason = ''
+        GROUP BY b.visitor_hash
+        ON CONFLICT(owner_id, visitor_hash) DO UPDATE SET
+            album_count = excluded.album_count,
+            total_visits = visitor_profiles.total_visits + excluded.total_visits,
+            last_seen_at = CASE
+                WHEN excluded.last_seen_at > visitor_profiles.last_seen_at THEN excluded.last_seen_at
+                ELSE visitor_profiles.last_seen_at
+            END
+        """,
+        (owner_id, owner_id),
+    )
+    _ = conn.execute(
+        f"""
+        INSERT INTO visitor_cities (owner_id, visitor_hash, city, visits, first_seen_at)
+        SELECT ?, visitor_hash, {_CITY_KEY_SQL.format(col="city")} AS city_key, COUNT(*), MIN(visited_at)
+        FROM _bulk_visits
+        WHERE visitor_hash <> '' AND filter_reason = ''
+        GROUP BY visitor_hash, city_key
+        ON CONFLICT(owner_id, visitor_hash, city) DO UPDATE SET
+            visits = visitor_cities.visits + excluded.visits,
+            first_seen_at = MIN(visitor_cities.first_seen_at, excluded.first_seen_at)
+        """,
+        (owner_id,),
+    )
+    _refresh_profile_cities(
+        conn, owner_id, "SELECT visitor_hash FROM _bulk_visits WHERE visitor_hash <> '' AND filter_reason = ''"
+    )
+    return inserted
+
+
+def bulk_import_visits(
+    owner_id: str,
+    visits,
+    *,
+    batch_size: int = 5000,
+    progress=None,
+    update_locations: bool = False,
+) -> dict[str, int]:
+    """Import many visits in one transaction.
+
+    ``visits`` yields dicts with the same keys as ``record_sqlite_visit``.
+    Rows are staged with executemany into a TEMP table (no write lock on the
+    main database), then merged into visit_events, unique_visitors,
+    stats_rollups and the cross-visit index with set-based statements inside
+    a single ``BEGIN IMMEDIATE`` transaction. Re-importing the same
+    ``source_key`` values is a no-op, except that with ``update_locations``
+    their city/region/country replace the stored ones. ``progress`` is called
+    with the number of rows staged so far after each batch.
+    """
+    if not analytics_write_enabled():
+        return {"rows_read": 0, "events_inserted": 0, "duplicates": 0, "locations_updated": 0}
+    batch_size = max(1, int(batch_size or 5000))
+    rows_read = 0
+    conn = _connect()
+    try:
+        _ = conn.execute("DROP TABLE IF EXISTS temp._bulk_visits")
+        _ = conn.execute(_BULK_STAGING_SQL)
+        batch: list[tuple[str, ...]] = []
+        for visit in visits:
+            batch.append(_staging_row(owner_id, visit))
+            if len(batch) >= batch_size:
+                _ = conn.executemany("INSERT OR IGNORE INTO _bulk_visits VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+                rows_read += len(batch)
+                batch = []
+                if progress is not None:
+                    progress(rows_read)
+        if batch:
+            _ = conn.executemany("INSERT OR IGNORE INTO _bulk_visits VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            rows_read += len(batch)
+            if progress is not None:
+                progress(rows_read)
+        conn.commit()
+
+        _ = conn.execute("CREATE INDEX IF NOT EXISTS temp._bulk_visits_visitor ON _bulk_visits(visitor_hash, album_key, visited_at)")
+        _ = conn.execute("BEGIN IMMEDIATE")
+        try:
+            relocated = _relocate_known_visits(conn, owner_id) if update_locations else 0
+            inserted = _merge_bulk_visits(conn, owner_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        _ = conn.execute("DROP TABLE IF EXISTS temp._bulk_visits")
+    finally:
+        conn.close()
+    return {
+        "rows_read": rows_read,
+        "events_inserted": inserted,
+        "duplicates": rows_read - inserted,
+        "locations_updated": relocated,
+    }
+
+
 def seed_stats_rollup(*, owner_id: str, stats_key: str, views: int, first_visit: str = "", last_visit: str = "") -> None:
     conn = _connect()
     try:
@@ -298,27 +883,88 @@ def get_stats_rollups(owner_id: str) -> dict[str, dict[str, Any]]:
     }
 
 
-def iter_sqlite_visit_events(owner_id: str):
+def has_sqlite_visit_events(owner_id: str) -> bool:
     conn = _connect()
     try:
-        rows = conn.execute(
-            """
-            SELECT stats_key, ip_norm, city, region, country, ua, visited_at
-            FROM visit_events
-            WHERE owner_id = ? AND is_filtered = 0
-            ORDER BY visited_at ASC, id ASC
-            """,
+        row = conn.execute(
+            "SELECT 1 FROM visit_events WHERE owner_id = ? AND is_filtered = 0 LIMIT 1",
             (owner_id,),
-        ).fetchall()
+        ).fetchone()
+    finally:
+        conn.close()
+    return row is not None
+
+
+def iter_sqlite_visit_events(
+    owner_id: str,
+    *,
+    since: str = "",
+    until: str = "",
+    stats_key: str = "",
+    batch_size: int = 1000,
+):
+    """Stream unfiltered visit events ordered by (visited_at, id).
+
+    Rows are fetched in keyset-paginated batches so memory stays bounded no
+    matter how large the table is. ``since``/``until`` are compared against
+    the stored ISO strings (inclusive) and ``stats_key`` is an exact match.
+    """
+    batch_size = max(1, int(batch_size or 1000))
+    clauses = ["owner_id = ?", "is_filtered = 0"]
+    params: list[Any] = [owner_id]
+    if since:
+        clauses.append("visited_at >= ?")
+        params.append(since)
+    if until:
+        clauses.append("visited_at <= ?")
+        params.append(until)
+    if stats_key:
+        clauses.append("stats_key = ?")
+        params.append(stats_key)
+    where = " AND ".join(clauses)
+
+    last_visited_at: str | None = None
+    last_id = 0
+    conn = _connect()
+    try:
+        while True:
+            if last_visited_at is None:
+                rows = conn.execute(
+                    f"""
+                    SELECT id, stats_key, ip_norm, city, region, country, ua, visited_at
+                    FROM visit_events
+                    WHERE {where}
+                    ORDER BY visited_at ASC, id ASC
+                    LIMIT ?
+                    """,
+                    (*params, batch_size),
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    f"""
+                    SELECT id, stats_key, ip_norm, city, region, country, ua, visited_at
+                    FROM visit_events
+                    WHERE {where} AND (visited_at > ? OR (visited_at = ? AND id > ?))
+                    ORDER BY visited_at ASC, id ASC
+                    LIMIT ?
+                    """,
+                    (*params, last_visited_at, last_visited_at, last_id, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield {
+                    "token": str(row["stats_key"] or ""),
+                    "ip": str(row["ip_norm"] or ""),
+                    "city": str(row["city"] or ""),
+                    "region": str(row["region"] or ""),
+                    "country": str(row["country"] or ""),
+                    "ua": str(row["ua"] or ""),
+                    "time": str(row["visited_at"] or ""),
+                }
+            if len(rows) < batch_size:
+                return
+            last_visited_at = str(rows[-1]["visited_at"])
+            last_id = int(rows[-1]["id"])
     finally:
         conn.close()
-    for row in rows:
-        yield {
-            "token": str(row["stats_key"] or ""),
-            "ip": str(row["ip_norm"] or ""),
-            "city": str(row["city"] or ""),
-            "region": str(row["region"] or ""),
-            "country": str(row["country"] or ""),
-            "ua": str(row["ua"] or ""),
-            "time": str(row["visited_at"] or ""),
-        }
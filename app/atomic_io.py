@@ -0,0 +1,139 @@
+"""Crash-safe file replacement.
+
+``atomic_write_text`` writes to a hidden temp file in the target directory and
+``os.replace``s it over the target, so readers (and a process that crashes
+mid-write) only ever see the old or the new content, never a truncated JSON.
+
+Durability against power loss needs an ``fsync`` before the rename, which is
+the expensive part on hot files (stats on every visit, manifests on every
+upload). With ``coalesce=True`` a path is fsynced at most once per
+``ATOMIC_WRITE_SYNC_INTERVAL_MS``: writes in between are still renamed
+atomically, and a background timer fsyncs the final file once the interval
+has passed. The window for losing (not corrupting) the newest content on power
+loss is bounded by that interval.
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import secrets
+import threading
+import time
+from pathlib import Path
+
+SYNC_INTERVAL_S = max(0, int(os.environ.get("ATOMIC_WRITE_SYNC_INTERVAL_MS", "1000"))) / 1000
+
+_last_sync: dict[str, float] = {}
+# path -> whether its directory needs an fsync too
+_dirty: dict[str, bool] = {}
+_state_lock = threading.Lock()
+_timer: threading.Timer | None = None
+
+
+def _fsync_dir(path: Path) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _fsync_path(path: Path) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def flush_pending() -> int:
+    """fsync every file whose sync was deferred; returns how many were synced."""
+    global _timer
+    with _state_lock:
+        pending = dict(_dirty)
+        _dirty.clear()
+        _timer = None
+        now = time.monotonic()
+        for key in pending:
+            _last_sync[key] = now
+    for key, dir_fsync in pending.items():
+        path = Path(key)
+        _fsync_path(path)
+        if dir_fsync:
+            _fsync_dir(path.parent)
+    return len(pending)
+
+
+def _defer_sync(key: str, dir_fsync: bool, delay: float) -> None:
+    global _timer
+    with _state_lock:
+        _dirty[key] = _dirty.get(key, False) or dir_fsync
+        if _timer is None:
+            _timer = threading.Timer(max(0.0, delay), flush_pending)
+            _timer.daemon = True
+            _timer.start()
+
+
+def _claim_sync(key: str) -> float:
+    """Return 0 if the caller should fsync now, else seconds until the next sync is due."""
+    now = time.monotonic()
+    with _state_lock:
+        wait = _last_sync.get(key, -SYNC_INTERVAL_S) + SYNC_INTERVAL_S - now
+        if wait <= 0:
+            _last_sync[key] = now
+            _dirty.pop(key, None)
+            return 0.0
+        return wait
+
+
+def atomic_write_bytes(
+    path: Path,
+    data: bytes,
+    *,
+    fsync: bool = True,
+    dir_fsync: bool = False,
+    coalesce: bool = False,
+) -> None:
+    path = Path(path)
+    key = str(path)
+    sync_in = _claim_sync(key) if fsync and coalesce else 0.0
+    tmp = path.with_name(f".{path.name}.{secrets.token_hex(4)}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            if fsync and not sync_in:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    if not fsync:
+        return
+    if sync_in:
+        _defer_sync(key, dir_fsync, sync_in)
+    elif dir_fsync:
+        _fsync_dir(path.parent)
+
+
+def atomic_write_text(
+    path: Path,
+    text: str,
+    *,
+    fsync: bool = True,
+    dir_fsync: bool = False,
+    coalesce: bool = False,
+) -> None:
+    atomic_write_bytes(path, text.encode("utf-8"), fsync=fsync, dir_fsync=dir_fsync, coalesce=coalesce)
+
+
+atexit.register(flush_pending)
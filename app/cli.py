@@ -0,0 +1,62 @@
+"""Maintenance commands: ``python -m app.cli <command>``."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+
+from app.analytics_store import init_analytics_store
+from app.users import LEGACY_USER_ID, apply_user_scope, init_user_store
+
+
+def _cmd_backfill_analytics(args: argparse.Namespace) -> int:
+    from app import storage
+
+    init_user_store()
+    init_analytics_store()
+    if apply_user_scope(args.owner) is None:
+        print(f"unknown owner: {args.owner}", file=sys.stderr)
+        return 2
+
+    started = time.perf_counter()
+
+    def _progress(rows: int) -> None:
+        if not args.quiet:
+            elapsed = time.perf_counter() - started
+            print(f"staged {rows} rows ({elapsed:.1f}s)", file=sys.stderr)
+
+    report = storage.backfill_sqlite_from_legacy(regeolocate=args.regeolocate, progress=_progress)
+    report["elapsed_s"] = round(time.perf_counter() - started, 3)
+    print(json.dumps(report, ensure_ascii=False))
+    if report["rows_skipped"] or report["files_failed"]:
+        print(
+            f"incomplete: skipped {report['rows_skipped']} records, {report['files_failed']} files unreadable",
+            file=sys.stderr,
+        )
+        return 1
+    if report["rows_unlocated"]:
+        print(f"warning: {report['rows_unlocated']} records imported without a new location", file=sys.stderr)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    backfill = sub.add_parser("backfill-analytics", help="bulk-copy legacy JSONL visits into analytics.sqlite3")
+    backfill.add_argument("--owner", default=LEGACY_USER_ID, help="user id whose legacy visit logs to import")
+    backfill.add_argument("--regeolocate", action="store_true", help="re-resolve locations for every record, including ones imported before")
+    backfill.add_argument("--quiet", action="store_true", help="suppress progress output")
+    backfill.set_defaults(func=_cmd_backfill_analytics)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    return int(args.func(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
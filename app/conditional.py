@@ -0,0 +1,26 @@
+"""Conditional GET for JSON endpoints.
+
+A route computes its ETag (usually ``storage.generation_etag()``) right after
+authenticating and asks ``not_modified`` whether the client already has that
+version; if so it returns the 304 without building the body.
+"""
+
+from __future__ import annotations
+
+from fastapi import Request, Response
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    return any(tag.strip().removeprefix("W/") in (etag, "*") for tag in if_none_match.split(","))
+
+
+def not_modified(request: Request, response: Response, etag: str) -> Response | None:
+    """Tag response with etag; return a 304 to send instead when If-None-Match already has it."""
+    # no-cache: browsers keep the body but revalidate on every poll.
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -23,6 +23,68 @@ ANALYTICS_READ_SQLITE = _env_bool("ANALYTICS_READ_SQLITE", False)
 REGION_TRACE_ENABLED = _env_bool("REGION_TRACE_ENABLED", True)
 ANALYTICS_SQLITE_TIMEOUT_MS = int(os.environ.get("ANALYTICS_SQLITE_TIMEOUT_MS", "5000"))
 ANALYTICS_SQLITE_SYNCHRONOUS = (os.environ.get("ANALYTICS_SQLITE_SYNCHRONOUS", "NORMAL") or "NORMAL").strip().upper()
+AUTH_CACHE_TTL_S = float(os.environ.get("AUTH_CACHE_TTL_S", "60"))
+AUTH_CACHE_SIZE = int(os.environ.get("AUTH_CACHE_SIZE", "1024"))
+# "memory" keeps limiter state per process; "sqlite" shares it across uvicorn
+# workers. "auto" picks sqlite when WEB_CONCURRENCY asks for several workers.
+RATE_LIMIT_BACKEND = (os.environ.get("RATE_LIMIT_BACKEND", "auto") or "auto").strip().lower()
+if RATE_LIMIT_BACKEND not in {"memory", "sqlite"}:
+    RATE_LIMIT_BACKEND = "sqlite" if int(os.environ.get("WEB_CONCURRENCY", "1") or "1") > 1 else "memory"
+# "link" hard-links re-uploaded content to the copy already stored, "skip"
+# reports it as a duplicate without storing it, "off" stores every copy.
+DEDUP_MODE = (os.environ.get("DEDUP_MODE", "link") or "link").strip().lower()
+if DEDUP_MODE not in {"link", "skip", "off"}:
+    DEDUP_MODE = "link"
+LOOP_LAG_INTERVAL_S = max(0.05, float(os.environ.get("LOOP_LAG_INTERVAL_S", "0.5")))
+LOOP_LAG_WARN_MS = float(os.environ.get("LOOP_LAG_WARN_MS", "250"))
+
+
+_git_head_cache: list[str] = []
+
+
+def _read_git_head(git_dir: Path) -> str:
+    head = (git_dir / "HEAD").read_text(encoding="utf-8").strip()
+    if not head.startswith("ref:"):
+        return head
+    ref = head[4:].strip()
+    ref_file = git_dir / ref
+    if ref_file.exists():
+        return ref_file.read_text(encoding="utf-8").strip()
+    packed = git_dir / "packed-refs"
+    if packed.exists():
+        for line in packed.read_text(encoding="utf-8").splitlines():
+            sha, _, name = line.partition(" ")
+            if name == ref:
+                return sha
+    return ""
+
+
+def _git_short_head() -> str:
+    """Short HEAD commit, resolved at most once per process.
+
+    Reads ``.git`` directly and only shells out to ``git rev-parse`` when the
+    layout is unusual (worktrees, submodules).
+    """
+    if not _git_head_cache:
+        commit = ""
+        git_dir = _PROJECT_ROOT / ".git"
+        if git_dir.is_dir():
+            try:
+                commit = _read_git_head(git_dir)[:7]
+            except OSError:
+                commit = ""
+        if not commit:
+            try:
+                commit = subprocess.check_output(
+                    ["git", "rev-parse", "--short", "HEAD"],
+                    cwd=str(_PROJECT_ROOT),
+                    text=True,
+                    stderr=subprocess.DEVNULL,
+                ).strip()
+            except Exception:
+                commit = ""
+        _git_head_cache.append(commit)
+    return _git_head_cache[0]
 
 
 def _resolve_app_version() -> str:
@@ -34,32 +96,18 @@ def _resolve_app_version() -> str:
         from_file = file_version.read_text(encoding="utf-8").strip()
         if from_file:
             return from_file
-    try:
-        commit = subprocess.check_output(
-            ["git", "rev-parse", "--short", "HEAD"],
-            cwd=str(_PROJECT_ROOT),
-            text=True,
-            stderr=subprocess.DEVNULL,
-        ).strip()
-        return commit or "dev"
-    except Exception:
-        return "dev"
+    # Per-process only: writing .version back would pin it across later pulls.
+    return _git_short_head() or "dev"
 
 
 APP_VERSION = _resolve_app_version()
 
 
 def _resolve_asset_version() -> str:
-    try:
-        commit = subprocess.check_output(
-            ["git", "rev-parse", "--short", "HEAD"],
-            cwd=str(_PROJECT_ROOT),
-            text=True,
-            stderr=subprocess.DEVNULL,
-        ).strip()
-        return commit or APP_VERSION or "dev"
-    except Exception:
-        return APP_VERSION or "dev"
+    env_version = (os.environ.get("ASSET_VERSION") or "").strip()
+    if env_version:
+        return env_version
+    return _git_short_head() or APP_VERSION or "dev"
 
 
 ASSET_VERSION = _resolve_asset_version()
@@ -0,0 +1,58 @@
+"""One-pass directory listings.
+
+``Path.iterdir()`` followed by ``is_dir()``/``is_file()``/``is_symlink()`` costs
+a ``stat``/``lstat`` per check. ``os.scandir`` gets the entry type from the
+directory read itself (``d_type``), so a listing of names and types is a
+single pass with no per-entry syscalls; sizes and mtimes add one ``stat`` per
+entry and are only collected when asked for.
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass(slots=True, frozen=True)
+class ScanEntry:
+    name: str
+    path: str
+    # is_dir excludes symlinks; is_file follows them, like Path.is_file()
+    is_dir: bool
+    is_file: bool
+    is_symlink: bool
+    # -1 unless scanned with_stat
+    size: int = -1
+    mtime_ns: int = -1
+
+    @property
+    def suffix(self) -> str:
+        return os.path.splitext(self.name)[1].lower()
+
+    @property
+    def mtime(self) -> float:
+        return self.mtime_ns / 1e9
+
+
+def scan_dir(d: Path | str, *, with_stat: bool = False) -> list[ScanEntry]:
+    """List d in one pass; a missing directory is empty, entries vanishing mid-scan are skipped."""
+    try:
+        it = os.scandir(d)
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+    out: list[ScanEntry] = []
+    with it:
+        for e in it:
+            try:
+                is_symlink = e.is_symlink()
+                is_dir = not is_symlink and e.is_dir(follow_symlinks=False)
+                is_file = e.is_file()
+                size = mtime_ns = -1
+                if with_stat:
+                    st = e.stat()
+                    size, mtime_ns = st.st_size, st.st_mtime_ns
+            except OSError:
+                continue
+            out.append(ScanEntry(e.name, e.path, is_dir, is_file, is_symlink, size, mtime_ns))
+    return out
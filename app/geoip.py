@@ -0,0 +1,209 @@
+"""GeoIP lookups backed by ip2region with an in-process LRU cache.
+
+Results are ``(city, region, country_code)`` tuples with ip2region's "0"
+placeholders blanked out. Callers pass already-normalized IP strings; local
+or reserved ranges should be handled before reaching this module.
+
+By default the xdb file is mapped read-only instead of read into a private
+buffer, so every uvicorn worker shares the same page-cache pages and startup
+reads nothing up front. GEOIP_MODE selects the ip2region cache policy:
+``mmap`` (default), ``buffer`` (whole file in process memory), ``vector``
+(512 KiB vector index in memory, file reads per lookup) or ``file``.
+"""
+
+from __future__ import annotations
+
+import ipaddress
+import logging
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+GeoResult = tuple[str, str, str]
+_EMPTY: GeoResult = ("", "", "")
+
+_DB_PATH = Path(os.environ["IP2REGION_DB"]) if os.environ.get("IP2REGION_DB") else None
+_CACHE_SIZE = max(0, int(os.environ.get("GEOIP_CACHE_SIZE", "65536")))
+_MODE = (os.environ.get("GEOIP_MODE") or "mmap").strip().lower()
+MODES = ("mmap", "buffer", "vector", "file")
+
+_searcher_lock = threading.Lock()
+# vector/file modes seek+read one shared handle, so lookups must not overlap.
+_file_search_lock = threading.Lock()
+_searcher = None
+_unavailable = False
+
+_cache: "OrderedDict[str, GeoResult]" = OrderedDict()
+_cache_lock = threading.Lock()
+_hits = 0
+_misses = 0
+
+
+def _get_searcher():
+    global _searcher, _unavailable
+
+    if _searcher is not None:
+        return _searcher
+    if _unavailable:
+        return None
+    if not _DB_PATH or not _DB_PATH.exists():
+        _unavailable = True
+        return None
+
+    with _searcher_lock:
+        if _searcher is not None:
+            return _searcher
+        if _unavailable:
+            return None
+        try:
+            _searcher = open_searcher(_DB_PATH, _MODE)
+            return _searcher
+        except Exception:
+            logger.warning("ip2region init failed for path=%s mode=%s", _DB_PATH, _MODE, exc_info=True)
+            _unavailable = True
+            return None
+
+
+def open_searcher(db_path: Path, mode: str = "mmap"):
+    """Build an ip2region Searcher for ``db_path`` using the given cache mode."""
+    from ip2region import searcher as ip2r_searcher
+    from ip2region import util as ip2r_util
+
+    if mode not in MODES:
+        raise ValueError(f"unknown GEOIP_MODE: {mode}")
+    if mode == "mmap":
+        with open(db_path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = ip2r_util.Header(buf[: ip2r_util.HeaderInfoLength])
+        return ip2r_searcher.Searcher(ip2r_util.version_from_header(header), str(db_path), None, buf)
+
+    header = ip2r_util.load_header_from_file(str(db_path))
+    ver = ip2r_util.version_from_header(header)
+    if mode == "buffer":
+        buf = ip2r_util.load_content_from_file(str(db_path))
+        return ip2r_searcher.Searcher(ver, str(db_path), None, buf)
+    if mode == "vector":
+        vector_index = ip2r_util.load_vector_index_from_file(str(db_path))
+        return ip2r_searcher.Searcher(ver, str(db_path), vector_index, None)
+    return ip2r_searcher.Searcher(ver, str(db_path), None, None)
+
+
+def _parse_region(raw: str) -> GeoResult:
+    # ip2region returns: "国家|省份|城市|ISP|国家代码", e.g. "中国|湖南省|娄底市|电信|CN"
+    if not raw or raw == "0|0|0|0|0":
+        return _EMPTY
+    parts = str(raw).split("|")
+    region = parts[1] if len(parts) > 1 else ""
+    city = parts[2] if len(parts) > 2 else ""
+    country_code = parts[4] if len(parts) > 4 else ""
+    return (
+        "" if city == "0" else city,
+        "" if region == "0" else region,
+        "" if country_code == "0" else country_code,
+    )
+
+
+def _search(searcher, ip: str) -> GeoResult:
+    try:
+        if getattr(searcher, "c_buffer", None) is None:
+            with _file_search_lock:
+                return _parse_region(searcher.search(ip))
+        return _parse_region(searcher.search(ip))
+    except Exception:
+        return _EMPTY
+
+
+def _cache_get(ip: str) -> GeoResult | None:
+    global _hits, _misses
+    with _cache_lock:
+        hit = _cache.get(ip)
+        if hit is None:
+            _misses += 1
+            return None
+        _cache.move_to_end(ip)
+        _hits += 1
+        return hit
+
+
+def _cache_put(ip: str, result: GeoResult) -> None:
+    if _CACHE_SIZE <= 0:
+        return
+    with _cache_lock:
+        _cache[ip] = result
+        _cache.move_to_end(ip)
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def lookup(ip: str) -> GeoResult:
+    if not ip:
+        return _EMPTY
+    cached = _cache_get(ip)
+    if cached is not None:
+        return cached
+    searcher = _get_searcher()
+    if searcher is None:
+        return _EMPTY
+    result = _search(searcher, ip)
+    _cache_put(ip, result)
+    return result
+
+
+def _sort_key(ip: str) -> tuple[int, int]:
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return (9, 0)
+    return (addr.version, int(addr))
+
+
+def lookup_many(ips: Iterable[str]) -> dict[str, GeoResult]:
+    """Resolve a batch of IPs, deduplicated and in address order.
+
+    Walking the xdb index in ascending order keeps neighbouring lookups on the
+    same pages, which matters when re-geolocating months of history.
+    """
+    out: dict[str, GeoResult] = {}
+    pending: list[str] = []
+    for ip in set(ip for ip in ips if ip):
+        cached = _cache_get(ip)
+        if cached is not None:
+            out[ip] = cached
+        else:
+            pending.append(ip)
+    if not pending:
+        return out
+    searcher = _get_searcher()
+    if searcher is None:
+        out.update((ip, _EMPTY) for ip in pending)
+        return out
+    for ip in sorted(pending, key=_sort_key):
+        result = _search(searcher, ip)
+        _cache_put(ip, result)
+        out[ip] = result
+    return out
+
+
+def cache_stats() -> dict[str, int | float]:
+    with _cache_lock:
+        total = _hits + _misses
+        return {
+            "size": len(_cache),
+            "capacity": _CACHE_SIZE,
+            "hits": _hits,
+            "misses": _misses,
+            "hit_rate": round(_hits / total, 4) if total else 0.0,
+        }
+
+
+def clear_cache() -> None:
+    global _hits, _misses
+    with _cache_lock:
+        _cache.clear()
+        _hits = 0
+        _misses = 0
@@ -1,10 +1,122 @@
 from __future__ import annotations
 
+import contextvars
 import io
-from typing import Tuple, Optional
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator, Tuple, Optional
 
 from PIL import Image, ImageDraw
 
+_ENCODE_WORKERS = max(1, int(os.environ.get("GRID_ENCODE_WORKERS", str(min(10, os.cpu_count() or 1)))))
+_encode_pool: ThreadPoolExecutor | None = None
+_encode_pool_lock = threading.Lock()
+
+# 单个 worker 内所有九宫格任务共享的内存预算，按任务估算字节数占用
+GRID_MEMORY_BUDGET = max(64, int(os.environ.get("GRID_MEMORY_BUDGET_MB", "1536"))) * 1024 * 1024
+GRID_BUDGET_WAIT_S = float(os.environ.get("GRID_BUDGET_WAIT_S", "30"))
+GRID_PREVIEW_MAX_PX = max(256, int(os.environ.get("GRID_PREVIEW_MAX_PX", "2048")))
+# 九宫格任务专用线程池，与事件循环默认线程池隔离；排队数超过上限直接拒绝
+GRID_JOB_WORKERS = max(1, int(os.environ.get("GRID_JOB_WORKERS", "2")))
+GRID_MAX_PENDING = max(GRID_JOB_WORKERS, int(os.environ.get("GRID_MAX_PENDING", str(GRID_JOB_WORKERS * 4))))
+
+_job_pool: ThreadPoolExecutor | None = None
+_job_lock = threading.Lock()
+_jobs_pending = 0
+
+
+class GridBudgetExceeded(Exception):
+    """任务估算内存超过总预算，永远无法执行"""
+
+
+class GridBusy(Exception):
+    """等待内存预算超时，或排队任务已满"""
+
+
+class GridCancelled(Exception):
+    """客户端已断开，任务中途放弃"""
+
+
+class MemoryBudget:
+    """按字节计数的信号量：并发任务的估算内存总和不超过 capacity"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.used = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def reserve(
+        self, nbytes: int, timeout: float | None = None, cancel: threading.Event | None = None
+    ) -> Iterator[None]:
+        nbytes = max(0, int(nbytes))
+        if nbytes > self.capacity:
+            raise GridBudgetExceeded(f"needs {nbytes} bytes, budget is {self.capacity}")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.used + nbytes > self.capacity:
+                if cancel is not None and cancel.is_set():
+                    raise GridCancelled()
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise GridBusy("grid memory budget busy")
+                # 分段等待，以便及时响应取消
+                self._cond.wait(0.25 if remaining is None else min(0.25, remaining))
+            self.used += nbytes
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.used -= nbytes
+                self._cond.notify_all()
+
+
+memory_budget = MemoryBudget(GRID_MEMORY_BUDGET)
+
+
+def _get_job_pool() -> ThreadPoolExecutor:
+    global _job_pool
+    if _job_pool is None:
+        with _job_lock:
+            if _job_pool is None:
+                _job_pool = ThreadPoolExecutor(max_workers=GRID_JOB_WORKERS, thread_name_prefix="grid-job")
+    return _job_pool
+
+
+def submit_job(fn: Callable, *args) -> Future:
+    """把九宫格任务提交到专用线程池（携带当前 contextvars，如用户作用域）
+
+    运行中加排队的任务数达到 GRID_MAX_PENDING 时抛出 GridBusy。
+    """
+    global _jobs_pending
+    with _job_lock:
+        if _jobs_pending >= GRID_MAX_PENDING:
+            raise GridBusy("grid job queue full")
+        _jobs_pending += 1
+
+    def _done(_f: Future) -> None:
+        global _jobs_pending
+        with _job_lock:
+            _jobs_pending -= 1
+
+    ctx = contextvars.copy_context()
+    future = _get_job_pool().submit(ctx.run, fn, *args)
+    future.add_done_callback(_done)
+    return future
+
+
+def job_stats() -> dict:
+    return {
+        "workers": GRID_JOB_WORKERS,
+        "pending": _jobs_pending,
+        "max_pending": GRID_MAX_PENDING,
+        "budget_used": memory_budget.used,
+        "budget_capacity": memory_budget.capacity,
+    }
+
 
 def resize_if_large(image: Image.Image, max_dimension: int = 2048) -> Image.Image:
     """如果图片尺寸过大，按比例缩小
@@ -64,82 +176,180 @@ def _normalize_rgba(color: Tuple[int, int, int, int]) -> Tuple[int, int, int, in
     )
 
 
-def compose_nine_grid_preview(
-    source_image: Image.Image,
-    line_color: Tuple[int, int, int, int] = (255, 255, 255, 255),
-    line_width: int = 2,
-    gap: int = 0,
-    padding: int = 0,
-    bg_color: Optional[Tuple[int, int, int, int]] = (255, 255, 255, 255),
-) -> Image.Image:
-    lw = max(0, int(line_width))
-    gp = max(0, int(gap))
+def _grid_boxes(w: int, h: int, grid_size: int = 3) -> list[Tuple[int, int, int, int]]:
+    tile_w = w // grid_size
+    tile_h = h // grid_size
+    boxes = []
+    for row in range(grid_size):
+        for col in range(grid_size):
+            left = col * tile_w
+            upper = row * tile_h
+            # 最后一列/行吃掉剩余像素，避免缝隙
+            right = (col + 1) * tile_w if col < grid_size - 1 else w
+            lower = (row + 1) * tile_h if row < grid_size - 1 else h
+            boxes.append((left, upper, right, lower))
+    return boxes
+
+
+def _blend_over(color: Tuple[int, int, int, int], bg: Tuple[int, int, int]) -> Tuple[int, int, int]:
+    r, g, b, a = _normalize_rgba(color)
+    return tuple((c * a + k * (255 - a) + 127) // 255 for c, k in zip((r, g, b), bg))  # type: ignore[return-value]
+
+
+def output_size(w: int, h: int, line_width: int, gap: int, padding: int) -> Tuple[int, int]:
+    sep = max(0, int(gap)) + max(0, int(line_width))
     pd = max(0, int(padding))
-    sep = gp + lw
+    return w + sep * 2 + pd * 2, h + sep * 2 + pd * 2
+
+
+def estimate_job_bytes(
+    size: Tuple[int, int],
+    out_size: Tuple[int, int],
+    output_format: str,
+    *,
+    with_tiles: bool = True,
+) -> int:
+    """估算一次九宫格任务的峰值内存
+
+    解码后的源图（按 4 通道计）+ 转换后的源图 + 预览画布 + 一行切片 + 编码输出。
+    """
+    w, h = size
+    out_w, out_h = out_size
+    bands = 3 if output_format.upper() == "JPEG" else 4
+    src_px = w * h
+    total = src_px * 4 + src_px * bands + out_w * out_h * bands
+    if with_tiles:
+        total += (w * (h // 3 + 1)) * bands + src_px * bands
+    else:
+        total += out_w * out_h
+    return total
 
-    tiles = split_into_grid(source_image, grid_size=3)
 
-    w, h = source_image.size
+def _prepare_source(
+    source_image: Image.Image,
+    output_format: str,
+    bg_color: Tuple[int, int, int],
+    line_color: Tuple[int, int, int, int],
+    transparent_bg: bool,
+):
+    """源图只转换一次：JPEG 在背景色上压平为 RGB，PNG 转 RGBA"""
+    if output_format == "JPEG":
+        return convert_to_rgb(source_image, bg_color), "RGB", bg_color, _blend_over(line_color, bg_color)
+    src = source_image if source_image.mode == "RGBA" else source_image.convert("RGBA")
+    bg = (0, 0, 0, 0) if transparent_bg else (*bg_color, 255)
+    return src, "RGBA", bg, _normalize_rgba(line_color)
+
+
+def _tile_positions(size: Tuple[int, int], sep: int, pd: int) -> list[Tuple[int, int]]:
+    w, h = size
+    tile_w = w // 3
+    tile_h = h // 3
+    xs = [pd, pd + tile_w + sep, pd + tile_w * 2 + sep * 2]
+    ys = [pd, pd + tile_h + sep, pd + tile_h * 2 + sep * 2]
+    return [(x, y) for y in ys for x in xs]
+
+
+def _draw_separators(canvas: Image.Image, size: Tuple[int, int], lw: int, sep: int, pd: int, line_color) -> None:
+    if sep <= 0 or lw <= 0:
+        return
+    w, h = size
     tile_w = w // 3
     tile_h = h // 3
     col_widths = [tile_w, tile_w, w - tile_w * 2]
     row_heights = [tile_h, tile_h, h - tile_h * 2]
+    draw = ImageDraw.Draw(canvas)
+
+    content_w = sum(col_widths) + sep * 2
+    content_h = sum(row_heights) + sep * 2
+    content_left = pd
+    content_top = pd
+
+    x1 = content_left + col_widths[0]
+    x2 = content_left + col_widths[0] + sep + col_widths[1]
+    for x_sep in (x1, x2):
+        line_left = x_sep + (sep - lw) // 2
+        line_right = line_left + lw
+        draw.rectangle(
+            [(line_left, content_top), (line_right - 1, content_top + content_h - 1)],
+            fill=line_color,
+        )
 
-    out_w = sum(col_widths) + sep * 2 + pd * 2
-    out_h = sum(row_heights) + sep * 2 + pd * 2
+    y1 = content_top + row_heights[0]
+    y2 = content_top + row_heights[0] + sep + row_heights[1]
+    for y_sep in (y1, y2):
+        line_top = y_sep + (sep - lw) // 2
+        line_bottom = line_top + lw
+        draw.rectangle(
+            [(content_left, line_top), (content_left + content_w - 1, line_bottom - 1)],
+            fill=line_color,
+        )
+
+
+def _render_strips(
+    src: Image.Image,
+    *,
+    mode: str,
+    bg,
+    line_color,
+    line_width: int,
+    gap: int,
+    padding: int,
+    compose: bool,
+    on_row=None,
+    on_preview=None,
+    should_cancel: Optional[Callable[[], bool]] = None,
+) -> Image.Image:
+    """逐行（3 行）裁切：每行 3 张切片贴进预览画布后交给 on_row，随即释放
+
+    同一时刻只有一行切片驻留内存；每张切片只裁一次，同时用于预览和输出。
+    没有分隔线和边距时预览就是源图本身。最后一行贴完、交给 on_row 之前，
+    已定稿的预览图先交给 on_preview。
+    """
+    lw = max(0, int(line_width))
+    pd = max(0, int(padding))
+    sep = max(0, int(gap)) + lw
+    compose = compose and (sep > 0 or pd > 0)
+
+    canvas = None
+    if compose:
+        canvas = Image.new(mode, output_size(src.width, src.height, lw, gap, pd), bg)
+        _draw_separators(canvas, src.size, lw, sep, pd, line_color)
+    if canvas is None and on_row is None:
+        return src
+
+    boxes = _grid_boxes(src.width, src.height)
+    positions = _tile_positions(src.size, sep, pd)
+    for row in range(3):
+        if should_cancel is not None and should_cancel():
+            raise GridCancelled()
+        row_tiles = [src.crop(boxes[row * 3 + c]) for c in range(3)]
+        if canvas is not None:
+            for c, tile in enumerate(row_tiles):
+                canvas.paste(tile, positions[row * 3 + c])
+        if row == 2 and on_preview is not None:
+            on_preview(canvas if canvas is not None else src)
+        if on_row is not None:
+            on_row(row_tiles)
+        del row_tiles
+    return canvas if canvas is not None else src
 
-    if bg_color is None:
-        bg = (0, 0, 0, 0)
-    else:
-        bg = _normalize_rgba(bg_color)
-    canvas = Image.new("RGBA", (out_w, out_h), bg)
-
-    idx = 0
-    y = pd
-    for r in range(3):
-        x = pd
-        for c in range(3):
-            tile = tiles[idx]
-            idx += 1
-            if tile.mode != "RGBA":
-                tile = tile.convert("RGBA")
-            canvas.paste(tile, (x, y))
-            x += col_widths[c]
-            if c < 2:
-                x += sep
-        y += row_heights[r]
-        if r < 2:
-            y += sep
-
-    if sep > 0 and lw > 0:
-        draw = ImageDraw.Draw(canvas)
-        lc = _normalize_rgba(line_color)
-
-        content_w = sum(col_widths) + sep * 2
-        content_h = sum(row_heights) + sep * 2
-        content_left = pd
-        content_top = pd
-
-        x1 = content_left + col_widths[0]
-        x2 = content_left + col_widths[0] + sep + col_widths[1]
-        for x_sep in (x1, x2):
-            line_left = x_sep + (sep - lw) // 2
-            line_right = line_left + lw
-            draw.rectangle(
-                [(line_left, content_top), (line_right - 1, content_top + content_h - 1)],
-                fill=lc,
-            )
-
-        y1 = content_top + row_heights[0]
-        y2 = content_top + row_heights[0] + sep + row_heights[1]
-        for y_sep in (y1, y2):
-            line_top = y_sep + (sep - lw) // 2
-            line_bottom = line_top + lw
-            draw.rectangle(
-                [(content_left, line_top), (content_left + content_w - 1, line_bottom - 1)],
-                fill=lc,
-            )
 
+def compose_nine_grid_preview(
+    source_image: Image.Image,
+    line_color: Tuple[int, int, int, int] = (255, 255, 255, 255),
+    line_width: int = 2,
+    gap: int = 0,
+    padding: int = 0,
+    bg_color: Optional[Tuple[int, int, int, int]] = (255, 255, 255, 255),
+) -> Image.Image:
+    rgba = source_image if source_image.mode == "RGBA" else source_image.convert("RGBA")
+    lw = max(0, int(line_width))
+    pd = max(0, int(padding))
+    sep = max(0, int(gap)) + lw
+    canvas = Image.new("RGBA", output_size(rgba.width, rgba.height, lw, gap, pd), (0, 0, 0, 0) if bg_color is None else _normalize_rgba(bg_color))
+    for box, pos in zip(_grid_boxes(rgba.width, rgba.height), _tile_positions(rgba.size, sep, pd)):
+        canvas.paste(rgba.crop(box), pos)
+    _draw_separators(canvas, rgba.size, lw, sep, pd, _normalize_rgba(line_color))
     return canvas
 
 
@@ -171,20 +381,26 @@ def split_into_grid(image: Image.Image, grid_size: int = 3) -> list[Image.Image]
         分割后的图片列表（从左到右，从上到下）
     """
     w, h = image.size
-    tile_w = w // grid_size
-    tile_h = h // grid_size
+    return [image.crop(box) for box in _grid_boxes(w, h, grid_size)]
+
+
+def _get_encode_pool() -> ThreadPoolExecutor:
+    global _encode_pool
+    if _encode_pool is None:
+        with _encode_pool_lock:
+            if _encode_pool is None:
+                _encode_pool = ThreadPoolExecutor(max_workers=_ENCODE_WORKERS, thread_name_prefix="grid-encode")
+    return _encode_pool
 
-    tiles: list[Image.Image] = []
-    for row in range(grid_size):
-        for col in range(grid_size):
-            left = col * tile_w
-            upper = row * tile_h
-            # 最后一列/行吃掉剩余像素，避免缝隙
-            right = (col + 1) * tile_w if col < grid_size - 1 else w
-            lower = (row + 1) * tile_h if row < grid_size - 1 else h
-            tiles.append(image.crop((left, upper, right, lower)))
 
-    return tiles
+def _encode(img: Image.Image, output_format: str, quality: int) -> bytes:
+    """编码已转换好 mode 的图片（JPEG 需 RGB，PNG 需 RGBA）"""
+    buffer = io.BytesIO()
+    if output_format == "JPEG":
+        img.save(buffer, format="JPEG", quality=quality, subsampling=0)
+    else:
+        img.save(buffer, format="PNG")
+    return buffer.getvalue()
 
 
 def process_nine_grid(
@@ -198,6 +414,7 @@ def process_nine_grid(
     transparent_bg: bool = False,
     output_format: str = "JPEG",
     quality: int = 95,
+    should_cancel: Optional[Callable[[], bool]] = None,
 ) -> Tuple[bytes, list[bytes]]:
     """处理九宫格图片
 
@@ -210,46 +427,85 @@ def process_nine_grid(
         bg_color: JPEG 输出时的背景色
         output_format: 输出格式（JPEG/PNG）
         quality: JPEG 质量 (1-100)
+        should_cancel: 每行切片前检查，返回 True 时抛出 GridCancelled
 
     Returns:
         (预览图字节, [9张分割图字节列表])
     """
-    if draw_grid:
-        preview_bg: Optional[Tuple[int, int, int, int]]
-        if transparent_bg and output_format.upper() == "PNG":
-            preview_bg = None
-        else:
-            preview_bg = (*bg_color, 255)
-        preview = compose_nine_grid_preview(
-            source_image=source_image,
-            line_color=line_color,
-            line_width=line_width,
-            gap=gap,
-            padding=padding,
-            bg_color=preview_bg,
-        )
-    else:
-        preview = source_image.copy()
+    fmt = "JPEG" if output_format.upper() == "JPEG" else "PNG"
+    src, mode, bg, lc = _prepare_source(source_image, fmt, bg_color, line_color, transparent_bg)
+    pool = _get_encode_pool()
+    tile_futures = []
+    preview_futures = []
+
+    def encode_preview(preview: Image.Image) -> None:
+        # 预览最大，先于最后一行切片入池，与之并行编码；画布本就驻留，不增加内存
+        preview_futures.append(pool.submit(_encode, preview, fmt, quality))
+
+    def encode_row(row_tiles: list[Image.Image]) -> None:
+        row_futures = [pool.submit(_encode, tile, fmt, quality) for tile in row_tiles]
+        tile_futures.extend(row_futures)
+        # 本行编码完成后再裁下一行，切片内存上限为 1/3 源图
+        for f in row_futures:
+            f.result()
+
+    preview = _render_strips(
+        src,
+        mode=mode,
+        bg=bg,
+        line_color=lc,
+        line_width=line_width,
+        gap=gap,
+        padding=padding,
+        compose=draw_grid,
+        on_row=encode_row,
+        on_preview=encode_preview,
+        should_cancel=should_cancel,
+    )
+    if should_cancel is not None and should_cancel():
+        for f in preview_futures:
+            f.cancel()
+        raise GridCancelled()
+    preview_bytes = preview_futures[0].result() if preview_futures else _encode(preview, fmt, quality)
+    return preview_bytes, [f.result() for f in tile_futures]
+
+
+def preview_decode_size(size: Tuple[int, int], image_format: str | None, max_px: int = GRID_PREVIEW_MAX_PX) -> Tuple[int, int]:
+    """预览路径实际解码的尺寸：JPEG 经 draft() 按 1/2、1/4、1/8 缩小解码，其它格式需完整解码"""
+    w, h = size
+    if image_format != "JPEG":
+        return w, h
+    # thumbnail(reducing_gap=2.0) 只会把 draft 缩到不小于目标尺寸的 2 倍
+    scale = 1
+    while scale < 8 and max(w, h) // (scale * 2) >= max_px * 2:
+        scale *= 2
+    return -(-w // scale), -(-h // scale)
+
+
+def fit_preview_source(image: Image.Image, max_px: int = GRID_PREVIEW_MAX_PX) -> float:
+    """按显示分辨率缩小预览源图，返回缩放比例（<=1）
+
+    需在 load() 之前调用：thumbnail() 对 JPEG 先 draft() 让解码器直接缩小解码，
+    其它格式解码后先 reduce() 再重采样，峰值内存远小于全尺寸流程。
+    """
+    w, h = image.size
+    if max(w, h) <= max_px:
+        image.load()
+        return 1.0
+    image.thumbnail((max_px, max_px), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    return image.width / w
 
-    # 分割成 9 张小图
-    tiles = split_into_grid(source_image, grid_size=3)
 
-    # 转换并编码为字节
-    def encode_image(img: Image.Image) -> bytes:
-        buffer = io.BytesIO()
-        if output_format.upper() == "JPEG":
-            img = convert_to_rgb(img, bg_color)
-            img.save(buffer, format="JPEG", quality=quality, subsampling=0)
-        else:
-            if img.mode != "RGBA":
-                img = img.convert("RGBA")
-            img.save(buffer, format="PNG")
-        return buffer.getvalue()
+def scale_grid_params(scale: float, line_width: int, gap: int, padding: int) -> Tuple[int, int, int]:
+    """缩略预览时按比例缩小线宽/间距/边距，非零值至少保留 1 像素"""
+    if scale >= 1.0:
+        return line_width, gap, padding
 
-    preview_bytes = encode_image(preview)
-    tile_bytes_list = [encode_image(tile) for tile in tiles]
+    def _s(v: int) -> int:
+        v = max(0, int(v))
+        return max(1, round(v * scale)) if v > 0 else 0
 
-    return preview_bytes, tile_bytes_list
+    return _s(line_width), _s(gap), _s(padding)
 
 
 def generate_grid_preview(
@@ -263,25 +519,16 @@ def generate_grid_preview(
     output_format: str = "JPEG",
     quality: int = 95,
 ) -> bytes:
-    preview_bg: Optional[Tuple[int, int, int, int]]
-    if transparent_bg and output_format.upper() == "PNG":
-        preview_bg = None
-    else:
-        preview_bg = (*bg_color, 255)
-    preview = compose_nine_grid_preview(
-        source_image=source_image,
-        line_color=line_color,
+    fmt = "JPEG" if output_format.upper() == "JPEG" else "PNG"
+    src, mode, bg, lc = _prepare_source(source_image, fmt, bg_color, line_color, transparent_bg)
+    preview = _render_strips(
+        src,
+        mode=mode,
+        bg=bg,
+        line_color=lc,
         line_width=line_width,
         gap=gap,
         padding=padding,
-        bg_color=preview_bg,
+        compose=True,
     )
-    buffer = io.BytesIO()
-    if output_format.upper() == "JPEG":
-        preview = convert_to_rgb(preview, bg_color)
-        preview.save(buffer, format="JPEG", quality=quality, subsampling=0)
-    else:
-        if preview.mode != "RGBA":
-            preview = preview.convert("RGBA")
-        preview.save(buffer, format="PNG")
-    return buffer.getvalue()
+    return _encode(preview, fmt, quality)
@@ -0,0 +1,191 @@
+"""九宫格会话：原图只上传一次，之后的预览只提交参数
+
+原图落盘到 _system/grid_sessions/<owner>/<id>，多个 worker 都能读到；
+每个进程另外在有界 LRU 里缓存一份解码、缩小到显示分辨率的工作副本。
+预览用工作副本渲染，只有保存/导出才重新解码原图。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import secrets
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+from PIL import Image
+
+from app.grid_processor import GRID_PREVIEW_MAX_PX, fit_preview_source
+from app.users import SYSTEM_DIR
+
+GRID_SESSION_TTL_S = max(60, int(os.environ.get("GRID_SESSION_TTL_S", "1800")))
+GRID_SESSION_CACHE_BYTES = max(16, int(os.environ.get("GRID_SESSION_CACHE_MB", "256"))) * 1024 * 1024
+SESSIONS_DIR = SYSTEM_DIR / "grid_sessions"
+
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+
+@dataclass(slots=True)
+class GridSession:
+    id: str
+    owner_id: str
+    filename: str
+    width: int
+    height: int
+    working: Image.Image
+    scale: float
+    last_used: float
+
+    @property
+    def nbytes(self) -> int:
+        return self.working.width * self.working.height * len(self.working.getbands())
+
+
+_cache: OrderedDict[tuple[str, str], GridSession] = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+
+def _session_path(session_id: str, owner_id: str) -> Path | None:
+    if not _SESSION_ID_RE.match(session_id or ""):
+        return None
+    return SESSIONS_DIR / owner_id / session_id
+
+
+def _drop_cached(key: tuple[str, str]) -> None:
+    global _cache_bytes
+    entry = _cache.pop(key, None)
+    if entry is not None:
+        _cache_bytes -= entry.nbytes
+
+
+def store_upload(fileobj: BinaryIO, owner_id: str, filename: str) -> str:
+    """把上传原图拷贝到会话目录，返回会话 id"""
+    purge_expired()
+    session_id = secrets.token_urlsafe(16)
+    target = SESSIONS_DIR / owner_id / session_id
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fileobj.seek(0)
+    with target.open("wb") as out:
+        shutil.copyfileobj(fileobj, out, 1024 * 1024)
+    target.with_suffix(".json").write_text(json.dumps({"filename": filename}, ensure_ascii=False), encoding="utf-8")
+    return session_id
+
+
+def open_source(session_id: str, owner_id: str) -> Image.Image | None:
+    """懒打开会话原图（只读文件头），会话不存在或已过期时返回 None"""
+    path = _session_path(session_id, owner_id)
+    if path is None:
+        return None
+    try:
+        if time.time() - path.stat().st_mtime > GRID_SESSION_TTL_S:
+            return None
+        os.utime(path)
+        return Image.open(path)
+    except OSError:
+        return None
+
+
+def session_filename(session_id: str, owner_id: str) -> str:
+    path = _session_path(session_id, owner_id)
+    if path is None:
+        return ""
+    try:
+        return str(json.loads(path.with_suffix(".json").read_text(encoding="utf-8")).get("filename") or "")
+    except (OSError, ValueError):
+        return ""
+
+
+def build_session(session_id: str, owner_id: str, source: Image.Image) -> GridSession:
+    """解码并缩小成工作副本放进 LRU；source 须是尚未 load() 的懒打开图片"""
+    global _cache_bytes
+    width, height = source.size
+    scale = fit_preview_source(source, GRID_PREVIEW_MAX_PX)
+    # 工作副本与 source 脱钩，调用方照常 close() 原图
+    working = source.copy() if source.mode in ("RGB", "RGBA") else source.convert("RGBA")
+    session = GridSession(
+        id=session_id,
+        owner_id=owner_id,
+        filename=session_filename(session_id, owner_id),
+        width=width,
+        height=height,
+        working=working,
+        scale=scale,
+        last_used=time.monotonic(),
+    )
+    key = (owner_id, session_id)
+    with _cache_lock:
+        _drop_cached(key)
+        _cache[key] = session
+        _cache_bytes += session.nbytes
+        while _cache_bytes > GRID_SESSION_CACHE_BYTES and len(_cache) > 1:
+            _drop_cached(next(iter(_cache)))
+    return session
+
+
+def get_session(session_id: str, owner_id: str) -> GridSession | None:
+    """只查本进程的 LRU；未命中时调用方用 open_source + build_session 从磁盘重建"""
+    key = (owner_id, session_id)
+    now = time.monotonic()
+    with _cache_lock:
+        session = _cache.get(key)
+        if session is None:
+            return None
+        if now - session.last_used > GRID_SESSION_TTL_S:
+            _drop_cached(key)
+            return None
+        session.last_used = now
+        _cache.move_to_end(key)
+    path = _session_path(session_id, owner_id)
+    try:
+        if path is not None:
+            os.utime(path)
+    except OSError:
+        # 原图被其它 worker 清理或删除，缓存也随之作废
+        with _cache_lock:
+            _drop_cached(key)
+        return None
+    return session
+
+
+def drop_session(session_id: str, owner_id: str) -> bool:
+    with _cache_lock:
+        _drop_cached((owner_id, session_id))
+    path = _session_path(session_id, owner_id)
+    if path is None:
+        return False
+    path.with_suffix(".json").unlink(missing_ok=True)
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def purge_expired(now: float | None = None) -> int:
+    """删除超过 TTL 未访问的会话原图，返回删除数量"""
+    now = time.time() if now is None else now
+    removed = 0
+    try:
+        owners = list(os.scandir(SESSIONS_DIR))
+    except FileNotFoundError:
+        return 0
+    for owner in owners:
+        if not owner.is_dir():
+            continue
+        for entry in os.scandir(owner.path):
+            if entry.name.endswith(".json"):
+                continue
+            try:
+                expired = now - entry.stat().st_mtime > GRID_SESSION_TTL_S
+            except FileNotFoundError:
+                continue
+            if expired and drop_session(entry.name, owner.name):
+                removed += 1
+    return removed
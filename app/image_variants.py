@@ -5,6 +5,8 @@ import subprocess
 import threading
 from pathlib import Path
 
+from app.locks import FileLock
+
 
 _FFMPEG_BIN = os.environ.get("FFMPEG_BIN", "ffmpeg")
 _THUMB_WIDTH = max(320, int(os.environ.get("IMG_THUMB_WIDTH", "1080")))
@@ -13,16 +15,19 @@ _THUMB_AVIF_CRF = max(18, min(50, int(os.environ.get("IMG_THUMB_AVIF_CRF", "36")
 _DOWNLOAD_JPEG_QV = max(2, min(20, int(os.environ.get("IMG_DOWNLOAD_JPEG_QV", "3"))))
 
 _VARIANT_DIRNAME = ".pfv"
-_LOCKS: dict[str, threading.Lock] = {}
+_LOCKS: dict[str, FileLock] = {}
 _LOCKS_GUARD = threading.Lock()
 
 
-def _path_lock(target: Path) -> threading.Lock:
+def _path_lock(target: Path) -> FileLock:
+    # The lock file sits next to the variant so remove_variants_for_source
+    # cleans it up; other workers block on it instead of running ffmpeg twice
+    # or serving a half-written output.
     key = str(target)
     with _LOCKS_GUARD:
         lock = _LOCKS.get(key)
         if lock is None:
-            lock = threading.Lock()
+            lock = FileLock(target.with_name(f".{target.name}.lock"))
             _LOCKS[key] = lock
         return lock
 
@@ -40,9 +45,10 @@ def _is_stale(src: Path, target: Path) -> bool:
         return True
 
 
-def _run_ffmpeg(args: list[str], timeout_s: int = 120) -> None:
+def _run_ffmpeg(args: list[str], timeout_s: int = 120, data: bytes | None = None) -> None:
     subprocess.run(
         [_FFMPEG_BIN, *args],
+        input=data,
         check=True,
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
@@ -50,14 +56,19 @@ def _run_ffmpeg(args: list[str], timeout_s: int = 120) -> None:
     )
 
 
-def _ensure_thumb_avif(src: Path, target: Path) -> Path:
+def _input_arg(src: Path, data: bytes | None) -> str:
+    # Freshly uploaded bytes are piped to ffmpeg instead of re-reading the file.
+    return "pipe:0" if data is not None else str(src)
+
+
+def _ensure_thumb_avif(src: Path, target: Path, data: bytes | None = None) -> Path:
     target.parent.mkdir(parents=True, exist_ok=True)
     vf = f"scale=min({_THUMB_WIDTH}\\,iw):-2:flags=lanczos,format=yuv420p"
     _run_ffmpeg(
         [
             "-y",
             "-i",
-            str(src),
+            _input_arg(src, data),
             "-vf",
             vf,
             "-frames:v",
@@ -73,19 +84,20 @@ def _ensure_thumb_avif(src: Path, target: Path) -> Path:
             "-b:v",
             "0",
             str(target),
-        ]
+        ],
+        data=data,
     )
     return target
 
 
-def _ensure_admin_thumb_avif(src: Path, target: Path) -> Path:
+def _ensure_admin_thumb_avif(src: Path, target: Path, data: bytes | None = None) -> Path:
     target.parent.mkdir(parents=True, exist_ok=True)
     vf = f"scale=min({_ADMIN_THUMB_WIDTH}\\,iw):-2:flags=lanczos,format=yuv420p"
     _run_ffmpeg(
         [
             "-y",
             "-i",
-            str(src),
+            _input_arg(src, data),
             "-vf",
             vf,
             "-frames:v",
@@ -101,18 +113,19 @@ def _ensure_admin_thumb_avif(src: Path, target: Path) -> Path:
             "-b:v",
             "0",
             str(target),
-        ]
+        ],
+        data=data,
     )
     return target
 
 
-def _ensure_download_jpeg(src: Path, target: Path) -> Path:
+def _ensure_download_jpeg(src: Path, target: Path, data: bytes | None = None) -> Path:
     target.parent.mkdir(parents=True, exist_ok=True)
     _run_ffmpeg(
         [
             "-y",
             "-i",
-            str(src),
+            _input_arg(src, data),
             "-frames:v",
             "1",
             "-q:v",
@@ -120,16 +133,17 @@ def _ensure_download_jpeg(src: Path, target: Path) -> Path:
             "-pix_fmt",
             "yuvj420p",
             str(target),
-        ]
+        ],
+        data=data,
     )
     return target
 
 
-def _ensure_one(src: Path, target: Path, builder) -> Path:
+def _ensure_one(src: Path, target: Path, builder, data: bytes | None = None) -> Path:
     lock = _path_lock(target)
     with lock:
         if _is_stale(src, target):
-            builder(src, target)
+            builder(src, target, data)
     return target
 
 
@@ -148,26 +162,47 @@ def download_jpeg_path(src: Path) -> Path:
     return _variant_root(src) / f"download-q{_DOWNLOAD_JPEG_QV}.jpg"
 
 
-def ensure_thumb_avif(src: Path) -> Path:
-    return _ensure_one(src, thumb_avif_path(src), _ensure_thumb_avif)
+def ensure_thumb_avif(src: Path, data: bytes | None = None) -> Path:
+    return _ensure_one(src, thumb_avif_path(src), _ensure_thumb_avif, data)
 
 
 def ensure_admin_thumb_avif(src: Path) -> Path:
     return _ensure_one(src, admin_thumb_avif_path(src), _ensure_admin_thumb_avif)
 
 
-def ensure_download_jpeg(src: Path) -> Path:
-    return _ensure_one(src, download_jpeg_path(src), _ensure_download_jpeg)
+def ensure_download_jpeg(src: Path, data: bytes | None = None) -> Path:
+    return _ensure_one(src, download_jpeg_path(src), _ensure_download_jpeg, data)
 
 
-def ensure_all_variants_best_effort(src: Path) -> None:
+def ensure_all_variants_best_effort(src: Path, data: bytes | None = None) -> None:
     try:
-        ensure_thumb_avif(src)
-        ensure_download_jpeg(src)
+        ensure_thumb_avif(src, data)
+        ensure_download_jpeg(src, data)
     except Exception:
         return
 
 
+def link_variants(src: Path, dst: Path) -> int:
+    # dst is a hard link of src, so src's finished variants are valid for it too.
+    root = _variant_root(src)
+    if not root.is_dir():
+        return 0
+    target_root = _variant_root(dst)
+    linked = 0
+    for p in root.iterdir():
+        if not p.is_file() or p.name.startswith("."):
+            continue
+        target_root.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(p, target_root / p.name)
+        except FileExistsError:
+            continue
+        except OSError:
+            break
+        linked += 1
+    return linked
+
+
 def remove_variants_for_source(src: Path) -> None:
     root = _variant_root(src)
     if not root.exists():
@@ -0,0 +1,151 @@
+"""Background import jobs and their progress.
+
+A job's counters live in memory in the worker that runs it and are mirrored
+(throttled) to _system/import_jobs/<id>.json, so a poll that lands on another
+uvicorn worker still sees the progress.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import secrets
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from app.atomic_io import atomic_write_text
+from app.users import SYSTEM_DIR
+
+JOBS_DIR = SYSTEM_DIR / "import_jobs"
+_JOB_TTL_S = max(60, int(os.environ.get("IMPORT_JOB_TTL_S", str(24 * 3600))))
+_FLUSH_INTERVAL_S = 0.5
+_JOB_ID_LEN = 16
+
+_jobs: dict[str, "ImportJob"] = {}
+_jobs_lock = threading.Lock()
+
+
+@dataclass(slots=True)
+class ImportJob:
+    id: str
+    owner_id: str
+    kind: str
+    status: str = "queued"
+    total: int = 0
+    processed: int = 0
+    imported: int = 0
+    linked: int = 0
+    duplicates: int = 0
+    bytes: int = 0
+    skipped: dict[str, int] = field(default_factory=dict)
+    error: str = ""
+    created_at: float = field(default_factory=time.time)
+    finished_at: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _flushed_at: float = 0.0
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "total": self.total,
+                "processed": self.processed,
+                "imported": self.imported,
+                "linked": self.linked,
+                "duplicates": self.duplicates,
+                "bytes": self.bytes,
+                "skipped": dict(self.skipped),
+                "error": self.error,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+            }
+
+    def start(self, total: int) -> None:
+        with self._lock:
+            self.status = "running"
+            self.total = total
+        self.flush(force=True)
+
+    def skip(self, reason: str) -> None:
+        with self._lock:
+            self.skipped[reason] = self.skipped.get(reason, 0) + 1
+            self.processed += 1
+        self.flush()
+
+    def add(self, status: str, size: int) -> None:
+        with self._lock:
+            self.processed += 1
+            if status == "duplicate":
+                self.duplicates += 1
+            else:
+                self.imported += 1
+                self.bytes += size
+                if status == "linked":
+                    self.linked += 1
+        self.flush()
+
+    def finish(self, error: str = "") -> None:
+        with self._lock:
+            self.status = "failed" if error else "done"
+            self.error = error
+            self.finished_at = time.time()
+        self.flush(force=True)
+
+    def flush(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._flushed_at < _FLUSH_INTERVAL_S:
+            return
+        self._flushed_at = now
+        data = self.snapshot()
+        data["owner_id"] = self.owner_id
+        try:
+            JOBS_DIR.mkdir(parents=True, exist_ok=True)
+            atomic_write_text(JOBS_DIR / f"{self.id}.json", json.dumps(data, ensure_ascii=False), fsync=False)
+        except OSError:
+            pass
+
+
+def create_job(owner_id: str, kind: str) -> ImportJob:
+    purge_finished()
+    job = ImportJob(id=secrets.token_urlsafe(12)[:_JOB_ID_LEN], owner_id=owner_id, kind=kind)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    job.flush(force=True)
+    return job
+
+
+def get_job(job_id: str, owner_id: str) -> dict[str, Any] | None:
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is not None:
+        return job.snapshot() if job.owner_id == owner_id else None
+    if not job_id or len(job_id) > 64 or not job_id.replace("-", "").replace("_", "").isalnum():
+        return None
+    try:
+        data = json.loads((JOBS_DIR / f"{job_id}.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.pop("owner_id", None) != owner_id:
+        return None
+    return data
+
+
+def purge_finished(now: float | None = None) -> None:
+    now = time.time() if now is None else now
+    with _jobs_lock:
+        for job_id in [k for k, job in _jobs.items() if job.finished_at and now - job.finished_at > _JOB_TTL_S]:
+            del _jobs[job_id]
+    try:
+        entries = list(os.scandir(JOBS_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if now - entry.stat().st_mtime > _JOB_TTL_S:
+                os.unlink(entry.path)
+        except OSError:
+            continue
@@ -0,0 +1,54 @@
+"""Locks that also hold across uvicorn worker processes.
+
+``threading.Lock`` only serializes threads of one worker; with ``--workers N``
+the same read-modify-write can run in N processes at once. ``FileLock`` adds
+an advisory ``flock`` on a lock file next to the protected data. On platforms
+without ``fcntl`` it degrades to the thread lock.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+
+class FileLock:
+    __slots__ = ("path", "_thread_lock", "_fd")
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+        self._thread_lock = threading.Lock()
+        self._fd: int | None = None
+
+    def __enter__(self) -> "FileLock":
+        self._thread_lock.acquire()
+        if fcntl is None:
+            return self
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except BaseException:
+                os.close(fd)
+                raise
+            self._fd = fd
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        fd, self._fd = self._fd, None
+        try:
+            if fd is not None and fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+        finally:
+            self._thread_lock.release()
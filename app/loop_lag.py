@@ -0,0 +1,73 @@
+"""Event-loop lag monitor.
+
+A background task sleeps for a fixed interval and records how late it wakes
+up. Anything that blocks the loop (sync I/O, Pillow work in an async handler)
+shows up as lag here, in /health, and as a warning in the log.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+
+from app.config import LOOP_LAG_INTERVAL_S, LOOP_LAG_WARN_MS
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    def __init__(self, interval_s: float = LOOP_LAG_INTERVAL_S, warn_ms: float = LOOP_LAG_WARN_MS, window: int = 120):
+        self.interval_s = interval_s
+        self.warn_ms = warn_ms
+        self._recent: deque[float] = deque(maxlen=window)
+        self._task: asyncio.Task | None = None
+        self.samples = 0
+        self.slow = 0
+        self.max_ms = 0.0
+        self.avg_ms = 0.0
+
+    def record(self, lag_ms: float) -> None:
+        self.samples += 1
+        self._recent.append(lag_ms)
+        self.max_ms = max(self.max_ms, lag_ms)
+        # EWMA, alpha 0.1
+        self.avg_ms = lag_ms if self.samples == 1 else self.avg_ms * 0.9 + lag_ms * 0.1
+        if lag_ms >= self.warn_ms:
+            self.slow += 1
+            logger.warning("event loop lagged %.0fms", lag_ms)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval_s)
+            self.record(max(0.0, (loop.time() - start - self.interval_s) * 1000))
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    def stats(self) -> dict:
+        recent = self._recent
+        return {
+            "last_ms": round(recent[-1], 1) if recent else 0.0,
+            "recent_max_ms": round(max(recent), 1) if recent else 0.0,
+            "avg_ms": round(self.avg_ms, 1),
+            "max_ms": round(self.max_ms, 1),
+            "slow": self.slow,
+            "samples": self.samples,
+        }
+
+
+monitor = LoopLagMonitor()
@@ -1,5 +1,6 @@
 import logging
 import mimetypes
+from contextlib import asynccontextmanager
 from .analytics_store import init_analytics_store
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
@@ -19,14 +20,21 @@ from app.routes import (
     auth,
     trash,
 )
+from app import loop_lag
 from app.config import BASE_PATH, FRONTEND_DIR
-from app.metadata_store import init_metadata_store
+from app.metadata_store import init_metadata_store, metadata_backend
+from app.storage import migrate_metadata_to_sqlite
 from app.users import init_user_store
 
 setup_logging()
 logger = logging.getLogger(__name__)
 init_user_store()
 init_metadata_store()
+if metadata_backend() == "sqlite":
+    try:
+        migrate_metadata_to_sqlite()
+    except Exception:
+        logger.exception("metadata migration failed")
 try:
     init_analytics_store()
 except Exception:
@@ -73,7 +81,16 @@ class StripBasePathMiddleware:
 mimetypes.add_type("image/webp", ".webp")
 mimetypes.add_type("image/avif", ".avif")
 
-app = FastAPI(title="photo-uploader-b", docs_url=None, redoc_url=None, openapi_url=None)
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    loop_lag.monitor.start()
+    try:
+        yield
+    finally:
+        await loop_lag.monitor.stop()
+
+
+app = FastAPI(title="photo-uploader-b", docs_url=None, redoc_url=None, openapi_url=None, lifespan=lifespan)
 
 if BASE_PATH:
     app.add_middleware(StripBasePathMiddleware, base_path=BASE_PATH)
@@ -8,6 +8,8 @@ from typing import Any
 from app.users import LEGACY_USER_ID, SYSTEM_DIR, slug_owner_key
 
 DB_PATH = (SYSTEM_DIR / "metadata.sqlite3").resolve()
+# Stored in PRAGMA user_version; raising it makes every dashboard recount once.
+SCHEMA_VERSION = 1
 
 
 def metadata_backend() -> str:
@@ -70,13 +72,98 @@ def init_metadata_store() -> None:
                 deleted_at TEXT NOT NULL,
                 meta_json TEXT NOT NULL DEFAULT '{}'
             );
+
+            CREATE TABLE IF NOT EXISTS content_hashes (
+                owner_id TEXT NOT NULL,
+                rel_path TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                inode INTEGER NOT NULL DEFAULT 0,
+                mtime_ns INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (owner_id, rel_path)
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_content_hashes_sha256
+                ON content_hashes(sha256);
+
+            CREATE TABLE IF NOT EXISTS token_summaries (
+                owner_id TEXT NOT NULL,
+                token TEXT NOT NULL,
+                image_count INTEGER NOT NULL DEFAULT 0,
+                title TEXT NOT NULL DEFAULT '',
+                latest_mtime REAL NOT NULL DEFAULT 0,
+                dir_mtime_ns INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (owner_id, token)
+            );
+
+            CREATE TABLE IF NOT EXISTS dashboard_summary (
+                owner_id TEXT PRIMARY KEY,
+                photo_count INTEGER NOT NULL DEFAULT 0,
+                album_count INTEGER NOT NULL DEFAULT 0,
+                total_visits INTEGER NOT NULL DEFAULT 0,
+                today_date TEXT NOT NULL DEFAULT '',
+                today_visits INTEGER NOT NULL DEFAULT 0,
+                version INTEGER NOT NULL DEFAULT 0,
+                dirty INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS dashboard_folders (
+                owner_id TEXT NOT NULL,
+                folder_path TEXT NOT NULL,
+                image_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (owner_id, folder_path)
+            );
+
+            CREATE TABLE IF NOT EXISTS dashboard_activity (
+                owner_id TEXT NOT NULL,
+                stats_key TEXT NOT NULL,
+                title TEXT,
+                views INTEGER NOT NULL DEFAULT 0,
+                last_visit TEXT NOT NULL DEFAULT '',
+                PRIMARY KEY (owner_id, stats_key)
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_dashboard_activity_recent
+                ON dashboard_activity(owner_id, last_visit DESC);
+
+            CREATE TABLE IF NOT EXISTS metadata_migrations (
+                owner_id TEXT PRIMARY KEY,
+                migrated_at TEXT NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS owner_generations (
+                owner_id TEXT PRIMARY KEY,
+                content_gen INTEGER NOT NULL DEFAULT 0,
+                visits_gen INTEGER NOT NULL DEFAULT 0
+            );
             """
         )
+        cols = {row[1] for row in conn.execute("PRAGMA table_info(content_hashes)").fetchall()}
+        if "inode" not in cols:
+            # rows from before the fingerprint columns keep 0 and are re-hashed on first use
+            _ = conn.execute("ALTER TABLE content_hashes ADD COLUMN inode INTEGER NOT NULL DEFAULT 0")
+            _ = conn.execute("ALTER TABLE content_hashes ADD COLUMN mtime_ns INTEGER NOT NULL DEFAULT 0")
+        if int(conn.execute("PRAGMA user_version").fetchone()[0]) < SCHEMA_VERSION:
+            # Summaries written by an older layout are recounted on their next read.
+            _ = conn.execute("UPDATE dashboard_summary SET dirty = 1")
+            _ = conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         conn.commit()
     finally:
         conn.close()
 
 
+def _parse_order(raw: str | None) -> list[str]:
+    try:
+        order = json.loads(raw or "[]")
+    except Exception:
+        order = []
+    if not isinstance(order, list):
+        return []
+    return [x for x in order if isinstance(x, str)]
+
+
 def load_manifest_record(owner_id: str, token: str) -> dict[str, Any] | None:
     conn = _connect()
     try:
@@ -86,13 +173,7 @@ def load_manifest_record(owner_id: str, token: str) -> dict[str, Any] | None:
         ).fetchone()
         if row is None:
             return None
-        try:
-            order = json.loads(row["order_json"] or "[]")
-        except Exception:
-            order = []
-        if not isinstance(order, list):
-            order = []
-        return {"title": str(row["title"] or ""), "order": [x for x in order if isinstance(x, str)]}
+        return {"title": str(row["title"] or ""), "order": _parse_order(row["order_json"])}
     finally:
         conn.close()
 
@@ -131,13 +212,35 @@ def load_folder_order_record(owner_id: str, folder_path: str) -> list[str] | Non
         ).fetchone()
         if row is None:
             return None
-        try:
-            order = json.loads(row["order_json"] or "[]")
-        except Exception:
-            order = []
-        if not isinstance(order, list):
-            order = []
-        return [x for x in order if isinstance(x, str)]
+        return _parse_order(row["order_json"])
+    finally:
+        conn.close()
+
+
+def _subtree_pattern(path: str) -> str:
+    """LIKE pattern (ESCAPE '\\') for everything strictly below path."""
+    return path.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "/%"
+
+
+def load_folder_orders_under(owner_id: str, folder_path: str) -> dict[str, list[str]]:
+    """Every folder order at or below folder_path ("." is the owner's root), in one query."""
+    conn = _connect()
+    try:
+        if folder_path in ("", "."):
+            rows = conn.execute(
+                "SELECT folder_path, order_json FROM folder_orders WHERE owner_id = ?",
+                (owner_id,),
+            ).fetchall()
+        else:
+            pattern = _subtree_pattern(folder_path)
+            rows = conn.execute(
+                """
+                SELECT folder_path, order_json FROM folder_orders
+                WHERE owner_id = ? AND (folder_path = ? OR folder_path LIKE ? ESCAPE '\\')
+                """,
+                (owner_id, folder_path, pattern),
+            ).fetchall()
+        return {str(row["folder_path"]): _parse_order(row["order_json"]) for row in rows}
     finally:
         conn.close()
 
@@ -160,6 +263,417 @@ def save_folder_order_record(owner_id: str, folder_path: str, order: list[str])
         conn.close()
 
 
+def move_metadata_subtree(owner_id: str, old_path: str, new_path: str | None, *, copy: bool = False) -> None:
+    """Re-key the metadata of folder old_path and everything below it to new_path, in one transaction.
+
+    Rows already under new_path (left by an earlier folder of that name) are
+    replaced. new_path=None drops the subtree; copy=True leaves old_path's rows
+    in place. Token summaries are only dropped: they are rebuilt from disk.
+    """
+    old_args = (owner_id, old_path, _subtree_pattern(old_path))
+    new_args = (owner_id, new_path, _subtree_pattern(new_path)) if new_path is not None else None
+    now = _utc_now()
+    conn = _connect()
+    try:
+        with conn:
+            for table, col, values in (
+                ("token_manifests", "token", "title, order_json"),
+                ("folder_orders", "folder_path", "order_json"),
+                ("token_summaries", "token", None),
+            ):
+                where = f"owner_id = ? AND ({col} = ? OR {col} LIKE ? ESCAPE '\\')"
+                if new_args is not None:
+                    conn.execute(f"DELETE FROM {table} WHERE {where}", new_args)
+                if copy:
+                    if new_path is not None and values is not None:
+                        conn.execute(
+                            f"""
+                            INSERT INTO {table} (owner_id, {col}, {values}, updated_at)
+                            SELECT owner_id, ? || substr({col}, ?), {values}, ? FROM {table} WHERE {where}
+                            """,
+                            (new_path, len(old_path) + 1, now, *old_args),
+                        )
+                elif new_path is None or values is None:
+                    conn.execute(f"DELETE FROM {table} WHERE {where}", old_args)
+                else:
+                    conn.execute(
+                        f"UPDATE {table} SET {col} = ? || substr({col}, ?), updated_at = ? WHERE {where}",
+                        (new_path, len(old_path) + 1, now, *old_args),
+                    )
+    finally:
+        conn.close()
+
+
+def is_metadata_migrated(owner_id: str) -> bool:
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT 1 FROM metadata_migrations WHERE owner_id = ?", (owner_id,)).fetchone()
+        return row is not None
+    finally:
+        conn.close()
+
+
+def bulk_import_metadata(
+    owner_id: str,
+    manifests: dict[str, dict[str, Any]],
+    folder_orders: dict[str, list[str]],
+) -> None:
+    """Import file-based metadata in one transaction; rows already in SQLite win."""
+    now = _utc_now()
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany(
+                """
+                INSERT OR IGNORE INTO token_manifests (owner_id, token, title, order_json, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        owner_id,
+                        token,
+                        str(data.get("title") or ""),
+                        json.dumps(data.get("order") or [], ensure_ascii=False),
+                        now,
+                    )
+                    for token, data in manifests.items()
+                ],
+            )
+            conn.executemany(
+                """
+                INSERT OR IGNORE INTO folder_orders (owner_id, folder_path, order_json, updated_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                [
+                    (owner_id, folder_path, json.dumps(order, ensure_ascii=False), now)
+                    for folder_path, order in folder_orders.items()
+                ],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO metadata_migrations (owner_id, migrated_at) VALUES (?, ?)",
+                (owner_id, now),
+            )
+    finally:
+        conn.close()
+
+
+def load_token_summaries(owner_id: str) -> dict[str, dict[str, Any]]:
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            """
+            SELECT token, image_count, title, latest_mtime, dir_mtime_ns
+            FROM token_summaries WHERE owner_id = ?
+            """,
+            (owner_id,),
+        ).fetchall()
+        return {str(row["token"]): dict(row) for row in rows}
+    finally:
+        conn.close()
+
+
+def save_token_summaries(owner_id: str, summaries: list[dict[str, Any]]) -> None:
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany(
+                """
+                INSERT INTO token_summaries (owner_id, token, image_count, title, latest_mtime, dir_mtime_ns)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(owner_id, token) DO UPDATE SET
+                    image_count = excluded.image_count,
+                    title = excluded.title,
+                    latest_mtime = excluded.latest_mtime,
+                    dir_mtime_ns = excluded.dir_mtime_ns
+                """,
+                [
+                    (
+                        owner_id,
+                        item["token"],
+                        int(item["image_count"]),
+                        str(item["title"] or ""),
+                        float(item["latest_mtime"]),
+                        int(item["dir_mtime_ns"]),
+                    )
+                    for item in summaries
+                ],
+            )
+    finally:
+        conn.close()
+
+
+def forget_token_summaries(owner_id: str | None = None, tokens: list[str] | None = None) -> None:
+    """Drop cached summaries: the given tokens of owner_id, all of owner_id, or everyone's."""
+    conn = _connect()
+    try:
+        with conn:
+            if owner_id is None:
+                conn.execute("DELETE FROM token_summaries")
+            elif tokens is None:
+                conn.execute("DELETE FROM token_summaries WHERE owner_id = ?", (owner_id,))
+            else:
+                conn.executemany(
+                    "DELETE FROM token_summaries WHERE owner_id = ? AND token = ?",
+                    [(owner_id, token) for token in tokens],
+                )
+    finally:
+        conn.close()
+
+
+def load_dashboard(owner_id: str, limit: int) -> dict[str, Any] | None:
+    """The materialized dashboard, or None when it has to be rebuilt first."""
+    conn = _connect()
+    try:
+        row = conn.execute(
+            """
+            SELECT photo_count, album_count, total_visits, today_date, today_visits, version
+            FROM dashboard_summary WHERE owner_id = ? AND dirty = 0
+            """,
+            (owner_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        activities = conn.execute(
+            """
+            SELECT stats_key, title, views, last_visit FROM dashboard_activity
+            WHERE owner_id = ? AND last_visit <> ''
+            ORDER BY last_visit DESC LIMIT ?
+            """,
+            (owner_id, limit),
+        ).fetchall()
+        return {**dict(row), "activities": [dict(a) for a in activities]}
+    finally:
+        conn.close()
+
+
+def replace_dashboard(
+    owner_id: str,
+    *,
+    folders: dict[str, int],
+    total_visits: int,
+    today_date: str,
+    today_visits: int,
+    activities: list[dict[str, Any]],
+) -> None:
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("DELETE FROM dashboard_folders WHERE owner_id = ?", (owner_id,))
+            conn.executemany(
+                "INSERT INTO dashboard_folders (owner_id, folder_path, image_count) VALUES (?, ?, ?)",
+                [(owner_id, path, count) for path, count in folders.items()],
+            )
+            titles = {
+                str(row["stats_key"]): row["title"]
+                for row in conn.execute(
+                    "SELECT stats_key, title FROM dashboard_activity WHERE owner_id = ?", (owner_id,)
+                )
+            }
+            conn.execute("DELETE FROM dashboard_activity WHERE owner_id = ?", (owner_id,))
+            conn.executemany(
+                """
+                INSERT INTO dashboard_activity (owner_id, stats_key, title, views, last_visit)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [
+                    (owner_id, a["stats_key"], titles.get(a["stats_key"]), int(a["views"]), a["last_visit"])
+                    for a in activities
+                ],
+            )
+            conn.execute(
+                """
+                INSERT INTO dashboard_summary (
+                    owner_id, photo_count, album_count, total_visits, today_date, today_visits,
+                    version, dirty, updated_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, 1, 0, ?)
+                ON CONFLICT(owner_id) DO UPDATE SET
+                    photo_count = excluded.photo_count,
+                    album_count = excluded.album_count,
+                    total_visits = excluded.total_visits,
+                    today_date = excluded.today_date,
+                    today_visits = excluded.today_visits,
+                    version = dashboard_summary.version + 1,
+                    dirty = 0,
+                    updated_at = excluded.updated_at
+                """,
+                (
+                    owner_id,
+                    sum(folders.values()),
+                    sum(1 for count in folders.values() if count > 0),
+                    total_visits,
+                    today_date,
+                    today_visits,
+                    _utc_now(),
+                ),
+            )
+    finally:
+        conn.close()
+
+
+def set_dashboard_folder_count(owner_id: str, folder_path: str, image_count: int) -> None:
+    """Record a folder's current image count and apply the difference to the summary.
+
+    A no-op while the summary is missing or dirty: the rebuild counts everything.
+    """
+    conn = _connect()
+    try:
+        with conn:
+            live = conn.execute(
+                "SELECT 1 FROM dashboard_summary WHERE owner_id = ? AND dirty = 0", (owner_id,)
+            ).fetchone()
+            if live is None:
+                return
+            row = conn.execute(
+                "SELECT image_count FROM dashboard_folders WHERE owner_id = ? AND folder_path = ?",
+                (owner_id, folder_path),
+            ).fetchone()
+            old = int(row["image_count"]) if row is not None else 0
+            if row is not None and old == image_count:
+                return
+            conn.execute(
+                """
+                INSERT INTO dashboard_folders (owner_id, folder_path, image_count) VALUES (?, ?, ?)
+                ON CONFLICT(owner_id, folder_path) DO UPDATE SET image_count = excluded.image_count
+                """,
+                (owner_id, folder_path, image_count),
+            )
+            conn.execute(
+                """
+                UPDATE dashboard_summary SET
+                    photo_count = photo_count + ?,
+                    album_count = album_count + ?,
+                    version = version + 1,
+                    updated_at = ?
+                WHERE owner_id = ?
+                """,
+                (image_count - old, int(image_count > 0) - int(old > 0), _utc_now(), owner_id),
+            )
+    finally:
+        conn.close()
+
+
+def record_dashboard_visits(visits: list[tuple[str, str, str, str]]) -> None:
+    """Apply a batch of (owner_id, stats_key, visited_at, today_date) visits in one transaction.
+
+    Every owner in the batch gets one visits-generation bump. Summaries that
+    are missing or dirty are left alone: the rebuild counts everything.
+    """
+    days: dict[tuple[str, str], int] = {}
+    activity: dict[tuple[str, str], list[Any]] = {}
+    for owner_id, stats_key, visited_at, today_date in visits:
+        days[(owner_id, today_date)] = days.get((owner_id, today_date), 0) + 1
+        entry = activity.setdefault((owner_id, stats_key), [0, ""])
+        entry[0] += 1
+        entry[1] = max(entry[1], visited_at)
+    conn = _connect()
+    try:
+        with conn:
+            live: set[str] = set()
+            now = _utc_now()
+            # Batches arrive in visit order, so a batch spanning midnight
+            # applies yesterday's count before today's resets it.
+            for (owner_id, today_date), count in days.items():
+                cur = conn.execute(
+                    """
+                    UPDATE dashboard_summary SET
+                        total_visits = total_visits + ?,
+                        today_visits = CASE WHEN today_date = ? THEN today_visits + ? ELSE ? END,
+                        today_date = ?,
+                        version = version + 1,
+                        updated_at = ?
+                    WHERE owner_id = ? AND dirty = 0
+                    """,
+                    (count, today_date, count, count, today_date, now, owner_id),
+                )
+                if cur.rowcount:
+                    live.add(owner_id)
+            conn.executemany(
+                """
+                INSERT INTO dashboard_activity (owner_id, stats_key, views, last_visit) VALUES (?, ?, ?, ?)
+                ON CONFLICT(owner_id, stats_key) DO UPDATE SET
+                    views = dashboard_activity.views + excluded.views,
+                    last_visit = MAX(dashboard_activity.last_visit, excluded.last_visit)
+                """,
+                [(owner_id, key, views, last) for (owner_id, key), (views, last) in activity.items() if owner_id in live],
+            )
+            conn.executemany(
+                """
+                INSERT INTO owner_generations (owner_id, visits_gen) VALUES (?, 1)
+                ON CONFLICT(owner_id) DO UPDATE SET visits_gen = visits_gen + 1
+                """,
+                [(owner_id,) for owner_id in {owner_id for owner_id, _day in days}],
+            )
+    finally:
+        conn.close()
+
+
+def set_dashboard_titles(owner_id: str, titles: dict[str, str]) -> None:
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany(
+                "UPDATE dashboard_activity SET title = ? WHERE owner_id = ? AND stats_key = ?",
+                [(title, owner_id, key) for key, title in titles.items()],
+            )
+    finally:
+        conn.close()
+
+
+def forget_dashboard_titles(owner_id: str | None = None) -> None:
+    conn = _connect()
+    try:
+        with conn:
+            if owner_id is None:
+                conn.execute("UPDATE dashboard_activity SET title = NULL")
+                conn.execute("UPDATE dashboard_summary SET version = version + 1")
+            else:
+                conn.execute("UPDATE dashboard_activity SET title = NULL WHERE owner_id = ?", (owner_id,))
+                conn.execute("UPDATE dashboard_summary SET version = version + 1 WHERE owner_id = ?", (owner_id,))
+    finally:
+        conn.close()
+
+
+def mark_dashboard_dirty(owner_id: str) -> None:
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("UPDATE dashboard_summary SET dirty = 1 WHERE owner_id = ?", (owner_id,))
+    finally:
+        conn.close()
+
+
+def load_owner_generation(owner_id: str) -> tuple[int, int]:
+    """(content, visits) generation of owner_id; both start at 0."""
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT content_gen, visits_gen FROM owner_generations WHERE owner_id = ?",
+            (owner_id,),
+        ).fetchone()
+        if row is None:
+            return 0, 0
+        return int(row["content_gen"]), int(row["visits_gen"])
+    finally:
+        conn.close()
+
+
+def bump_owner_generation(owner_id: str, *, visits: bool = False) -> None:
+    column = "visits_gen" if visits else "content_gen"
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                f"""
+                INSERT INTO owner_generations (owner_id, {column}) VALUES (?, 1)
+                ON CONFLICT(owner_id) DO UPDATE SET {column} = {column} + 1
+                """,
+                (owner_id,),
+            )
+    finally:
+        conn.close()
+
+
 def load_slugs_snapshot() -> dict[str, Any]:
     conn = _connect()
     try:
@@ -209,6 +723,74 @@ def save_slugs_snapshot(data: dict[str, Any]) -> None:
         conn.close()
 
 
+def record_content_hash(
+    owner_id: str, rel_path: str, sha256: str, size: int, *, inode: int = 0, mtime_ns: int = 0
+) -> None:
+    conn = _connect()
+    try:
+        _ = conn.execute(
+            """
+            INSERT INTO content_hashes (owner_id, rel_path, sha256, size, inode, mtime_ns, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(owner_id, rel_path) DO UPDATE SET
+                sha256 = excluded.sha256,
+                size = excluded.size,
+                inode = excluded.inode,
+                mtime_ns = excluded.mtime_ns,
+                created_at = excluded.created_at
+            """,
+            (owner_id, rel_path, sha256, int(size), int(inode), int(mtime_ns), _utc_now()),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def find_content_hashes(owner_id: str, sha256: str) -> list[dict[str, Any]]:
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            """
+            SELECT rel_path, size, inode, mtime_ns FROM content_hashes
+            WHERE owner_id = ? AND sha256 = ? ORDER BY created_at ASC
+            """,
+            (owner_id, sha256),
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(row) for row in rows]
+
+
+def forget_content_hash(owner_id: str, rel_path: str) -> None:
+    conn = _connect()
+    try:
+        _ = conn.execute(
+            "DELETE FROM content_hashes WHERE owner_id = ? AND rel_path = ?",
+            (owner_id, rel_path),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def move_content_hashes(owner_id: str, old_rel: str, new_rel: str | None) -> None:
+    """Re-key the hash row of a file, or the rows of every file below a folder; None drops them."""
+    where = "owner_id = ? AND (rel_path = ? OR rel_path LIKE ? ESCAPE '\\')"
+    conn = _connect()
+    try:
+        with conn:
+            if new_rel is None:
+                conn.execute(f"DELETE FROM content_hashes WHERE {where}", (owner_id, old_rel, _subtree_pattern(old_rel)))
+                return
+            conn.execute(f"DELETE FROM content_hashes WHERE {where}", (owner_id, new_rel, _subtree_pattern(new_rel)))
+            conn.execute(
+                f"UPDATE content_hashes SET rel_path = ? || substr(rel_path, ?) WHERE {where}",
+                (new_rel, len(old_rel) + 1, owner_id, old_rel, _subtree_pattern(old_rel)),
+            )
+    finally:
+        conn.close()
+
+
 def create_trash_entry(
     owner_id: str,
     *,
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Header
 
 from app.auth import auth_header_key
-from app.storage import get_analytics
+from app.storage import get_analytics, get_cross_visit_page
 
 router = APIRouter(prefix="/api/analytics", tags=["analytics"])
 
@@ -9,7 +9,18 @@ router = APIRouter(prefix="/api/analytics", tags=["analytics"])
 @router.get("")
 def api_analytics(
     include_local: bool = False,
+    cross_limit: int = 200,
     x_upload_key: str | None = Header(default=None),
 ):
     auth_header_key(x_upload_key)
-    return get_analytics(limit=1000, include_local=include_local)
+    return get_analytics(limit=1000, include_local=include_local, cross_limit=cross_limit)
+
+
+@router.get("/cross-visit")
+def api_analytics_cross_visit(
+    limit: int = 50,
+    offset: int = 0,
+    x_upload_key: str | None = Header(default=None),
+):
+    auth_header_key(x_upload_key)
+    return {"ok": True, **get_cross_visit_page(limit=limit, offset=offset)}
@@ -1,15 +1,19 @@
 import shutil
 from pathlib import Path
 from typing import NoReturn
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, HTTPException, Header, Request, Response
 from pydantic import BaseModel
 from app.auth import safe_name, safe_path, resolve_dir, auth_header_key, auth_query_key
+from app.conditional import not_modified
 from app.storage import (
     build_tree,
+    bump_generation,
     copy_file_between_folders,
     copy_folder,
+    generation_etag,
     list_images_by_path,
     move_file_to_trash,
+    move_folder_metadata,
     move_file_between_folders,
     move_folder_to_trash,
     ordered_child_dirs,
@@ -103,15 +107,21 @@ def _raise_storage_error(error: Exception) -> NoReturn:
 
 
 @router.get("/tree")
-def api_folder_tree(key: str):
+def api_folder_tree(request: Request, response: Response, key: str):
     auth_query_key(key)
+    cached = not_modified(request, response, generation_etag())
+    if cached is not None:
+        return cached
     return {"ok": True, "tree": build_tree()}
 
 
 @router.get("/list")
-def api_folder_list(path: str, key: str):
+def api_folder_list(request: Request, response: Response, path: str, key: str):
     auth_query_key(key)
     path = safe_path(path)
+    cached = not_modified(request, response, generation_etag())
+    if cached is not None:
+        return cached
     d = resolve_dir(path)
     if not d.exists():
         raise HTTPException(status_code=404, detail="folder not found")
@@ -148,6 +158,7 @@ def api_folder_create(
     path = safe_path(payload.path)
     d = resolve_dir(path)
     d.mkdir(parents=True, exist_ok=True)
+    bump_generation()
     return {"ok": True, "path": path}
 
 
@@ -219,6 +230,7 @@ def api_folder_move(
     try:
         old_parent_dir = src_dir.parent
         shutil.move(str(src_dir), str(target_dir))
+        move_folder_metadata(src_dir, target_dir)
         remove_subfolder_from_order(old_parent_dir, src_dir.name)
         reorder_subfolder(dest_dir, target_dir.name, before_name=(before_dir.name if before_dir else None))
         rename_slug_paths(src_path, new_path)
@@ -282,6 +294,7 @@ def api_folder_rename(
 
     try:
         shutil.move(str(src_dir), str(target_dir))
+        move_folder_metadata(src_dir, target_dir)
         rename_subfolder_in_order(target_dir.parent, src_dir.name, target_dir.name)
         rename_slug_paths(src_path, new_path)
     except Exception as e:
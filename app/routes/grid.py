@@ -1,16 +1,17 @@
+import asyncio
 import io
+import threading
 import zipfile
 import re
 from pathlib import Path
 from typing import Optional
 
-from fastapi import APIRouter, File, UploadFile, HTTPException, Header, Form
+from fastapi import APIRouter, File, UploadFile, HTTPException, Header, Form, Request
 from fastapi.responses import Response
 
 from app.auth import auth_header_key, safe_path, resolve_dir, sniff_image_type
 from app.config import MAX_BYTES, MAX_MB
-from app.grid_processor import process_nine_grid, generate_grid_preview
-from app.storage import append_in_order
+from app.storage import append_many_in_order
 
 router = APIRouter(prefix="/api/grid", tags=["grid"])
 
@@ -88,9 +89,181 @@ def _normalize_output_format(value: str) -> str:
     return "JPEG"
 
 
+def _open_upload_image(file: UploadFile):
+    """从上传的临时文件懒打开图片，只读文件头，不把整个文件读进内存也不解码"""
+    from PIL import Image, UnidentifiedImageError
+    from PIL.Image import DecompressionBombError
+
+    size = file.size
+    if size is None:
+        file.file.seek(0, io.SEEK_END)
+        size = file.file.tell()
+    if size > MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"文件太大（最大 {MAX_MB}MB）")
+    file.file.seek(0)
+    try:
+        return Image.open(file.file)
+    except (UnidentifiedImageError, DecompressionBombError, OSError) as e:
+        raise HTTPException(status_code=400, detail=f"无效的图片文件: {str(e)}")
+
+
+def _load_image(img) -> None:
+    from PIL.Image import DecompressionBombError
+
+    try:
+        img.load()
+    except (DecompressionBombError, OSError) as e:
+        raise HTTPException(status_code=400, detail=f"无效的图片文件: {str(e)}")
+
+
+_DISCONNECT_POLL_S = 0.25
+
+
+def _run_budgeted(estimated_bytes: int, job, cancel: threading.Event):
+    """在九宫格线程池里占用内存预算后执行任务：永远装不下返回 413，排队超时返回 503"""
+    from app.grid_processor import GRID_BUDGET_WAIT_S, GridBudgetExceeded, GridBusy, GridCancelled, memory_budget
+
+    try:
+        with memory_budget.reserve(estimated_bytes, timeout=GRID_BUDGET_WAIT_S, cancel=cancel):
+            if cancel.is_set():
+                raise GridCancelled()
+            return job(cancel.is_set)
+    except GridBudgetExceeded:
+        raise HTTPException(status_code=413, detail="图片尺寸超出九宫格处理内存预算")
+    except GridBusy:
+        raise HTTPException(status_code=503, detail="九宫格处理繁忙，请稍后重试", headers={"Retry-After": "5"})
+
+
+async def _run_grid_job(request: Request, estimated_bytes: int, job):
+    """把任务交给专用线程池，等待期间轮询客户端连接；断开后通知任务尽快放弃
+
+    job 接收一个 should_cancel() 回调，在各阶段之间检查。
+    """
+    from app.grid_processor import GridBusy, GridCancelled, submit_job
+
+    cancel = threading.Event()
+    try:
+        future = submit_job(_run_budgeted, estimated_bytes, job, cancel)
+    except GridBusy:
+        raise HTTPException(status_code=503, detail="九宫格处理繁忙，请稍后重试", headers={"Retry-After": "5"})
+    waiter = asyncio.wrap_future(future)
+    # 提前返回时任务可能仍在收尾，这里取走结果避免未检索异常的告警
+    waiter.add_done_callback(lambda f: f.cancelled() or f.exception())
+    try:
+        while not waiter.done():
+            await asyncio.wait({waiter}, timeout=_DISCONNECT_POLL_S)
+            if not waiter.done() and await request.is_disconnected():
+                cancel.set()
+                future.cancel()
+                raise HTTPException(status_code=499, detail="客户端已断开")
+        return waiter.result()
+    except GridCancelled:
+        raise HTTPException(status_code=499, detail="客户端已断开")
+    except asyncio.CancelledError:
+        cancel.set()
+        future.cancel()
+        raise
+
+
+async def _open_grid_source(file: UploadFile | None, session_id: str, owner_id: str, *, sniff: bool = False):
+    """返回 (懒打开的原图, 原始文件名)：带 session_id 时用会话里保存的原图，否则用本次上传"""
+    if session_id:
+        from app import grid_sessions
+
+        img = grid_sessions.open_source(session_id, owner_id)
+        if img is None:
+            raise HTTPException(status_code=404, detail="九宫格会话不存在或已过期")
+        return img, grid_sessions.session_filename(session_id, owner_id)
+    if file is None:
+        raise HTTPException(status_code=400, detail="缺少图片文件或会话 id")
+    if sniff:
+        head = await file.read(64)
+        if sniff_image_type(head) is None:
+            raise HTTPException(status_code=400, detail="只支持图片文件")
+    return _open_upload_image(file), file.filename or ""
+
+
+def _session_build_estimate(img) -> int:
+    from app.grid_processor import GRID_PREVIEW_MAX_PX, estimate_job_bytes, preview_decode_size
+
+    return estimate_job_bytes(
+        preview_decode_size(img.size, img.format), (GRID_PREVIEW_MAX_PX, GRID_PREVIEW_MAX_PX), "PNG", with_tiles=False
+    )
+
+
+async def _get_grid_session(request: Request, session_id: str, owner_id: str):
+    """优先命中本进程 LRU；未命中（被淘汰或由其它 worker 创建）时从落盘原图重建工作副本"""
+    from app import grid_sessions
+
+    session = grid_sessions.get_session(session_id, owner_id)
+    if session is not None:
+        return session
+    img = grid_sessions.open_source(session_id, owner_id)
+    if img is None:
+        raise HTTPException(status_code=404, detail="九宫格会话不存在或已过期")
+
+    def job(should_cancel):
+        try:
+            return grid_sessions.build_session(session_id, owner_id, img)
+        except OSError as e:
+            raise HTTPException(status_code=400, detail=f"无效的图片文件: {str(e)}")
+
+    try:
+        return await _run_grid_job(request, _session_build_estimate(img), job)
+    finally:
+        img.close()
+
+
+@router.post("/session")
+async def grid_session_create(
+    request: Request,
+    file: UploadFile = File(...),
+    x_upload_key: str | None = Header(default=None),
+):
+    user = auth_header_key(x_upload_key)
+    img, filename = await _open_grid_source(file, "", user["id"], sniff=True)
+    _validate_grid_params(0, 0, img.width, img.height)
+
+    from app import grid_sessions
+
+    def job(should_cancel):
+        session_id = grid_sessions.store_upload(file.file, user["id"], filename)
+        try:
+            return grid_sessions.build_session(session_id, user["id"], img)
+        except OSError as e:
+            grid_sessions.drop_session(session_id, user["id"])
+            raise HTTPException(status_code=400, detail=f"无效的图片文件: {str(e)}")
+
+    try:
+        session = await _run_grid_job(request, _session_build_estimate(img), job)
+    finally:
+        img.close()
+    return {
+        "ok": True,
+        "session_id": session.id,
+        "width": session.width,
+        "height": session.height,
+        "preview_width": session.working.width,
+        "preview_height": session.working.height,
+        "expires_in": grid_sessions.GRID_SESSION_TTL_S,
+    }
+
+
+@router.delete("/session/{session_id}")
+async def grid_session_delete(session_id: str, x_upload_key: str | None = Header(default=None)):
+    user = auth_header_key(x_upload_key)
+    from app import grid_sessions
+
+    if not grid_sessions.drop_session(session_id, user["id"]):
+        raise HTTPException(status_code=404, detail="九宫格会话不存在或已过期")
+    return {"ok": True}
+
+
 @router.post("/preview")
 async def grid_preview(
-    file: UploadFile = File(...),
+    request: Request,
+    file: UploadFile | None = File(default=None),
+    session_id: str = Form(default=""),
     line_width: int = Form(default=2),
     gap: int = Form(default=0),
     padding: int = Form(default=0),
@@ -98,22 +271,20 @@ async def grid_preview(
     bg_color: str = Form(default="#ffffff"),
     output_format: str = Form(default="JPEG"),
     transparent_bg: bool = Form(default=False),
+    max_size: int = Form(default=0),
     x_upload_key: str | None = Header(default=None),
 ):
-    auth_header_key(x_upload_key)
-    content = await file.read()
-    if len(content) > MAX_BYTES:
-        raise HTTPException(status_code=413, detail=f"文件太大（最大 {MAX_MB}MB）")
-
-    from PIL import Image, UnidentifiedImageError
-    from PIL.Image import DecompressionBombError
-
-    try:
-        img = Image.open(io.BytesIO(content))
-        _ = img.load()
-        _validate_grid_params(line_width, gap, img.width, img.height, padding)
-    except (UnidentifiedImageError, DecompressionBombError, OSError) as e:
-        raise HTTPException(status_code=400, detail=f"无效的图片文件: {str(e)}")
+    user = auth_header_key(x_upload_key)
+
+    from app.grid_processor import (
+        GRID_PREVIEW_MAX_PX,
+        estimate_job_bytes,
+        fit_preview_source,
+        generate_grid_preview,
+        output_size,
+        preview_decode_size,
+        scale_grid_params,
+    )
 
     fmt = _normalize_output_format(output_format)
     ext: str = "png" if fmt == "PNG" else "jpg"
@@ -122,20 +293,63 @@ async def grid_preview(
     lc = _require_hex_color(line_color, field="线色")
     bc = _require_hex_color(bg_color, field="背景色")
     pd = max(0, min(200, int(padding)))
-
-    preview_bytes = generate_grid_preview(
-        source_image=img,
-        line_width=line_width,
-        gap=gap,
-        padding=pd,
-        line_color=lc,
-        bg_color=(bc[0], bc[1], bc[2]),
-        output_format=fmt,
-        transparent_bg=transparent_bg,
-        quality=95,
-    )
-
-    safe_name = _safe_filename(file.filename or "preview")
+    # 预览只按显示分辨率渲染
+    max_px = max(256, min(GRID_PREVIEW_MAX_PX, int(max_size) or GRID_PREVIEW_MAX_PX))
+
+    def render(source, scale: float) -> bytes:
+        lw, gp, p = scale_grid_params(scale, line_width, gap, pd)
+        return generate_grid_preview(
+            source_image=source,
+            line_width=lw,
+            gap=gp,
+            padding=p,
+            line_color=lc,
+            bg_color=(bc[0], bc[1], bc[2]),
+            output_format=fmt,
+            transparent_bg=transparent_bg,
+            quality=95,
+        )
+
+    if session_id:
+        from PIL import Image
+
+        session = await _get_grid_session(request, session_id, user["id"])
+        _validate_grid_params(line_width, gap, session.width, session.height, padding)
+        filename = session.filename
+        working = session.working
+        fit = min(1.0, max_px / max(working.width, working.height))
+        shown = (max(1, round(working.width * fit)), max(1, round(working.height * fit)))
+        estimate = estimate_job_bytes(working.size, output_size(*shown, line_width, gap, pd), fmt, with_tiles=False)
+
+        def session_job(should_cancel) -> bytes:
+            # 会话工作副本是共享只读的，更小的 max_size 另行缩放
+            source = working if fit >= 1.0 else working.resize(shown, Image.Resampling.LANCZOS, reducing_gap=2.0)
+            return render(source, session.scale * source.width / working.width)
+
+        preview_bytes = await _run_grid_job(request, estimate, session_job)
+    else:
+        img, filename = await _open_grid_source(file, "", user["id"])
+        _validate_grid_params(line_width, gap, img.width, img.height, padding)
+        decode_w, decode_h = preview_decode_size(img.size, img.format, max_px)
+        fit = min(1.0, max_px / max(img.width, img.height))
+        shown = (max(1, round(img.width * fit)), max(1, round(img.height * fit)))
+        estimate = estimate_job_bytes(
+            (decode_w, decode_h), output_size(*shown, line_width, gap, pd), fmt, with_tiles=False
+        )
+
+        def upload_job(should_cancel) -> bytes:
+            try:
+                scale = fit_preview_source(img, max_px)
+            except OSError as e:
+                raise HTTPException(status_code=400, detail=f"无效的图片文件: {str(e)}")
+            return render(img, scale)
+
+        try:
+            preview_bytes = await _run_grid_job(request, estimate, upload_job)
+        finally:
+            img.close()
+
+    safe_name = _safe_filename(filename or "preview")
     ext = "png" if fmt == "PNG" else "jpg"
     media_type = "image/png" if fmt == "PNG" else "image/jpeg"
     return Response(
@@ -147,7 +361,9 @@ async def grid_preview(
 
 @router.post("/split")
 async def grid_split(
-    file: UploadFile = File(...),
+    request: Request,
+    file: UploadFile | None = File(default=None),
+    session_id: str = Form(default=""),
     line_width: int = Form(default=2),
     gap: int = Form(default=0),
     padding: int = Form(default=0),
@@ -157,20 +373,11 @@ async def grid_split(
     transparent_bg: bool = Form(default=False),
     x_upload_key: str | None = Header(default=None),
 ):
-    auth_header_key(x_upload_key)
-    content = await file.read()
-    if len(content) > MAX_BYTES:
-        raise HTTPException(status_code=413, detail=f"文件太大（最大 {MAX_MB}MB)")
-
-    from PIL import Image, UnidentifiedImageError
-    from PIL.Image import DecompressionBombError
+    user = auth_header_key(x_upload_key)
+    img, filename = await _open_grid_source(file, session_id, user["id"])
+    _validate_grid_params(line_width, gap, img.width, img.height, padding)
 
-    try:
-        img = Image.open(io.BytesIO(content))
-        _ = img.load()
-        _validate_grid_params(line_width, gap, img.width, img.height, padding)
-    except (UnidentifiedImageError, DecompressionBombError, OSError) as e:
-        raise HTTPException(status_code=400, detail=f"无效的图片文件: {str(e)}")
+    from app.grid_processor import estimate_job_bytes, output_size, process_nine_grid
 
     fmt = _normalize_output_format(output_format)
     ext = "png" if fmt == "PNG" else "jpg"
@@ -180,20 +387,30 @@ async def grid_split(
     bc = _require_hex_color(bg_color, field="背景色")
     pd = max(0, min(200, int(padding)))
 
-    preview_bytes, tile_bytes_list = process_nine_grid(
-        source_image=img,
-        draw_grid=True,
-        line_width=line_width,
-        gap=gap,
-        padding=pd,
-        line_color=lc,
-        bg_color=(bc[0], bc[1], bc[2]),
-        transparent_bg=transparent_bg,
-        output_format=fmt,
-        quality=95,
-    )
+    estimate = estimate_job_bytes(img.size, output_size(img.width, img.height, line_width, gap, pd), fmt)
+
+    def job(should_cancel) -> tuple[bytes, list[bytes]]:
+        _load_image(img)
+        return process_nine_grid(
+            source_image=img,
+            draw_grid=True,
+            line_width=line_width,
+            gap=gap,
+            padding=pd,
+            line_color=lc,
+            bg_color=(bc[0], bc[1], bc[2]),
+            transparent_bg=transparent_bg,
+            output_format=fmt,
+            quality=95,
+            should_cancel=should_cancel,
+        )
+
+    try:
+        preview_bytes, tile_bytes_list = await _run_grid_job(request, estimate, job)
+    finally:
+        img.close()
 
-    safe_stem = _safe_filename(file.filename or "image")
+    safe_stem = _safe_filename(filename or "image")
     zip_buffer = io.BytesIO()
     with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
         ext = "png" if fmt == "PNG" else "jpg"
@@ -210,7 +427,9 @@ async def grid_split(
 
 @router.post("/save")
 async def grid_save(
-    file: UploadFile = File(...),
+    request: Request,
+    file: UploadFile | None = File(default=None),
+    session_id: str = Form(default=""),
     destination: str = Form(default="九宫格"),
     folder_name: Optional[str] = Form(default=None),
     line_width: int = Form(default=2),
@@ -222,25 +441,11 @@ async def grid_save(
     transparent_bg: bool = Form(default=False),
     x_upload_key: str | None = Header(default=None),
 ):
-    auth_header_key(x_upload_key)
-    head = await file.read(64)
-    if sniff_image_type(head) is None:
-        raise HTTPException(status_code=400, detail="只支持图片文件")
-
-    remaining = await file.read()
-    full_bytes = head + remaining
-    if len(full_bytes) > MAX_BYTES:
-        raise HTTPException(status_code=413, detail=f"文件太大（最大 {MAX_MB}MB）")
+    user = auth_header_key(x_upload_key)
+    img, filename = await _open_grid_source(file, session_id, user["id"], sniff=True)
+    _validate_grid_params(line_width, gap, img.width, img.height, padding)
 
-    from PIL import Image, UnidentifiedImageError
-    from PIL.Image import DecompressionBombError
-
-    try:
-        img = Image.open(io.BytesIO(full_bytes))
-        _ = img.load()
-        _validate_grid_params(line_width, gap, img.width, img.height, padding)
-    except (UnidentifiedImageError, DecompressionBombError, OSError) as e:
-        raise HTTPException(status_code=400, detail=f"无效的图片文件: {str(e)}")
+    from app.grid_processor import estimate_job_bytes, output_size, process_nine_grid
 
     fmt = _normalize_output_format(output_format)
     ext = "png" if fmt == "PNG" else "jpg"
@@ -250,37 +455,50 @@ async def grid_save(
     bc = _require_hex_color(bg_color, field="背景色")
     pd = max(0, min(200, int(padding)))
 
-    preview_bytes, tile_bytes_list = process_nine_grid(
-        source_image=img,
-        draw_grid=True,
-        line_width=line_width,
-        gap=gap,
-        padding=pd,
-        line_color=lc,
-        bg_color=(bc[0], bc[1], bc[2]),
-        transparent_bg=transparent_bg,
-        output_format=fmt,
-        quality=95,
-    )
+    estimate = estimate_job_bytes(img.size, output_size(img.width, img.height, line_width, gap, pd), fmt)
+
+    def job(should_cancel) -> tuple[bytes, list[bytes]]:
+        _load_image(img)
+        return process_nine_grid(
+            source_image=img,
+            draw_grid=True,
+            line_width=line_width,
+            gap=gap,
+            padding=pd,
+            line_color=lc,
+            bg_color=(bc[0], bc[1], bc[2]),
+            transparent_bg=transparent_bg,
+            output_format=fmt,
+            quality=95,
+            should_cancel=should_cancel,
+        )
+
+    try:
+        preview_bytes, tile_bytes_list = await _run_grid_job(request, estimate, job)
+    finally:
+        img.close()
 
     safe_dest = safe_path(destination)
-    safe_stem = _safe_filename(file.filename or "image")
+    safe_stem = _safe_filename(filename or "image")
     safe_folder = _safe_folder_name(folder_name or safe_stem)
     target_path = f"{safe_dest}/{safe_folder}" if safe_dest else safe_folder
     target_dir = resolve_dir(target_path)
     target_dir.mkdir(parents=True, exist_ok=True)
 
-    saved_files: list[str] = []
-    for i, tile_bytes in enumerate(tile_bytes_list, 1):
-        filename = f"{safe_stem}_{i}.{ext}"
-        _ = (target_dir / filename).write_bytes(tile_bytes)
-        saved_files.append(filename)
-        append_in_order(target_path, filename)
-
-    preview_name = f"{safe_stem}_preview.{ext}"
-    _ = (target_dir / preview_name).write_bytes(preview_bytes)
-    saved_files.insert(0, preview_name)
-    append_in_order(target_path, preview_name)
+    def write_files() -> list[str]:
+        names: list[str] = []
+        for i, tile_bytes in enumerate(tile_bytes_list, 1):
+            name = f"{safe_stem}_{i}.{ext}"
+            _ = (target_dir / name).write_bytes(tile_bytes)
+            names.append(name)
+        preview_name = f"{safe_stem}_preview.{ext}"
+        _ = (target_dir / preview_name).write_bytes(preview_bytes)
+        names.append(preview_name)
+        append_many_in_order(target_path, names)
+        return names
+
+    written = await asyncio.to_thread(write_files)
+    saved_files = [written[-1], *written[:-1]]
 
     return {
         "ok": True,
@@ -2,6 +2,7 @@
 import os
 from pathlib import Path
 from fastapi import APIRouter
+from app import geoip, loop_lag
 from app.config import APP_VERSION, APP_BUILD_TIME
 
 router = APIRouter()
@@ -23,4 +24,11 @@ def health():
         checks["storage"] = f"error: {e}"
         return {"status": "unhealthy", "checks": checks}
 
-    return {"status": "ok", "checks": checks, "version": APP_VERSION, "buildTime": APP_BUILD_TIME}
+    return {
+        "status": "ok",
+        "checks": checks,
+        "version": APP_VERSION,
+        "buildTime": APP_BUILD_TIME,
+        "geoip_cache": geoip.cache_stats(),
+        "event_loop": loop_lag.monitor.stats(),
+    }
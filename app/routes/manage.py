@@ -5,7 +5,7 @@ import zipfile
 from pathlib import Path
 from urllib.parse import quote
 
-from fastapi import APIRouter, HTTPException, Header, Response
+from fastapi import APIRouter, HTTPException, Header, Request, Response
 from fastapi.responses import FileResponse
 from app.auth import safe_token, safe_name, safe_path, auth_query_key, auth_header_key, token_dir, resolve_dir, SAFE_NAME_RE
 from app.models import (
@@ -18,9 +18,13 @@ from app.models import (
     OrderPayload,
     TokenMetaPayload,
 )
+from app.conditional import not_modified
 from app.storage import (
+    generation_etag,
+    invalidate_dashboard,
     list_images,
     get_token_title,
+    move_file_hash,
     set_token_title,
     update_order,
     move_file_to_trash,
@@ -62,9 +66,12 @@ def _dedupe_export_name(name: str, used: set[str]) -> str:
 
 
 @router.get("/{token}")
-def api_manage_list(token: str, key: str):
+def api_manage_list(request: Request, response: Response, token: str, key: str):
     auth_query_key(key)
     token = safe_token(token)
+    cached = not_modified(request, response, generation_etag())
+    if cached is not None:
+        return cached
     return {
         "ok": True,
         "token": token,
@@ -122,6 +129,7 @@ def api_manage_rename(
         raise HTTPException(status_code=409, detail="target filename exists")
     remove_variants_for_source(src)
     src.rename(dst)
+    move_file_hash(src, dst)
     rename_in_order(token, old_name, dst.name)
     return {"ok": True, "old": old_name, "new": dst.name}
 
@@ -221,8 +229,12 @@ def api_manage_batch_move(
         except Exception as e:
             skipped.append({"name": name, "reason": str(e)})
             continue
+        move_file_hash(src, dst)
         remove_in_order(token, name)
         moved.append({"src": name, "dst": final_name})
+    if moved:
+        # the destination never goes through append_in_order
+        invalidate_dashboard()
     return {"ok": True, "moved": moved, "count": len(moved), "skipped": skipped, "dest": dest_path}
 
 
@@ -273,10 +285,12 @@ def api_manage_batch_rename(
             )
         ).resolve()
         src.rename(tmp)
+        move_file_hash(src, tmp)
         temp_map[old] = tmp
     for old in selected:
         dst = (d / mapping[old]).resolve()
         temp_map[old].rename(dst)
+        move_file_hash(temp_map[old], dst)
         remove_variants_for_source(d / old)
         rename_in_order(token, old, mapping[old])
     return {"ok": True, "renamed": [{"old": k, "new": v} for k, v in mapping.items()]}
@@ -1,6 +1,5 @@
 import json
 import os
-import ipaddress
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
@@ -22,8 +21,10 @@ from app.config import (
     APP_VERSION,
     APP_BUILD_TIME,
     ASSET_VERSION,
+    RATE_LIMIT_BACKEND,
 )
-from app.security import SlidingWindowRateLimiter
+from app.security import IPAddress, IPRangeMatcher, SlidingWindowRateLimiter, SQLiteRateLimiter, parse_ip_address
+from app.users import SYSTEM_DIR
 
 router = APIRouter(tags=["pages"])
 templates = Jinja2Templates(directory=str(FRONTEND_DIR))
@@ -53,47 +54,33 @@ def _record_visit_compat(request: Request, token: str, *, album_key: str = "") -
         pass
 
 
-# Rate limiter for 404 on /d/{token} — reuses SlidingWindowRateLimiter (has max_keys + cleanup)
-_d_404_limiter = SlidingWindowRateLimiter(limit=30, window_s=60.0)
+# Rate limiter for 404 on /d/{token}. With several workers the SQLite backend
+# keeps one shared window per IP instead of one per process.
+if RATE_LIMIT_BACKEND == "sqlite":
+    _d_404_limiter = SQLiteRateLimiter(SYSTEM_DIR / "ratelimit.sqlite3", "d404", limit=30, window_s=60.0)
+else:
+    _d_404_limiter = SlidingWindowRateLimiter(limit=30, window_s=60.0)
 
 # Trusted proxy handling: default to loopback only (covers Nginx/Caddy on same machine).
 # Override via TRUSTED_PROXY_NETS env var, e.g. "127.0.0.1/32,::1/128,172.17.0.0/16".
-_TRUSTED_PROXY_NETS: list[ipaddress.IPv4Network | ipaddress.IPv6Network] = []
-_trusted_proxy_env = os.environ.get("TRUSTED_PROXY_NETS", "127.0.0.1/32,::1/128")
-for _net in _trusted_proxy_env.split(","):
-    _net = _net.strip()
-    if not _net:
-        continue
-    try:
-        _TRUSTED_PROXY_NETS.append(ipaddress.ip_network(_net, strict=False))
-    except ValueError:
-        continue
+_TRUSTED_PROXIES = IPRangeMatcher.from_csv(os.environ.get("TRUSTED_PROXY_NETS", "127.0.0.1/32,::1/128"))
 
 
-def _is_trusted_proxy(host: str) -> bool:
-    try:
-        ip = ipaddress.ip_address(host)
-    except ValueError:
-        return False
-    return any(ip in net for net in _TRUSTED_PROXY_NETS)
+def _is_trusted_proxy(host: str | IPAddress) -> bool:
+    return _TRUSTED_PROXIES.contains(host)
 
 
 def _parse_ip(value: str) -> str | None:
-    value = (value or "").strip()
-    if not value:
-        return None
-    try:
-        return str(ipaddress.ip_address(value))
-    except ValueError:
-        return None
+    addr = parse_ip_address(value)
+    return str(addr) if addr is not None else None
 
 
 def _client_ip(request: Request) -> str:
     peer = request.client.host if request.client else ""
-    if not _TRUSTED_PROXY_NETS:
+    if not _TRUSTED_PROXIES:
         return peer or "unknown"
-    peer_ip = _parse_ip(peer)
-    if peer_ip and _is_trusted_proxy(peer_ip):
+    peer_addr = parse_ip_address(peer)
+    if peer_addr is not None and _TRUSTED_PROXIES.contains(peer_addr):
         cf_ip = _parse_ip(request.headers.get("cf-connecting-ip") or "")
         if cf_ip:
             return cf_ip
@@ -102,16 +89,15 @@ def _client_ip(request: Request) -> str:
             return eo_ip
         xff = request.headers.get("x-forwarded-for") or ""
         if xff:
-            chain: list[str] = []
+            chain: list[IPAddress] = []
             for part in xff.split(","):
-                ip = _parse_ip(part)
-                if ip:
-                    chain.append(ip)
+                addr = parse_ip_address(part)
+                if addr is not None:
+                    chain.append(addr)
+            while chain and _TRUSTED_PROXIES.contains(chain[-1]):
+                _ = chain.pop()
             if chain:
-                while chain and _is_trusted_proxy(chain[-1]):
-                    _ = chain.pop()
-                if chain:
-                    return chain[-1]
+                return str(chain[-1])
         x_real_ip = _parse_ip(request.headers.get("x-real-ip") or "")
         if x_real_ip:
             return x_real_ip
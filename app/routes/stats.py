@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Header
+from fastapi import APIRouter, Header, Request, Response
 from app.auth import auth_header_key
-from app.storage import build_tree, get_all_stats, get_daily_views, infer_token_title
+from app.conditional import not_modified
+from app.storage import generation_etag, get_all_stats, get_daily_views, get_dashboard_summary
 
 router = APIRouter(prefix="/api/stats", tags=["stats"])
 
@@ -18,91 +19,60 @@ def _looks_technical_title(value: str) -> bool:
     return False
 
 
-def _readable_title(token: str) -> str:
-    title = str(infer_token_title(token) or token).strip()
+def _readable_title(token: str, title: str | None) -> str:
+    title = str(title or token).strip()
     if _looks_technical_title(title):
         return "未命名画廊"
     return title
 
 
-def _tree_metrics() -> tuple[int, int]:
-    photo_count = 0
-    album_count = 0
-
-    def as_int(value: object) -> int:
-        if isinstance(value, bool):
-            return int(value)
-        if isinstance(value, int):
-            return value
-        if isinstance(value, float):
-            return int(value)
-        if isinstance(value, str):
-            try:
-                return int(value or "0")
-            except Exception:
-                return 0
-        return 0
-
-    def walk(nodes: list[dict[str, object]]):
-        nonlocal photo_count, album_count
-        for node in nodes or []:
-            image_count = as_int(node.get("image_count", 0))
-            photo_count += image_count
-            if image_count > 0:
-                album_count += 1
-            children = node.get("children")
-            if isinstance(children, list):
-                walk(children)
-
-    walk(build_tree())
-    return photo_count, album_count
 @router.get("")
-def api_stats(key: str | None = None, x_upload_key: str | None = Header(default=None)):
+def api_stats(
+    request: Request, response: Response, key: str | None = None, x_upload_key: str | None = Header(default=None)
+):
     auth_header_key(x_upload_key or key)
+    cached = not_modified(request, response, generation_etag(content=False, visits=True))
+    if cached is not None:
+        return cached
     return get_all_stats()
 
 
 @router.get("/dashboard")
-def api_dashboard(key: str | None = None, x_upload_key: str | None = Header(default=None)):
-    """返回 Dashboard 页面需要的所有统计数据"""
+def api_dashboard(
+    request: Request, response: Response, key: str | None = None, x_upload_key: str | None = Header(default=None)
+):
+    """返回 Dashboard 页面需要的所有统计数据（物化汇总，支持 ETag）"""
     auth_header_key(x_upload_key or key)
-
-    stats = get_all_stats()
-    total_photos, album_count = _tree_metrics()
-
-    daily_views = get_daily_views(days=7)
-    today_visits = int(daily_views[-1]["views"]) if daily_views else 0
-    total_visits = 0
-    for _sk, entry in stats.items():
-        if isinstance(entry, dict):
-            total_visits += int(entry.get("views", 0) or 0)
-
-    activities = []
-    for sk, entry in stats.items():
-        if isinstance(entry, dict) and "last_visit" in entry:
-            token = str(sk or "")
-            title = _readable_title(token)
-            activities.append(
-                {
-                    "name": token,
-                    "title": title,
-                    "views": int(entry.get("views", 0) or 0),
-                    "last_visit": str(entry.get("last_visit", "") or ""),
-                }
-            )
-    activities.sort(key=lambda x: x["last_visit"], reverse=True)
-
+    cached = not_modified(request, response, generation_etag(visits=True, daily=True))
+    if cached is not None:
+        return cached
+
+    data = get_dashboard_summary(limit=10)
+    activities = [
+        {
+            "name": str(a["stats_key"] or ""),
+            "title": _readable_title(str(a["stats_key"] or ""), a["title"]),
+            "views": int(a["views"] or 0),
+            "last_visit": str(a["last_visit"] or ""),
+        }
+        for a in data.get("activities", [])
+    ]
     return {
         "ok": True,
-        "photo_count": total_photos,
-        "album_count": album_count,
-        "total_visits": total_visits,
-        "today_visits": today_visits,
-        "recent_activities": activities[:10],
+        "photo_count": int(data.get("photo_count", 0)),
+        "album_count": int(data.get("album_count", 0)),
+        "total_visits": int(data.get("total_visits", 0)),
+        "today_visits": int(data.get("today_visits", 0)),
+        "recent_activities": activities,
     }
 
 
 @router.get("/daily")
-def api_daily_stats(key: str | None = None, x_upload_key: str | None = Header(default=None)):
+def api_daily_stats(
+    request: Request, response: Response, key: str | None = None, x_upload_key: str | None = Header(default=None)
+):
     auth_header_key(x_upload_key or key)
+    cached = not_modified(request, response, generation_etag(content=False, visits=True, daily=True))
+    if cached is not None:
+        return cached
     return {"ok": True, "days": get_daily_views(days=7)}
@@ -4,7 +4,9 @@ from fastapi import APIRouter, HTTPException, Header
 from app.auth import safe_token, auth_query_key, auth_header_key, token_dir
 from app.models import CreateTokenPayload, RemoveTokenPayload
 from app.storage import (
+    invalidate_dashboard,
     list_tokens_with_counts,
+    move_folder_metadata,
     list_images,
     save_manifest,
     ARCHIVE_DIRNAME,
@@ -48,6 +50,8 @@ def api_tokens_remove(
         raise HTTPException(status_code=400, detail="mode must be archive or delete")
     if mode == "delete":
         shutil.rmtree(d)
+        move_folder_metadata(d, None)
+        invalidate_dashboard()
         return {"ok": True, "mode": "delete", "token": token}
     arc_root = (BASE_DIR / ARCHIVE_DIRNAME).resolve()
     arc_root.mkdir(parents=True, exist_ok=True)
@@ -56,4 +60,6 @@ def api_tokens_remove(
     if not target.is_relative_to(arc_root):
         raise HTTPException(status_code=400, detail="invalid archive target")
     shutil.move(str(d), str(target))
+    move_folder_metadata(d, target)
+    invalidate_dashboard()
     return {"ok": True, "mode": "archive", "token": token, "archivedTo": target.name}
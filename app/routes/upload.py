@@ -1,18 +1,25 @@
 import asyncio
+import contextvars
 import hashlib
 import logging
 import os
+import re
+import secrets
+import shutil
 import threading
 import time
 import zipfile
 import tempfile
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
-from fastapi import APIRouter, File, UploadFile, HTTPException, Header, Form
+from typing import BinaryIO
+from fastapi import APIRouter, File, UploadFile, HTTPException, Header, Form, Query, Request
 from fastapi.responses import JSONResponse
 from app.auth import safe_token, safe_path, auth_header_key, token_dir, resolve_dir, sniff_image_type
+from app import upload_sessions
 from app.image_variants import ensure_all_variants_best_effort
-from app.storage import append_in_order, ALLOWED_SUFFIX
+from app.import_jobs import ImportJob, create_job, get_job
+from app.storage import append_in_order, place_stored_file, ALLOWED_SUFFIX
 from app.config import MAX_BYTES, MAX_MB
 
 router = APIRouter(prefix="/api/upload", tags=["upload"])
@@ -22,19 +29,53 @@ _VARIANT_WORKERS = max(1, int(os.environ.get("VARIANT_WORKERS", "2")))
 _VARIANT_QUEUE_SIZE = max(1, int(os.environ.get("VARIANT_QUEUE_SIZE", "512")))
 _IMPORT_MAX_FILES = max(1, int(os.environ.get("IMPORT_MAX_FILES", "500")))
 _IMPORT_MAX_TOTAL_BYTES = max(MAX_BYTES, int(os.environ.get("IMPORT_MAX_TOTAL_BYTES", str(MAX_BYTES * 200))))
+_IMPORT_JOB_WORKERS = max(1, int(os.environ.get("IMPORT_JOB_WORKERS", "2")))
+_IMPORT_EXTRACT_WORKERS = max(1, int(os.environ.get("IMPORT_EXTRACT_WORKERS", "4")))
+# ZIP imports at least this large run as a background job unless the client
+# asks for background=false; the UI always asks for background=true.
+_ZIP_BACKGROUND_BYTES = max(0, int(os.environ.get("ZIP_IMPORT_BACKGROUND_MB", "32"))) * 1024 * 1024
+# Uploads up to _HANDOFF_MAX_BYTES keep their bytes in memory so the variant
+# jobs can pipe them to ffmpeg instead of reading the file back; the total held
+# by queued jobs is capped by _HANDOFF_BUDGET_BYTES.
+_HANDOFF_MAX_BYTES = max(0, int(os.environ.get("VARIANT_HANDOFF_MB", "16"))) * 1024 * 1024
+_HANDOFF_BUDGET_BYTES = max(0, int(os.environ.get("VARIANT_HANDOFF_BUDGET_MB", "128"))) * 1024 * 1024
 _variant_pool = ThreadPoolExecutor(max_workers=_VARIANT_WORKERS, thread_name_prefix="variant")
 _variant_queue_slots = threading.BoundedSemaphore(_VARIANT_QUEUE_SIZE)
+_import_job_pool = ThreadPoolExecutor(max_workers=_IMPORT_JOB_WORKERS, thread_name_prefix="import-job")
+_extract_pool = ThreadPoolExecutor(max_workers=_IMPORT_EXTRACT_WORKERS, thread_name_prefix="import-extract")
+_handoff_lock = threading.Lock()
+_handoff_bytes = 0
 
 
-def _queue_variant(path: Path) -> None:
+def _reserve_handoff(size: int) -> bool:
+    global _handoff_bytes
+    with _handoff_lock:
+        if _handoff_bytes + size > _HANDOFF_BUDGET_BYTES:
+            return False
+        _handoff_bytes += size
+        return True
+
+
+def _release_handoff(size: int) -> None:
+    global _handoff_bytes
+    with _handoff_lock:
+        _handoff_bytes -= size
+
+
+def _queue_variant(path: Path, data: bytes | None = None) -> None:
     if not _variant_queue_slots.acquire(blocking=False):
         logger.warning("variant queue full, skip generation: %s", path)
         return
+    held = len(data) if data is not None and _reserve_handoff(len(data)) else 0
+    if not held:
+        data = None
 
     def _run(target: Path) -> None:
         try:
-            ensure_all_variants_best_effort(target)
+            ensure_all_variants_best_effort(target, data)
         finally:
+            if held:
+                _release_handoff(held)
             _variant_queue_slots.release()
 
     _variant_pool.submit(_run, path)
@@ -84,119 +125,157 @@ def _resolve_target_dir(destination: str, rel_dir: str | None) -> Path:
     return resolve_dir(safe_combined)
 
 
-@router.post("/zip-import")
-async def api_zip_import(
-    file: UploadFile = File(...),
-    destination: str | None = Form(default=None),
-    folder_name: str | None = Form(default=None),
-    x_upload_key: str | None = Header(default=None),
-):
-    auth_header_key(x_upload_key)
-    if not file.filename or not file.filename.lower().endswith(".zip"):
-        raise HTTPException(status_code=400, detail="only .zip files allowed")
+_ZIP_NO_IMAGES = "no valid images found in zip (need jpg/jpeg/png/gif/webp inside folders)"
+
 
+def _spool_to_temp(src: BinaryIO) -> Path:
     with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as tmp:
-        tmp_path = Path(tmp.name)
-        while True:
-            chunk = await file.read(4 * 1024 * 1024)
-            if not chunk:
-                break
-            tmp.write(chunk)
+        shutil.copyfileobj(src, tmp, 4 * 1024 * 1024)
+    return Path(tmp.name)
+
+
+def _extract_zip_entry(zf: zipfile.ZipFile, info: zipfile.ZipInfo, target_file: Path, job: ImportJob) -> None:
+    # ZipFile serialises the raw reads internally; decompression, hashing and
+    # writing run in parallel across the extract pool.
+    with zf.open(info) as src:
+        head = src.read(64)
+        if sniff_image_type(head) is None:
+            job.skip("type")
+            return
+        result = _import_file(src, head, target_file, MAX_BYTES)
+    if result is None:
+        job.skip("oversize")
+        return
+    stored, status, size, _data = result
+    job.add(status, size)
+    if status != "duplicate":
+        _queue_variant(stored)
 
-    target_destination = _safe_destination(destination)
-    target_folder_name = _safe_folder_name(folder_name)
 
+def _run_zip_import(
+    job: ImportJob, zip_path: Path, filename: str, target_destination: str, target_folder_name: str | None
+) -> dict:
     try:
-        imported = 0
-        imported_total_bytes = 0
-        imported_files: list[Path] = []
-        skipped_hidden = 0
-        skipped_ext = 0
-        skipped_root = 0
-        skipped_path = 0
-        skipped_oversize = 0
         try:
-            with zipfile.ZipFile(tmp_path, "r") as zf:
-                for info in zf.infolist():
-                    if imported >= _IMPORT_MAX_FILES:
-                        break
-                    if info.is_dir():
-                        continue
+            with zipfile.ZipFile(zip_path, "r") as zf:
+                infos = [info for info in zf.infolist() if not info.is_dir()]
+                job.start(len(infos))
+                target_roots: dict[str, Path] = {}
+                reserved_bytes = 0
+                futures = []
+                for info in infos:
                     name = info.filename.replace("\\", "/").strip()
                     if not name:
-                        skipped_path += 1
+                        job.skip("path")
                         continue
                     if name.startswith("__MACOSX") or "/." in name or name.startswith("."):
-                        skipped_hidden += 1
+                        job.skip("hidden")
+                        continue
+                    if Path(name).suffix.lower() not in ALLOWED_SUFFIX:
+                        job.skip("ext")
                         continue
-                    ext = Path(name).suffix.lower()
-                    if ext not in ALLOWED_SUFFIX:
-                        skipped_ext += 1
+                    if len(futures) >= _IMPORT_MAX_FILES:
+                        job.skip("limit")
                         continue
-                    if imported_total_bytes + max(0, int(info.file_size)) > _IMPORT_MAX_TOTAL_BYTES:
-                        skipped_oversize += 1
+                    # Budget by declared size: ZipExtFile never yields more than file_size.
+                    size = max(0, int(info.file_size))
+                    if size > MAX_BYTES or reserved_bytes + size > _IMPORT_MAX_TOTAL_BYTES:
+                        job.skip("oversize")
                         continue
                     rel_dir = str(Path(name).parent).replace("\\", "/")
                     rewritten_rel_dir = _rewrite_rel_dir(rel_dir if rel_dir != "." else "", target_folder_name)
                     if not rewritten_rel_dir:
-                        skipped_root += 1
+                        job.skip("root")
                         continue
-                    target_dir = _resolve_target_dir(target_destination, rewritten_rel_dir)
-                    target_root = target_dir.resolve()
-                    target_root.mkdir(parents=True, exist_ok=True)
+                    target_root = target_roots.get(rewritten_rel_dir)
+                    if target_root is None:
+                        try:
+                            target_root = _resolve_target_dir(target_destination, rewritten_rel_dir).resolve()
+                        except HTTPException:
+                            job.skip("path")
+                            continue
+                        target_root.mkdir(parents=True, exist_ok=True)
+                        target_roots[rewritten_rel_dir] = target_root
                     target_file = (target_root / Path(name).name).resolve()
                     if not target_file.is_relative_to(target_root):
-                        skipped_path += 1
+                        job.skip("path")
                         continue
-                    size = 0
-                    with zf.open(info) as src, target_file.open("wb") as dst:
-                        while True:
-                            chunk = src.read(1024 * 1024)
-                            if not chunk:
-                                break
-                            size += len(chunk)
-                            if size > MAX_BYTES:
-                                dst.close()
-                                target_file.unlink(missing_ok=True)
-                                skipped_oversize += 1
-                                break
-                            dst.write(chunk)
-                    if size <= MAX_BYTES:
-                        imported += 1
-                        imported_total_bytes += size
-                        imported_files.append(target_file)
+                    reserved_bytes += size
+                    ctx = contextvars.copy_context()
+                    futures.append(_extract_pool.submit(ctx.run, _extract_zip_entry, zf, info, target_file, job))
+                # let every entry finish before the archive is closed
+                wait(futures)
+                for f in futures:
+                    f.result()
         except zipfile.BadZipFile as e:
-            logger.warning("zip import failed: invalid zip '%s'", file.filename)
-            raise HTTPException(status_code=400, detail="invalid zip file") from e
-
-        if imported == 0:
-            logger.warning(
-                "zip import produced 0 files: file=%s hidden=%s ext=%s root=%s path=%s oversize=%s",
-                file.filename,
-                skipped_hidden,
-                skipped_ext,
-                skipped_root,
-                skipped_path,
-                skipped_oversize,
-            )
-            raise HTTPException(
-                status_code=400,
-                detail="no valid images found in zip (need jpg/jpeg/png/gif/webp inside folders)",
-            )
+            logger.warning("zip import failed: invalid zip '%s'", filename)
+            raise ValueError("invalid zip file") from e
+
+        snap = job.snapshot()
+        if snap["imported"] == 0 and snap["duplicates"] == 0:
+            logger.warning("zip import produced 0 files: file=%s skipped=%s", filename, snap["skipped"])
+            raise ValueError(_ZIP_NO_IMAGES)
         logger.info(
-            "zip import success: file=%s imported=%s hidden=%s ext=%s root=%s path=%s oversize=%s",
-            file.filename,
-            imported,
-            skipped_hidden,
-            skipped_ext,
-            skipped_root,
-            skipped_path,
-            skipped_oversize,
+            "zip import success: file=%s imported=%s linked=%s duplicates=%s skipped=%s",
+            filename,
+            snap["imported"],
+            snap["linked"],
+            snap["duplicates"],
+            snap["skipped"],
         )
-        _generate_variants_async(imported_files)
-        return {"ok": True, "imported": imported}
+        job.finish()
+        return {"ok": True, "imported": snap["imported"], "linked": snap["linked"], "duplicates": snap["duplicates"]}
+    except ValueError as e:
+        job.finish(str(e))
+        raise
+    except BaseException:
+        job.finish("import failed")
+        raise
     finally:
-        tmp_path.unlink(missing_ok=True)
+        zip_path.unlink(missing_ok=True)
+
+
+@router.post("/zip-import")
+async def api_zip_import(
+    file: UploadFile = File(...),
+    destination: str | None = Form(default=None),
+    folder_name: str | None = Form(default=None),
+    background: bool | None = Form(default=None),
+    x_upload_key: str | None = Header(default=None),
+):
+    user = auth_header_key(x_upload_key)
+    if not file.filename or not file.filename.lower().endswith(".zip"):
+        raise HTTPException(status_code=400, detail="only .zip files allowed")
+
+    target_destination = _safe_destination(destination)
+    target_folder_name = _safe_folder_name(folder_name)
+    tmp_path = await asyncio.to_thread(_spool_to_temp, file.file)
+    if background is None:
+        background = tmp_path.stat().st_size >= _ZIP_BACKGROUND_BYTES
+
+    job = create_job(user["id"], "zip")
+    ctx = contextvars.copy_context()
+    future = _import_job_pool.submit(
+        ctx.run, _run_zip_import, job, tmp_path, file.filename, target_destination, target_folder_name
+    )
+    if background:
+        return JSONResponse(
+            {"ok": True, "job_id": job.id, "status": "queued", "status_url": f"/api/upload/jobs/{job.id}"},
+            status_code=202,
+        )
+    try:
+        return await asyncio.wrap_future(future)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+@router.get("/jobs/{job_id}")
+async def api_import_job(job_id: str, x_upload_key: str | None = Header(default=None)):
+    user = auth_header_key(x_upload_key)
+    snap = get_job(job_id, user["id"])
+    if snap is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return {"ok": True, **snap}
 
 
 @router.post("/folder-import")
@@ -224,6 +303,8 @@ async def api_folder_import(
     skipped_root = 0
     skipped_type = 0
     skipped_oversize = 0
+    duplicates = 0
+    linked = 0
 
     for uploaded, raw_path in zip(files, paths):
         normalized = raw_path.replace("\\", "/").strip().lstrip("/")
@@ -267,28 +348,21 @@ async def api_folder_import(
             skipped_invalid += 1
             continue
 
-        total = len(head)
-        accepted = True
-        with target.open("wb") as out:
-            out.write(head)
-            while True:
-                chunk = await uploaded.read(1024 * 1024)
-                if not chunk:
-                    break
-                total += len(chunk)
-                if total > MAX_BYTES or imported_total_bytes + total > _IMPORT_MAX_TOTAL_BYTES:
-                    out.close()
-                    target.unlink(missing_ok=True)
-                    skipped_oversize += 1
-                    accepted = False
-                    break
-                out.write(chunk)
-        if accepted and total <= MAX_BYTES:
-            imported += 1
-            imported_total_bytes += total
-            imported_files.append(target)
+        limit = min(MAX_BYTES, _IMPORT_MAX_TOTAL_BYTES - imported_total_bytes)
+        result = await asyncio.to_thread(_import_file, uploaded.file, head, target, limit)
+        if result is None:
+            skipped_oversize += 1
+            continue
+        stored, status, size, _data = result
+        if status == "duplicate":
+            duplicates += 1
+            continue
+        linked += status == "linked"
+        imported += 1
+        imported_total_bytes += size
+        imported_files.append(stored)
 
-    if imported == 0:
+    if imported == 0 and duplicates == 0:
         logger.warning(
             "folder import produced 0 files: invalid=%s hidden=%s root=%s type=%s oversize=%s",
             skipped_invalid,
@@ -303,8 +377,10 @@ async def api_folder_import(
         )
 
     logger.info(
-        "folder import success: imported=%s invalid=%s hidden=%s root=%s type=%s oversize=%s",
+        "folder import success: imported=%s linked=%s duplicates=%s invalid=%s hidden=%s root=%s type=%s oversize=%s",
         imported,
+        linked,
+        duplicates,
         skipped_invalid,
         skipped_hidden,
         skipped_root,
@@ -312,7 +388,269 @@ async def api_folder_import(
         skipped_oversize,
     )
     _generate_variants_async(imported_files)
-    return {"ok": True, "imported": imported}
+    return {"ok": True, "imported": imported, "linked": linked, "duplicates": duplicates}
+
+
+def _write_hashed(src: BinaryIO, head: bytes, target_dir: Path, limit: int) -> tuple[Path, str, int, bytes | None] | None:
+    """Copy head + the rest of src into a hidden temp file in target_dir, hashing on the way.
+
+    Runs in a worker thread. Returns (tmp, sha256, size, data), where data
+    holds the bytes for the variant handoff when the file is small enough,
+    or None (with the partial file removed) once the content exceeds limit.
+    """
+    digest = hashlib.sha256(head)
+    kept: list[bytes] | None = [head] if len(head) <= _HANDOFF_MAX_BYTES else None
+    total = len(head)
+    tmp = target_dir / f".upload-{secrets.token_hex(8)}.part"
+    try:
+        with tmp.open("wb") as out:
+            out.write(head)
+            while True:
+                chunk = src.read(1024 * 1024)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > limit:
+                    out.close()
+                    tmp.unlink(missing_ok=True)
+                    return None
+                digest.update(chunk)
+                out.write(chunk)
+                if kept is not None:
+                    if total <= _HANDOFF_MAX_BYTES:
+                        kept.append(chunk)
+                    else:
+                        kept = None
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return tmp, digest.hexdigest(), total, b"".join(kept) if kept is not None else None
+
+
+def _import_file(src: BinaryIO, head: bytes, target: Path, limit: int) -> tuple[Path, str, int, bytes | None] | None:
+    """Write one imported file to target (deduplicated); None when it is over limit."""
+    written = _write_hashed(src, head, target.parent, limit)
+    if written is None:
+        return None
+    tmp, sha256, size, data = written
+    try:
+        path, status = place_stored_file(tmp, target, sha256, size)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return path, status, size, data
+
+
+def _save_upload(token: str, src: BinaryIO, head: bytes, ext: str) -> tuple[Path, str, bytes | None]:
+    d = token_dir(token)
+    d.mkdir(parents=True, exist_ok=True)
+    written = _write_hashed(src, head, d, MAX_BYTES)
+    if written is None:
+        raise HTTPException(status_code=413, detail=f"file too large (max {MAX_MB}MB)")
+    tmp, sha256, size, data = written
+    try:
+        out, status = place_stored_file(tmp, d / f"{int(time.time())}_{sha256[:16]}{ext}", sha256, size)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    if out.parent == d.resolve():
+        append_in_order(token, out.name)
+    return out, status, data
+
+
+def _session_status(meta: dict) -> dict:
+    received = meta.get("received") or []
+    missing = upload_sessions.missing_ranges(received, int(meta["size"]))
+    return {
+        "ok": True,
+        "session_id": meta["id"],
+        "kind": meta["kind"],
+        "size": meta["size"],
+        "received": received,
+        "missing": missing,
+        "complete": not missing,
+        "chunk_max": upload_sessions.CHUNK_MAX_BYTES,
+    }
+
+
+def _load_upload_session(owner_id: str, session_id: str) -> dict:
+    meta = upload_sessions.load_session(owner_id, session_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="upload session not found")
+    return meta
+
+
+def _finalize_file_session(owner_id: str, meta: dict) -> tuple[Path, str]:
+    # Under the session lock so concurrent finalize calls cannot both hash and
+    # move the same part; the loser sees the session gone.
+    with upload_sessions.session_lock(owner_id, meta["id"]):
+        if upload_sessions.load_session(owner_id, meta["id"]) is None:
+            raise HTTPException(status_code=404, detail="upload session not found")
+        return _finalize_file_session_locked(owner_id, meta)
+
+
+def _finalize_file_session_locked(owner_id: str, meta: dict) -> tuple[Path, str]:
+    part = upload_sessions.part_path(owner_id, meta["id"])
+    digest = hashlib.sha256()
+    with part.open("rb") as f:
+        head = f.read(64)
+        digest.update(head)
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    sha256 = digest.hexdigest()
+    if meta.get("sha256") and meta["sha256"] != sha256:
+        upload_sessions.drop_session(owner_id, meta["id"])
+        raise HTTPException(status_code=422, detail="sha256 mismatch, upload discarded")
+    ext = sniff_image_type(head)
+    if ext is None:
+        upload_sessions.drop_session(owner_id, meta["id"])
+        raise HTTPException(status_code=400, detail="only image files allowed")
+
+    target_dir = resolve_dir(meta["path"])
+    target_dir.mkdir(parents=True, exist_ok=True)
+    file_name = meta["filename"]
+    if Path(file_name).suffix.lower() not in ALLOWED_SUFFIX:
+        file_name = f"{Path(file_name).stem}{ext}"
+    tmp = target_dir / f".upload-{secrets.token_hex(8)}.part"
+    moved = part.stat().st_dev == target_dir.stat().st_dev
+    if moved:
+        os.replace(part, tmp)
+    else:
+        shutil.copyfile(part, tmp)
+    try:
+        out, status = place_stored_file(tmp, target_dir / file_name, sha256, int(meta["size"]))
+        if out.parent == target_dir:
+            append_in_order(meta["path"], out.name)
+    except BaseException:
+        # Keep the session resumable: hand the bytes back to it if placement
+        # has not consumed them yet.
+        if moved and tmp.exists():
+            os.replace(tmp, part)
+        else:
+            tmp.unlink(missing_ok=True)
+        raise
+    upload_sessions.drop_session(owner_id, meta["id"])
+    return out, status
+
+
+@router.post("/sessions")
+async def api_upload_session_create(
+    filename: str = Form(...),
+    size: int = Form(...),
+    path: str | None = Form(default=None),
+    kind: str = Form(default="file"),
+    folder_name: str | None = Form(default=None),
+    sha256: str = Form(default=""),
+    x_upload_key: str | None = Header(default=None),
+):
+    user = auth_header_key(x_upload_key)
+    file_name = Path((filename or "").replace("\\", "/")).name.strip()
+    if not file_name or file_name.startswith("."):
+        raise HTTPException(status_code=400, detail="invalid filename")
+    if sha256 and not re.fullmatch(r"[0-9a-fA-F]{64}", sha256):
+        raise HTTPException(status_code=400, detail="invalid sha256")
+    if kind == "file":
+        limit = MAX_BYTES
+        target_path = safe_path(path or "")
+        resolve_dir(target_path)
+    elif kind == "zip":
+        if not file_name.lower().endswith(".zip"):
+            raise HTTPException(status_code=400, detail="only .zip files allowed")
+        limit = _IMPORT_MAX_TOTAL_BYTES
+        target_path = _safe_destination(path)
+        folder_name = _safe_folder_name(folder_name)
+    else:
+        raise HTTPException(status_code=400, detail="kind must be file or zip")
+    if size <= 0 or size > limit:
+        raise HTTPException(status_code=413, detail=f"file too large (max {limit // (1024 * 1024)}MB)")
+
+    meta = await asyncio.to_thread(
+        upload_sessions.create_session,
+        user["id"],
+        kind=kind,
+        size=size,
+        filename=file_name,
+        path=target_path,
+        sha256=sha256,
+        **({"folder_name": folder_name} if kind == "zip" else {}),
+    )
+    return _session_status(meta)
+
+
+@router.get("/sessions/{session_id}")
+async def api_upload_session_status(session_id: str, x_upload_key: str | None = Header(default=None)):
+    user = auth_header_key(x_upload_key)
+    return _session_status(_load_upload_session(user["id"], session_id))
+
+
+@router.put("/sessions/{session_id}")
+async def api_upload_session_chunk(
+    session_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    x_upload_key: str | None = Header(default=None),
+):
+    user = auth_header_key(x_upload_key)
+    meta = _load_upload_session(user["id"], session_id)
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > upload_sessions.CHUNK_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="chunk too large")
+    parts: list[bytes] = []
+    received = 0
+    async for piece in request.stream():
+        received += len(piece)
+        if received > upload_sessions.CHUNK_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="chunk too large")
+        parts.append(piece)
+    data = b"".join(parts)
+    if not data:
+        raise HTTPException(status_code=400, detail="empty chunk")
+    if offset + len(data) > int(meta["size"]):
+        raise HTTPException(status_code=416, detail="chunk exceeds announced size")
+    if offset == 0:
+        ok = data.startswith(b"PK\x03\x04") if meta["kind"] == "zip" else sniff_image_type(data[:64]) is not None
+        if not ok:
+            raise HTTPException(status_code=400, detail="unsupported file type")
+    try:
+        meta = await asyncio.to_thread(upload_sessions.write_chunk, user["id"], session_id, offset, data)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="upload session not found")
+    return _session_status(meta)
+
+
+@router.post("/sessions/{session_id}/finalize")
+async def api_upload_session_finalize(session_id: str, x_upload_key: str | None = Header(default=None)):
+    user = auth_header_key(x_upload_key)
+    meta = _load_upload_session(user["id"], session_id)
+    status = _session_status(meta)
+    if not status["complete"]:
+        return JSONResponse({**status, "ok": False, "detail": "upload incomplete"}, status_code=409)
+
+    if meta["kind"] == "zip":
+        zip_path = upload_sessions.part_path(user["id"], session_id)
+        upload_sessions.drop_session(user["id"], session_id, keep_part=True)
+        job = create_job(user["id"], "zip")
+        ctx = contextvars.copy_context()
+        _import_job_pool.submit(
+            ctx.run, _run_zip_import, job, zip_path, meta["filename"], meta["path"], meta.get("folder_name")
+        )
+        return JSONResponse(
+            {"ok": True, "job_id": job.id, "status": "queued", "status_url": f"/api/upload/jobs/{job.id}"},
+            status_code=202,
+        )
+
+    out, file_status = await asyncio.to_thread(_finalize_file_session, user["id"], meta)
+    if file_status != "duplicate":
+        _queue_variant(out)
+    return {"ok": True, "path": meta["path"], "file": out.name, "status": file_status}
+
+
+@router.delete("/sessions/{session_id}")
+async def api_upload_session_abort(session_id: str, x_upload_key: str | None = Header(default=None)):
+    user = auth_header_key(x_upload_key)
+    _load_upload_session(user["id"], session_id)
+    await asyncio.to_thread(upload_sessions.drop_session, user["id"], session_id)
+    return {"ok": True}
 
 
 @router.post("/{token}")
@@ -325,26 +663,12 @@ async def api_upload(
     ext = sniff_image_type(head)
     if ext is None:
         raise HTTPException(status_code=400, detail="only image files allowed")
-    d = token_dir(token)
-    d.mkdir(parents=True, exist_ok=True)
-    h = hashlib.sha256(head + str(time.time()).encode()).hexdigest()[:16]
-    out = d / f"{int(time.time())}_{h}{ext}"
-    total = len(head)
-    with out.open("wb") as w:
-        w.write(head)
-        while True:
-            chunk = await file.read(1024 * 1024)
-            if not chunk:
-                break
-            total += len(chunk)
-            if total > MAX_BYTES:
-                out.unlink(missing_ok=True)
-                raise HTTPException(
-                    status_code=413, detail=f"file too large (max {MAX_MB}MB)"
-                )
-            w.write(chunk)
-    await asyncio.to_thread(append_in_order, token, out.name)
-    _generate_variants_async([out])
+    out, status, data = await asyncio.to_thread(_save_upload, token, file.file, head, ext)
+    if status == "duplicate" and out.parent != token_dir(token):
+        # DEDUP_MODE=skip: the content already lives in another album
+        return JSONResponse({"ok": True, "token": token, "status": status, "album": f"/d/{token}"})
+    if status != "duplicate":
+        _queue_variant(out, data)
     return JSONResponse(
-        {"ok": True, "token": token, "file": out.name, "album": f"/d/{token}"}
+        {"ok": True, "token": token, "file": out.name, "status": status, "album": f"/d/{token}"}
     )
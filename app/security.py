@@ -1,9 +1,20 @@
 from __future__ import annotations
 
+import ipaddress
+import logging
+import sqlite3
 import time
+from bisect import bisect_right
 from collections import OrderedDict, deque
 from dataclasses import dataclass, field
-from threading import Lock
+from pathlib import Path
+from threading import Lock, local
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+IPAddress = ipaddress.IPv4Address | ipaddress.IPv6Address
+IPNetwork = ipaddress.IPv4Network | ipaddress.IPv6Network
 
 
 @dataclass(slots=True)
@@ -59,3 +70,175 @@ class SlidingWindowRateLimiter:
                 q.popleft()
             if not q:
                 del self._events[k]
+
+
+@dataclass(slots=True)
+class SQLiteRateLimiter:
+    """Sliding window rate limiter shared by every worker through SQLite.
+
+    Same ``allow()`` contract as SlidingWindowRateLimiter, but the timestamps
+    live in a small WAL database so ``--workers N`` enforces one limit instead
+    of N. ``name`` namespaces limiters sharing a database file. If the
+    database is unavailable the limiter fails open.
+    """
+
+    db_path: Path
+    name: str
+    limit: int
+    window_s: float
+    cleanup_every: int = 256
+    timeout_s: float = 2.0
+    _ops: int = 0
+    _ready: bool = False
+    _lock: Lock = field(default_factory=Lock)
+    _local: local = field(default_factory=local)
+
+    def __post_init__(self) -> None:
+        try:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        except OSError:
+            logger.warning("rate limiter dir unavailable: %s", self.db_path.parent, exc_info=True)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it (and the schema) once."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout_s, isolation_level=None)
+        try:
+            if not self._ready:
+                with self._lock:
+                    if not self._ready:
+                        _ = conn.execute("PRAGMA journal_mode=WAL")
+                        _ = conn.execute(
+                            """
+                            CREATE TABLE IF NOT EXISTS rate_events (
+                                bucket TEXT NOT NULL,
+                                key TEXT NOT NULL,
+                                ts REAL NOT NULL
+                            )
+                            """
+                        )
+                        _ = conn.execute("CREATE INDEX IF NOT EXISTS idx_rate_events_key ON rate_events(bucket, key, ts)")
+                        _ = conn.execute("CREATE INDEX IF NOT EXISTS idx_rate_events_ts ON rate_events(bucket, ts)")
+                        self._ready = True
+            # Losing a few timestamps on power loss is harmless for a rate limit.
+            _ = conn.execute("PRAGMA synchronous=OFF")
+        except sqlite3.Error:
+            conn.close()
+            raise
+        self._local.conn = conn
+        return conn
+
+    def _reset(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def allow(self, key: str, now: float | None = None) -> bool:
+        key = key or "unknown"
+        if now is None:
+            now = time.time()
+
+        cutoff = now - self.window_s
+        with self._lock:
+            self._ops += 1
+            cleanup = self.cleanup_every > 0 and (self._ops % self.cleanup_every) == 0
+        try:
+            conn = self._connect()
+        except (sqlite3.Error, OSError):
+            logger.warning("rate limiter db unavailable: %s", self.db_path, exc_info=True)
+            return True
+        try:
+            # One autocommit statement: count-and-insert is atomic across
+            # workers without an explicit BEGIN IMMEDIATE per request.
+            # Expired rows are ignored here and swept every cleanup_every calls.
+            cur = conn.execute(
+                """
+                INSERT INTO rate_events (bucket, key, ts)
+                SELECT ?, ?, ?
+                WHERE (SELECT COUNT(*) FROM rate_events WHERE bucket = ? AND key = ? AND ts > ?) < ?
+                """,
+                (self.name, key, now, self.name, key, cutoff, self.limit),
+            )
+            allowed = cur.rowcount > 0
+            if cleanup:
+                _ = conn.execute("DELETE FROM rate_events WHERE bucket = ? AND ts <= ?", (self.name, cutoff))
+            return allowed
+        except sqlite3.Error:
+            logger.warning("rate limiter update failed: %s", self.db_path, exc_info=True)
+            self._reset()
+            return True
+
+
+def parse_ip_address(value: str | IPAddress | None) -> IPAddress | None:
+    if isinstance(value, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+        return value
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        return ipaddress.ip_address(value)
+    except ValueError:
+        return None
+
+
+class IPRangeMatcher:
+    """Precompiled membership test for a fixed set of CIDR ranges.
+
+    Networks are merged into sorted, non-overlapping integer intervals per IP
+    version, so a lookup is a single ``bisect`` instead of a scan over
+    ``ip_network`` objects.
+    """
+
+    __slots__ = ("_tables",)
+
+    def __init__(self, networks: Iterable[IPNetwork | str] = ()):
+        spans: dict[int, list[tuple[int, int]]] = {4: [], 6: []}
+        for net in networks:
+            if isinstance(net, str):
+                net = net.strip()
+                if not net:
+                    continue
+                try:
+                    net = ipaddress.ip_network(net, strict=False)
+                except ValueError:
+                    continue
+            spans[net.version].append((int(net.network_address), int(net.broadcast_address)))
+
+        self._tables: dict[int, tuple[list[int], list[int]]] = {}
+        for version, items in spans.items():
+            starts: list[int] = []
+            ends: list[int] = []
+            for start, end in sorted(items):
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            self._tables[version] = (starts, ends)
+
+    @classmethod
+    def from_csv(cls, raw: str) -> "IPRangeMatcher":
+        return cls((raw or "").split(","))
+
+    def __bool__(self) -> bool:
+        return any(starts for starts, _ends in self._tables.values())
+
+    def contains(self, value: str | IPAddress | None) -> bool:
+        addr = parse_ip_address(value)
+        if addr is None:
+            return False
+        starts, ends = self._tables[addr.version]
+        if not starts:
+            return False
+        n = int(addr)
+        i = bisect_right(starts, n) - 1
+        return i >= 0 and n <= ends[i]
+
+    __contains__ = contains
@@ -1,28 +1,63 @@
+import atexit
 import hashlib
 import json
+import logging
 import os
 import re
 import secrets
 import shutil
 import threading
-import ipaddress
+import time
 from collections import Counter, defaultdict, deque
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 from typing import Any, List
-from .analytics_store import get_stats_rollups, iter_sqlite_visit_events, record_sqlite_visit, seed_stats_rollup
-from app.config import BASE_DIR, REGION_TRACE_ENABLED, ANALYTICS_READ_SQLITE, ANALYTICS_WRITE_LEGACY, ANALYTICS_WRITE_SQLITE
+from .analytics_store import (
+    bulk_import_visits,
+    get_cross_visits,
+    get_stats_rollups,
+    has_sqlite_visit_events,
+    iter_sqlite_visit_events,
+    record_sqlite_visit,
+    seed_stats_rollup,
+)
+from app import geoip
+from app.atomic_io import atomic_write_text
+from app.dirscan import ScanEntry, scan_dir
+from app.locks import FileLock
+from app.config import BASE_DIR, DEDUP_MODE, REGION_TRACE_ENABLED, ANALYTICS_READ_SQLITE, ANALYTICS_WRITE_LEGACY, ANALYTICS_WRITE_SQLITE
 from app.auth import TOKEN_RE, token_dir, resolve_dir
-from app.image_variants import remove_variants_for_source
+from app.security import IPAddress, IPRangeMatcher, parse_ip_address
+from app.image_variants import link_variants, remove_variants_for_source
 from app.metadata_store import (
+    bump_owner_generation,
     create_trash_entry,
     delete_trash_entry,
     get_trash_entry,
+    is_metadata_migrated,
+    bulk_import_metadata,
     list_trash_entries,
+    load_folder_orders_under,
     load_folder_order_record,
     load_manifest_record,
+    find_content_hashes,
+    forget_content_hash,
+    forget_dashboard_titles,
+    load_dashboard,
+    load_owner_generation,
+    mark_dashboard_dirty,
+    record_dashboard_visits,
+    replace_dashboard,
+    set_dashboard_folder_count,
+    set_dashboard_titles,
+    forget_token_summaries,
+    load_token_summaries,
+    save_token_summaries,
     load_slugs_snapshot,
     metadata_backend,
+    move_content_hashes,
+    move_metadata_subtree,
+    record_content_hash,
     save_folder_order_record,
     save_manifest_record,
     save_slugs_snapshot,
@@ -34,31 +69,41 @@ from app.users import (
     get_current_root,
     get_current_user_id,
     get_root_for_user_id,
+    list_users,
     slug_owner_key,
 )
 
+logger = logging.getLogger(__name__)
+
 ALLOWED_SUFFIX = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
 MANIFEST = ".manifest.json"
 FOLDER_ORDER_FILE = ".folder_order.json"
 ARCHIVE_DIRNAME = "_archived"
 _VISITS_MAX_BYTES = 10 * 1024 * 1024
-_IP2REGION_DB_PATH = Path(os.environ.get("IP2REGION_DB", "")) if os.environ.get("IP2REGION_DB") else None
-_stats_lock = threading.Lock()
-_visits_lock = threading.Lock()
-_slugs_lock = threading.Lock()
+# Shared by every worker process: these guard read-modify-write cycles on
+# JSON files and visit-log rotation.
+_stats_lock = FileLock(SYSTEM_DIR / "_stats.lock")
+_visits_lock = FileLock(SYSTEM_DIR / "_visits.lock")
+_slugs_lock = FileLock(SYSTEM_DIR / "_slugs.lock")
+_manifest_locks: dict[str, FileLock] = {}
+_manifest_locks_guard = threading.Lock()
+# Concurrent append_in_order calls for one album within this window share a
+# single directory scan and manifest write.
+_APPEND_WINDOW_S = max(0, int(os.environ.get("MANIFEST_APPEND_WINDOW_MS", "10"))) / 1000
+_pending_appends: dict[str, "_PendingAppend"] = {}
+_pending_appends_guard = threading.Lock()
+# Dashboard visit counters are queued per process and written in one
+# transaction at most this often, instead of one write per album view.
+_DASHBOARD_FLUSH_S = max(0, int(os.environ.get("DASHBOARD_VISIT_FLUSH_MS", "1000"))) / 1000
+_pending_dashboard_visits: list[tuple[str, str, str, str]] = []
+_dashboard_visits_guard = threading.Lock()
+_dashboard_flush_timer: threading.Timer | None = None
 _SLUG_SALT = os.environ.get("SLUG_SALT", "xaihub-photo-2026")
-_ip2region_lock = threading.Lock()
-_ip2region_searcher = None
-_ip2region_unavailable = False
-_analytics_excluded_nets: list[ipaddress.IPv4Network | ipaddress.IPv6Network] = []
-for _net in (os.environ.get("ANALYTICS_EXCLUDED_NETS") or "").split(","):
-    _net = _net.strip()
-    if not _net:
-        continue
-    try:
-        _analytics_excluded_nets.append(ipaddress.ip_network(_net, strict=False))
-    except ValueError:
-        continue
+_analytics_excluded_nets = IPRangeMatcher.from_csv(os.environ.get("ANALYTICS_EXCLUDED_NETS") or "")
+# IPv4 loopback plus the RFC 1918 ranges, as a sorted table for the hot path.
+# IPv6, IPv4-mapped addresses included, is left to ipaddress itself so it
+# follows exactly what the running Python counts as private or link-local.
+_LOCAL_V4_NETS = IPRangeMatcher(["127.0.0.0/8", "10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16"])
 
 
 def _current_root() -> Path:
@@ -85,23 +130,19 @@ def _slugs_file() -> Path:
     return (SYSTEM_DIR / "_slugs.json").resolve()
 
 
+def _image_names(entries: list[ScanEntry]) -> List[str]:
+    return sorted(e.name for e in entries if e.is_file and e.suffix in ALLOWED_SUFFIX)
+
+
 def list_raw_images(token: str) -> List[str]:
-    d = token_dir(token)
-    if not d.exists():
-        return []
-    return [
-        p.name
-        for p in sorted(d.iterdir())
-        if p.is_file() and p.suffix.lower() in ALLOWED_SUFFIX
-    ]
+    return _image_names(scan_dir(token_dir(token)))
 
 
 def manifest_path(token: str) -> Path:
     return token_dir(token) / MANIFEST
 
 
-def _load_manifest_from_fs(token: str) -> dict[str, Any]:
-    p = manifest_path(token)
+def _read_manifest_file(p: Path) -> dict[str, Any]:
     if not p.exists():
         return {"order": [], "title": ""}
     try:
@@ -117,41 +158,72 @@ def _load_manifest_from_fs(token: str) -> dict[str, Any]:
         return {"order": [], "title": ""}
 
 
+def _load_manifest_from_fs(token: str) -> dict[str, Any]:
+    return _read_manifest_file(manifest_path(token))
+
+
 def load_manifest(token: str) -> dict[str, Any]:
     backend = metadata_backend()
-    owner = _owner_id()
     if backend == "sqlite":
+        owner = _owner_id()
         record = load_manifest_record(owner, token)
         if record is not None:
             return record
+        # Only folders that appeared after the startup migration get here; the
+        # row written below (empty when there is no manifest) is the negative
+        # cache entry, so the file is read at most once.
         data = _load_manifest_from_fs(token)
-        if data.get("order") or data.get("title"):
+        if token_dir(token).is_dir():
             save_manifest_record(owner, token, data)
         return data
-
-    data = _load_manifest_from_fs(token)
-    if backend == "dual":
-        save_manifest_record(owner, token, data)
-    return data
+    return _load_manifest_from_fs(token)
 
 
 def save_manifest(token: str, data: dict[str, Any]):
-    p = manifest_path(token)
-    p.parent.mkdir(parents=True, exist_ok=True)
-    p.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-    if metadata_backend() in {"dual", "sqlite"}:
+    backend = metadata_backend()
+    if backend != "sqlite":
+        p = manifest_path(token)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(p, json.dumps(data, ensure_ascii=False, indent=2), coalesce=True)
+    if backend in {"dual", "sqlite"}:
         save_manifest_record(_owner_id(), token, data)
+    _forget_token_summary(token)
+    bump_generation()
+
+
+def _merge_order(order: List[str], raw: List[str]) -> List[str]:
+    raw_set = set(raw)
+    kept = [x for x in order if x in raw_set]
+    kept_set = set(kept)
+    return kept + [x for x in raw if x not in kept_set]
+
+
+def _manifest_lock(token: str) -> FileLock:
+    # One lock per album directory, kept under _system so copying or trashing
+    # the album never carries a lock file along.
+    key = str(token_dir(token).resolve())
+    with _manifest_locks_guard:
+        lock = _manifest_locks.get(key)
+        if lock is None:
+            digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+            lock = FileLock(SYSTEM_DIR / "_manifest_locks" / f"{digest}.lock")
+            _manifest_locks[key] = lock
+        return lock
 
 
 def list_images(token: str) -> List[str]:
     raw = list_raw_images(token)
     data = load_manifest(token)
-    order = [x for x in data.get("order", []) if x in raw]
-    rest = [x for x in raw if x not in order]
-    final = order + rest
+    final = _merge_order(data.get("order", []), raw)
     if final != data.get("order", []):
-        data["order"] = final
-        save_manifest(token, data)
+        with _manifest_lock(token):
+            raw = list_raw_images(token)
+            data = load_manifest(token)
+            final = _merge_order(data.get("order", []), raw)
+            if final != data.get("order", []):
+                data["order"] = final
+                save_manifest(token, data)
+        _note_folder_images(token_dir(token), len(raw))
     return final
 
 
@@ -220,38 +292,216 @@ def infer_token_title(token: str) -> str:
 
 
 def set_token_title(token: str, title: str):
-    d = load_manifest(token)
-    d["title"] = (title or "").strip()
-    save_manifest(token, d)
+    with _manifest_lock(token):
+        d = load_manifest(token)
+        d["title"] = (title or "").strip()
+        save_manifest(token, d)
+    forget_dashboard_titles(_owner_id())
+
+
+def _rewrite_order(token: str, edit) -> None:
+    with _manifest_lock(token):
+        raw = list_raw_images(token)
+        data = load_manifest(token)
+        data["order"] = _merge_order(edit(_merge_order(data.get("order", []), raw)), raw)
+        save_manifest(token, data)
+    _note_folder_images(token_dir(token), len(raw))
 
 
 def update_order(token: str, names: List[str]):
-    existing = list_raw_images(token)
-    existing_set = set(existing)
-    cleaned = [x for x in names if x in existing_set]
-    for x in existing:
-        if x not in cleaned:
-            cleaned.append(x)
-    data = load_manifest(token)
-    data["order"] = cleaned
-    save_manifest(token, data)
+    _rewrite_order(token, lambda _current: names)
 
 
 def rename_in_order(token: str, old_name: str, new_name: str):
-    arr = list_images(token)
-    arr = [new_name if x == old_name else x for x in arr]
-    update_order(token, arr)
+    _rewrite_order(token, lambda current: [new_name if x == old_name else x for x in current])
 
 
 def remove_in_order(token: str, name: str):
-    update_order(token, [x for x in list_images(token) if x != name])
+    _rewrite_order(token, lambda current: [x for x in current if x != name])
+
+
+def _append_batch_to_order(token: str, names: List[str]) -> None:
+    """One directory scan and one manifest write for a whole batch of new files.
+
+    Names already in the saved order keep their place; new ones go to the end
+    in arrival order.
+    """
+    with _manifest_lock(token):
+        raw = list_raw_images(token)
+        raw_set = set(raw)
+        data = load_manifest(token)
+        order = [x for x in data.get("order", []) if x in raw_set]
+        known = set(order)
+        for name in names:
+            if name in raw_set and name not in known:
+                order.append(name)
+                known.add(name)
+        data["order"] = _merge_order(order, raw)
+        save_manifest(token, data)
+    _note_folder_images(token_dir(token), len(raw))
+
+
+class _PendingAppend:
+    __slots__ = ("names", "done", "error")
+
+    def __init__(self) -> None:
+        self.names: List[str] = []
+        self.done = threading.Event()
+        self.error: BaseException | None = None
+
+
+def append_many_in_order(token: str, names: List[str]) -> None:
+    """Append names to the album order, coalescing with concurrent appends.
+
+    The first caller for an album waits _APPEND_WINDOW_S, then writes every
+    name queued for that album in the meantime; the others just wait for that
+    write. Appends arriving while a batch is being written start the next one.
+    """
+    if not names:
+        return
+    key = str(token_dir(token).resolve())
+    with _pending_appends_guard:
+        batch = _pending_appends.get(key)
+        leader = batch is None
+        if leader:
+            batch = _pending_appends[key] = _PendingAppend()
+        batch.names.extend(names)
+    if not leader:
+        batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+        return
+    try:
+        try:
+            if _APPEND_WINDOW_S:
+                time.sleep(_APPEND_WINDOW_S)
+        finally:
+            with _pending_appends_guard:
+                _pending_appends.pop(key, None)
+        _append_batch_to_order(token, batch.names)
+    except BaseException as e:
+        batch.error = e
+        raise
+    finally:
+        batch.done.set()
 
 
 def append_in_order(token: str, name: str):
-    arr = list_images(token)
-    if name not in arr:
-        arr.append(name)
-    update_order(token, arr)
+    append_many_in_order(token, [name])
+
+
+def record_file_hash(path: Path, sha256: str, size: int) -> None:
+    path = path.resolve()
+    rel_path = path.relative_to(_current_root()).as_posix()
+    st = path.stat()
+    record_content_hash(_owner_id(), rel_path, sha256, size, inode=st.st_ino, mtime_ns=st.st_mtime_ns)
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _rel_to_root(p: Path) -> str | None:
+    try:
+        return p.resolve().relative_to(_current_root()).as_posix()
+    except ValueError:
+        return None
+
+
+def move_file_hash(src: Path, dst: Path | None) -> None:
+    """Re-key the content hash row of a file (or every file below a folder) after a move; dst=None drops it."""
+    old = _rel_to_root(src)
+    if old is None or old == ".":
+        return
+    move_content_hashes(_owner_id(), old, _rel_to_root(dst) if dst is not None else None)
+
+
+def _hash_row_matches(candidate: Path, row: dict[str, Any], sha256: str, size: int) -> bool:
+    try:
+        st = candidate.stat()
+    except OSError:
+        return False
+    if st.st_size != size or row["size"] != size:
+        return False
+    if row["inode"]:
+        # Same inode and mtime: the very file that was hashed, not new bytes
+        # that happen to have the old name and size.
+        return (st.st_ino, st.st_mtime_ns) == (row["inode"], row["mtime_ns"])
+    # Recorded before fingerprints were stored: check once, then keep one.
+    try:
+        if _file_sha256(candidate) != sha256:
+            return False
+    except OSError:
+        return False
+    record_file_hash(candidate, sha256, size)
+    return True
+
+
+def find_stored_copy(sha256: str, size: int, prefer_dir: Path | None = None) -> Path | None:
+    """Return an existing original with this content, preferring one in prefer_dir.
+
+    Index rows whose file has moved away or changed since it was hashed are
+    pruned. Archived and trashed files keep their rows (a restore puts them
+    back) but are never offered as originals.
+    """
+    root = _current_root()
+    archive = root / ARCHIVE_DIRNAME
+    owner = _owner_id()
+    found: Path | None = None
+    for row in find_content_hashes(owner, sha256):
+        candidate = (root / row["rel_path"]).resolve()
+        if candidate.is_relative_to(archive):
+            continue
+        if not candidate.is_relative_to(root) or not _hash_row_matches(candidate, row, sha256, size):
+            forget_content_hash(owner, row["rel_path"])
+            continue
+        if prefer_dir is None or candidate.parent == prefer_dir:
+            return candidate
+        found = found or candidate
+    return found
+
+
+def place_stored_file(tmp: Path, target: Path, sha256: str, size: int) -> tuple[Path, str]:
+    """Move a fully written, hashed temp file to target, deduplicating by content.
+
+    Returns (path, status):
+      - "stored": tmp was renamed to target.
+      - "linked": target is a hard link to an existing copy (variants included);
+        tmp is gone.
+      - "duplicate": the content is already in target's folder (or anywhere, with
+        DEDUP_MODE=skip); tmp is discarded and the existing path is returned.
+    """
+    target_dir = target.resolve().parent
+    existing = find_stored_copy(sha256, size, prefer_dir=target_dir) if DEDUP_MODE != "off" else None
+    if existing is not None:
+        if existing.parent == target_dir or DEDUP_MODE == "skip":
+            tmp.unlink(missing_ok=True)
+            return existing, "duplicate"
+        tmp.unlink(missing_ok=True)
+        try:
+            # link under the temp name first so an existing target is replaced atomically
+            os.link(existing, tmp)
+        except OSError:
+            # no hard links here (other filesystem, unsupported): keep a plain copy
+            shutil.copyfile(existing, tmp)
+        else:
+            is_new = not target.exists()
+            os.replace(tmp, target)
+            link_variants(existing, target)
+            record_file_hash(target, sha256, size)
+            if is_new:
+                _note_folder_images(target_dir)
+            return target, "linked"
+    is_new = not target.exists()
+    os.replace(tmp, target)
+    record_file_hash(target, sha256, size)
+    if is_new:
+        _note_folder_images(target_dir)
+    return target, "stored"
 
 
 def _resolve_managed_file(path: str, name: str) -> tuple[Path, Path]:
@@ -292,6 +542,7 @@ def rename_file_in_folder(path: str, old_name: str, new_name: str) -> dict[str,
 
     remove_variants_for_source(source)
     source.rename(target)
+    move_file_hash(source, target)
     rename_in_order(path, old_name, target.name)
     return {"old": old_name, "new": target.name, "path": path}
 
@@ -309,6 +560,7 @@ def move_file_between_folders(src_path: str, name: str, dest_path: str) -> dict[
     target = (dest_dir / target_name).resolve()
     remove_variants_for_source(source)
     shutil.move(str(source), str(target))
+    move_file_hash(source, target)
     remove_in_order(src_path, source.name)
     append_in_order(dest_path, target.name)
     return {"src": source.name, "dst": target.name, "src_path": src_path, "dest": dest_path}
@@ -350,47 +602,80 @@ def copy_folder(path: str, dest_path: str = "", before_name: str | None = None)
     new_path = f"{dest_path}/{target_name}" if dest_path else target_name
     target_dir = resolve_dir(new_path).resolve()
     shutil.copytree(str(src_dir), str(target_dir))
+    move_folder_metadata(src_dir, target_dir, copy=True)
     reorder_subfolder(dest_dir, target_dir.name, before_name=before_name)
+    invalidate_dashboard()
     return {"path": path, "dest": dest_path, "new_path": new_path}
 
 
+def _summarize_token(token: str, d: Path) -> dict[str, Any]:
+    images = [e for e in scan_dir(d, with_stat=True) if e.is_file and e.suffix in ALLOWED_SUFFIX]
+    count = len(images)
+    latest = max((e.mtime for e in images), default=0.0)
+    title = infer_token_title(token)
+    # Taken last: inferring the title may itself rewrite the manifest.
+    dir_mtime_ns = d.stat().st_mtime_ns
+    return {"token": token, "image_count": count, "title": title, "latest_mtime": latest, "dir_mtime_ns": dir_mtime_ns}
+
+
+def _forget_token_summary(token: str) -> None:
+    top = token.strip("/").split("/", 1)[0]
+    if top:
+        forget_token_summaries(_owner_id(), [top])
+
+
 def list_tokens_with_counts() -> List[dict[str, Any]]:
+    """Top-level albums with image count, title and latest image mtime.
+
+    Served from the token_summaries index. A token is re-summarized only when
+    its row was dropped by a mutation (see _forget_token_summary) or its
+    directory mtime changed, which also catches files added or removed behind
+    the app's back.
+    """
     root = _current_root()
     if not root.exists():
         return []
+    owner = _owner_id()
+    cached = load_token_summaries(owner)
+    entries = sorted(
+        (
+            e
+            for e in scan_dir(root, with_stat=True)
+            if e.is_dir and not e.name.startswith("_") and TOKEN_RE.match(e.name)
+        ),
+        key=lambda e: e.name,
+    )
     out = []
-    for p in sorted(root.iterdir()):
-        if (
-            not p.is_dir()
-            or p.is_symlink()
-            or p.name.startswith("_")
-            or not TOKEN_RE.match(p.name)
-        ):
-            continue
-        count = len(
-            [
-                x
-                for x in p.iterdir()
-                if x.is_file() and x.suffix.lower() in ALLOWED_SUFFIX
-            ]
+    fresh = []
+    for entry in entries:
+        row = cached.pop(entry.name, None)
+        if row is None or row["dir_mtime_ns"] != entry.mtime_ns:
+            try:
+                row = _summarize_token(entry.name, Path(entry.path))
+            except FileNotFoundError:
+                continue
+            fresh.append(row)
+        out.append(
+            {
+                "token": entry.name,
+                "count": row["image_count"],
+                "title": row["title"],
+                "latest_mtime": int(row["latest_mtime"]),
+            }
         )
-        out.append({"token": p.name, "count": count, "title": infer_token_title(p.name)})
+    if fresh:
+        save_token_summaries(owner, fresh)
+    if cached:
+        forget_token_summaries(owner, list(cached))
     return out
 
 
-def _count_images(d: Path) -> int:
-    return sum(1 for x in d.iterdir() if x.is_file() and x.suffix.lower() in ALLOWED_SUFFIX) if d.exists() else 0
+def _visible_child_dirs(d: Path, entries: list[ScanEntry]) -> list[Path]:
+    return [d / e.name for e in entries if e.is_dir and not e.name.startswith(("_", "."))]
 
 
 def _list_visible_child_dirs(d: Path) -> list[Path]:
-    if not d.exists():
-        return []
-    out = []
-    for p in d.iterdir():
-        if not p.is_dir() or p.name.startswith(("_", ".")) or p.is_symlink():
-            continue
-        out.append(p)
-    return out
+    return _visible_child_dirs(d, scan_dir(d))
 
 
 def _load_subfolder_order_from_fs(d: Path) -> list[str]:
@@ -406,43 +691,65 @@ def _load_subfolder_order_from_fs(d: Path) -> list[str]:
         return []
 
 
-def load_subfolder_order(d: Path) -> list[str]:
-    backend = metadata_backend()
-    rel_path = ""
+def _folder_key(d: Path) -> str | None:
     try:
-        rel_path = d.resolve().relative_to(_current_root()).as_posix()
-    except Exception:
-        rel_path = ""
-    if backend == "sqlite" and rel_path:
-        record = load_folder_order_record(_owner_id(), rel_path)
+        return d.resolve().relative_to(_current_root()).as_posix()
+    except ValueError:
+        return None
+
+
+def load_subfolder_order(d: Path) -> list[str]:
+    key = _folder_key(d)
+    if metadata_backend() == "sqlite" and key is not None:
+        record = load_folder_order_record(_owner_id(), key)
         if record is not None:
             return record
+        # Same negative caching as load_manifest.
         order = _load_subfolder_order_from_fs(d)
-        if order:
-            save_folder_order_record(_owner_id(), rel_path, order)
+        if d.is_dir():
+            save_folder_order_record(_owner_id(), key, order)
         return order
-
-    order = _load_subfolder_order_from_fs(d)
-    if backend == "dual" and rel_path:
-        save_folder_order_record(_owner_id(), rel_path, order)
-    return order
+    return _load_subfolder_order_from_fs(d)
 
 
 def save_subfolder_order(d: Path, order: list[str]):
-    p = d / FOLDER_ORDER_FILE
-    p.write_text(json.dumps(order, ensure_ascii=False, indent=2), encoding="utf-8")
-    try:
-        rel_path = d.resolve().relative_to(_current_root()).as_posix()
-    except Exception:
-        rel_path = ""
-    if rel_path and metadata_backend() in {"dual", "sqlite"}:
-        save_folder_order_record(_owner_id(), rel_path, order)
+    backend = metadata_backend()
+    key = _folder_key(d)
+    if backend != "sqlite" or key is None:
+        atomic_write_text(d / FOLDER_ORDER_FILE, json.dumps(order, ensure_ascii=False, indent=2), coalesce=True)
+    if key is not None and backend in {"dual", "sqlite"}:
+        save_folder_order_record(_owner_id(), key, order)
+    bump_generation()
+
+
+def move_folder_metadata(src: Path, dst: Path | None, *, copy: bool = False) -> None:
+    """Carry the SQLite metadata of folder src and its subfolders over to dst.
+
+    Call after the folder itself was moved (or copied, copy=True); dst=None
+    means it is gone. The JSON files travel with the folder on their own, the
+    rows are keyed by path and would otherwise be orphaned under the old one.
+    Content hash rows are kept with every backend and move too; copies have
+    new inodes and get no rows.
+    """
+    old = _folder_key(src)
+    if old is None or old == ".":
+        return
+    new = _folder_key(dst) if dst is not None else None
+    if not copy:
+        move_content_hashes(_owner_id(), old, new)
+    if metadata_backend() in {"dual", "sqlite"}:
+        move_metadata_subtree(_owner_id(), old, new, copy=copy)
 
 
-def ordered_child_dirs(d: Path) -> list[Path]:
-    children = _list_visible_child_dirs(d)
+def ordered_child_dirs(
+    d: Path, orders: dict[str, list[str]] | None = None, children: list[Path] | None = None
+) -> list[Path]:
+    """Child folders in saved order; orders is a preloaded {folder key: order} map."""
+    if children is None:
+        children = _list_visible_child_dirs(d)
     by_name = {p.name: p for p in children}
-    order = load_subfolder_order(d)
+    key = _folder_key(d) if orders is not None else None
+    order = orders[key] if key is not None and key in orders else load_subfolder_order(d)
     out: list[Path] = []
     used = set()
     for name in order:
@@ -455,6 +762,36 @@ def ordered_child_dirs(d: Path) -> list[Path]:
     return out
 
 
+def migrate_metadata_to_sqlite() -> int:
+    """Bulk-copy every user's .manifest.json / .folder_order.json into SQLite, once per user.
+
+    Folders without metadata get empty rows too, so afterwards a missing row
+    only means "created since", and reads never need the JSON files.
+    Returns the number of users migrated.
+    """
+    migrated = 0
+    for user in list_users():
+        owner = user["id"]
+        if is_metadata_migrated(owner):
+            continue
+        root = get_root_for_user_id(owner)
+        manifests: dict[str, dict[str, Any]] = {}
+        orders: dict[str, list[str]] = {}
+        if root.is_dir():
+            orders["."] = _load_subfolder_order_from_fs(root)
+            stack = [(root, "")]
+            while stack:
+                d, rel = stack.pop()
+                for child in _list_visible_child_dirs(d):
+                    child_rel = f"{rel}/{child.name}" if rel else child.name
+                    manifests[child_rel] = _read_manifest_file(child / MANIFEST)
+                    orders[child_rel] = _load_subfolder_order_from_fs(child)
+                    stack.append((child, child_rel))
+        bulk_import_metadata(owner, manifests, orders)
+        migrated += 1
+    return migrated
+
+
 def reorder_subfolder(parent_dir: Path, folder_name: str, before_name: str | None = None):
     before_name = (before_name or "").strip() or None
     children = _list_visible_child_dirs(parent_dir)
@@ -485,6 +822,8 @@ def reorder_subfolder(parent_dir: Path, folder_name: str, before_name: str | Non
 
 
 def remove_subfolder_from_order(parent_dir: Path, folder_name: str):
+    # Only called when a folder moved away (moved, trashed): its images went with it.
+    invalidate_dashboard()
     children = _list_visible_child_dirs(parent_dir)
     existing_names = sorted({p.name for p in children})
     existing_set = set(existing_names)
@@ -503,6 +842,7 @@ def remove_subfolder_from_order(parent_dir: Path, folder_name: str):
 
 
 def rename_subfolder_in_order(parent_dir: Path, old_name: str, new_name: str):
+    invalidate_dashboard()
     prev = load_subfolder_order(parent_dir)
     if not prev:
         return
@@ -520,12 +860,26 @@ def build_tree(root: Path | None = None, rel: str = "") -> list[dict[str, Any]]:
     root = root or _current_root()
     if not root.exists():
         return []
+    orders = None
+    if metadata_backend() == "sqlite":
+        key = _folder_key(root)
+        if key is not None:
+            orders = load_folder_orders_under(_owner_id(), key)
+    return _build_tree(root, rel, orders, scan_dir(root))
+
+
+def _build_tree(
+    root: Path, rel: str, orders: dict[str, list[str]] | None, entries: list[ScanEntry]
+) -> list[dict[str, Any]]:
+    # Each folder is listed exactly once: its entries give both its image
+    # count and its subfolders.
     items = []
-    for p in ordered_child_dirs(root):
+    for p in ordered_child_dirs(root, orders, _visible_child_dirs(root, entries)):
         child_rel = f"{rel}/{p.name}" if rel else p.name
-        children = build_tree(p, child_rel)
-        has_images = _count_images(p) > 0
-        is_album = has_images and not children
+        child_entries = scan_dir(p)
+        children = _build_tree(p, child_rel, orders, child_entries)
+        image_count = len(_image_names(child_entries))
+        is_album = image_count > 0 and not children
         slug = get_or_create_slug(child_rel)
         stat = p.stat()
         created_ts = getattr(stat, "st_birthtime", None)
@@ -534,7 +888,7 @@ def build_tree(root: Path | None = None, rel: str = "") -> list[dict[str, Any]]:
         node = {
             "name": p.name,
             "path": child_rel,
-            "image_count": _count_images(p),
+            "image_count": image_count,
             "is_album": is_album,
             "children": children,
             "modified_at": int(stat.st_mtime),
@@ -548,22 +902,14 @@ def build_tree(root: Path | None = None, rel: str = "") -> list[dict[str, Any]]:
 
 def list_images_by_path(path: str) -> List[str]:
     d = resolve_dir(path)
-    if not d.exists():
+    raw = _image_names(scan_dir(d))
+    if not raw:
         return []
-    raw = sorted(
-        p.name for p in d.iterdir()
-        if p.is_file() and p.suffix.lower() in ALLOWED_SUFFIX
-    )
-    manifest_file = d / MANIFEST
-    if manifest_file.exists():
-        try:
-            data = json.loads(manifest_file.read_text(encoding="utf-8"))
-            order = [x for x in data.get("order", []) if x in raw]
-            rest = [x for x in raw if x not in order]
-            return order + rest
-        except Exception:
-            pass
-    return raw
+    try:
+        order = load_manifest(path).get("order", [])
+    except Exception:
+        return raw
+    return _merge_order(order, raw)
 
 
 def search_manager_items(query: str, path: str = "", scope: str = "subtree", limit: int = 200) -> list[dict[str, Any]]:
@@ -651,6 +997,7 @@ def move_file_to_trash(token: str, name: str) -> dict[str, Any]:
     target = (target_dir / src.name).resolve()
     remove_variants_for_source(src)
     shutil.move(str(src), str(target))
+    move_file_hash(src, target)
     remove_in_order(token, name)
     return create_trash_entry(
         _owner_id(),
@@ -669,6 +1016,7 @@ def move_folder_to_trash(path: str) -> dict[str, Any]:
     target, trash_rel_path = _make_trash_target("folders", Path(path).name)
     old_parent_dir = src.parent
     shutil.move(str(src), str(target))
+    move_folder_metadata(src, target)
     remove_subfolder_from_order(old_parent_dir, src.name)
     remove_slug_paths(path)
     return create_trash_entry(
@@ -703,15 +1051,18 @@ def restore_trash_item(item_id: int) -> dict[str, Any]:
     shutil.move(str(src), str(dst))
 
     if str(entry.get("item_type") or "") == "file":
+        move_file_hash(src, dst)
         parent_rel = dst.parent.relative_to(root).as_posix()
         parent_token = get_or_create_slug(parent_rel)
         append_in_order(parent_token, dst.name)
     else:
+        move_folder_metadata(src, dst)
         if dst.parent == root:
             parent_dir = root
         else:
             parent_dir = dst.parent.resolve()
         reorder_subfolder(parent_dir, dst.name)
+        invalidate_dashboard()
 
     delete_trash_entry(_owner_id(), item_id)
     return {"ok": True, "id": item_id, "restored": dst.relative_to(root).as_posix()}
@@ -727,12 +1078,15 @@ def delete_trashed_item(item_id: int) -> dict[str, Any]:
     if target.exists():
         if target.is_dir():
             shutil.rmtree(target)
+            move_folder_metadata(target, None)
         else:
             target.unlink(missing_ok=True)
+            move_file_hash(target, None)
             parent = target.parent
             if parent.exists() and not any(parent.iterdir()):
                 parent.rmdir()
     delete_trash_entry(_owner_id(), item_id)
+    bump_generation()
     return {"ok": True, "id": item_id, "deleted": True}
 
 
@@ -751,7 +1105,7 @@ def _load_stats() -> dict[str, Any]:
 def _save_stats(data: dict[str, Any]):
     stats_file = _stats_file()
     stats_file.parent.mkdir(parents=True, exist_ok=True)
-    stats_file.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    atomic_write_text(stats_file, json.dumps(data, ensure_ascii=False, indent=2), coalesce=True)
 
 
 def _utc_now_z() -> str:
@@ -767,36 +1121,24 @@ def _now_bjt() -> str:
     return datetime.now(_BJT).isoformat()
 
 
-def _is_local_ip(ip: str) -> bool:
-    try:
-        addr = ipaddress.ip_address(ip)
-    except ValueError:
+def _is_local_ip(ip: str | IPAddress) -> bool:
+    addr = parse_ip_address(ip)
+    if addr is None:
         return False
-    # Spec mentions common IPv4 private ranges; include IPv6 local too for safety.
-    if addr.is_loopback:
-        return True
     if addr.version == 4:
-        return (
-            addr in ipaddress.ip_network("10.0.0.0/8")
-            or addr in ipaddress.ip_network("192.168.0.0/16")
-            or addr in ipaddress.ip_network("172.16.0.0/12")
-        )
-    return addr.is_private or addr.is_link_local
+        return _LOCAL_V4_NETS.contains(addr)
+    return addr.is_loopback or addr.is_private or addr.is_link_local
 
 
 def _normalize_ip(ip: str) -> str:
-    try:
-        return str(ipaddress.ip_address((ip or "").strip()))
-    except ValueError:
+    addr = parse_ip_address(ip)
+    if addr is None:
         return (ip or "").strip() or "unknown"
+    return str(addr)
 
 
-def _is_explicitly_excluded_ip(ip: str) -> bool:
-    try:
-        addr = ipaddress.ip_address(ip)
-    except ValueError:
-        return False
-    return any(addr in net for net in _analytics_excluded_nets)
+def _is_explicitly_excluded_ip(ip: str | IPAddress) -> bool:
+    return _analytics_excluded_nets.contains(ip)
 
 
 def _looks_like_manage_source(value: str) -> bool:
@@ -807,10 +1149,10 @@ def _looks_like_manage_source(value: str) -> bool:
 
 
 def _visit_filter_reason(ip: str, *, referer: str = "", origin: str = "", has_admin_session: bool = False) -> str:
-    normalized_ip = _normalize_ip(ip)
-    if _is_local_ip(normalized_ip):
+    addr = parse_ip_address(ip)
+    if addr is not None and _is_local_ip(addr):
         return "local_ip"
-    if _is_explicitly_excluded_ip(normalized_ip):
+    if addr is not None and _is_explicitly_excluded_ip(addr):
         return "excluded_ip"
     if has_admin_session:
         return "admin_session"
@@ -821,70 +1163,6 @@ def _visit_filter_reason(ip: str, *, referer: str = "", origin: str = "", has_ad
     return ""
 
 
-def _get_ip2region_searcher():
-    global _ip2region_searcher, _ip2region_unavailable
-
-    # Fast path: already initialised or permanently unavailable
-    if _ip2region_searcher is not None:
-        return _ip2region_searcher
-    if _ip2region_unavailable:
-        return None
-
-    # Guard: must have a valid DB path
-    if not _IP2REGION_DB_PATH or not _IP2REGION_DB_PATH.exists():
-        _ip2region_unavailable = True
-        return None
-
-    # Thread-safe lazy init
-    with _ip2region_lock:
-        if _ip2region_searcher is not None:
-            return _ip2region_searcher
-        if _ip2region_unavailable:
-            return None
-        try:
-            from ip2region import searcher as ip2r_searcher
-            from ip2region import util as ip2r_util
-
-            buf = ip2r_util.load_content_from_file(str(_IP2REGION_DB_PATH))
-            header = ip2r_util.load_header_from_file(str(_IP2REGION_DB_PATH))
-            ver = ip2r_util.version_from_header(header)
-            _ip2region_searcher = ip2r_searcher.Searcher(ver, str(_IP2REGION_DB_PATH), None, buf)
-            return _ip2region_searcher
-        except Exception:
-            import logging
-            logging.getLogger(__name__).warning("ip2region init failed", exc_info=True)
-            _ip2region_unavailable = True
-            return None
-    if _ip2region_searcher is not None:
-        return _ip2region_searcher
-    # Guard: must have a valid DB path
-    if not _IP2REGION_DB_PATH or not _IP2REGION_DB_PATH.exists():
-        _ip2region_unavailable = True
-        return None
-    # Thread-safe lazy init
-    with _ip2region_lock:
-        if _ip2region_unavailable:
-            return None
-        if _ip2region_searcher is not None:
-            return _ip2region_searcher
-        try:
-            from ip2region import searcher as ip2r_searcher
-            from ip2region import util as ip2r_util
-
-            buf = ip2r_util.load_content_from_file(str(_IP2REGION_DB_PATH))
-            header = ip2r_util.load_header_from_file(str(_IP2REGION_DB_PATH))
-            ver = ip2r_util.version_from_header(header)
-            _ip2region_searcher = ip2r_searcher.Searcher(ver, str(_IP2REGION_DB_PATH), None, buf)
-            return _ip2region_searcher
-        except Exception:
-            import logging
-            logging.getLogger(__name__).warning(
-                "ip2region init failed for path=%s", _IP2REGION_DB_PATH, exc_info=True
-            )
-            _ip2region_unavailable = True
-            return None
-
-
 def _geoip_lookup(ip: str) -> tuple[str, str, str]:
     if not REGION_TRACE_ENABLED:
         return "", "", ""
@@ -892,30 +1170,23 @@ def _geoip_lookup(ip: str) -> tuple[str, str, str]:
         return "", "", ""
     if _is_local_ip(ip):
         return "本地", "", ""
-    s = _get_ip2region_searcher()
-    if not s:
-        return "", "", ""
-    try:
-        # ip2region returns: "国家|省份|城市|ISP|国家代码"
-        # e.g. "中国|湖南省|娄底市|电信|CN"
-        result = s.search(ip)
-        if not result or result == "0|0|0|0|0":
-            return "", "", ""
-        parts = str(result).split("|")
-        # parts: [country, province, city, isp, country_code]
-        country_code = parts[4] if len(parts) > 4 else ""
-        region = parts[1] if len(parts) > 1 else ""  # province
-        city = parts[2] if len(parts) > 2 else ""     # city
-        # Clean up "0" placeholders
-        if city == "0":
-            city = ""
-        if region == "0":
-            region = ""
-        if country_code == "0":
-            country_code = ""
-        return city or "", region or "", country_code or ""
-    except Exception:
-        return "", "", ""
+    return geoip.lookup(ip)
+
+
+def _geoip_lookup_many(ips) -> dict[str, tuple[str, str, str]]:
+    if not REGION_TRACE_ENABLED:
+        return {}
+    out: dict[str, tuple[str, str, str]] = {}
+    public: list[str] = []
+    for ip in ips:
+        if not ip:
+            continue
+        if _is_local_ip(ip):
+            out[ip] = ("本地", "", "")
+        else:
+            public.append(ip)
+    out.update(geoip.lookup_many(public))
+    return out
 
 
 def _rotate_visits_if_needed():
@@ -1012,6 +1283,44 @@ def record_visit(
             )
         except Exception:
             pass
+    if ANALYTICS_WRITE_LEGACY or ANALYTICS_WRITE_SQLITE:
+        # Same timestamp flavour get_all_stats reports as last_visit.
+        last_visit = now_bjt if ANALYTICS_READ_SQLITE and ANALYTICS_WRITE_SQLITE else now_utc
+        # Also carries the visits-generation bump, so ETags move once per batch.
+        _queue_dashboard_visit(_owner_id(), sk, last_visit, now_bjt[:10])
+
+
+def _queue_dashboard_visit(owner_id: str, stats_key: str, visited_at: str, today_date: str) -> None:
+    global _dashboard_flush_timer
+    with _dashboard_visits_guard:
+        _pending_dashboard_visits.append((owner_id, stats_key, visited_at, today_date))
+        flush_now = not _DASHBOARD_FLUSH_S
+        if not flush_now and _dashboard_flush_timer is None:
+            _dashboard_flush_timer = threading.Timer(_DASHBOARD_FLUSH_S, flush_dashboard_visits)
+            _dashboard_flush_timer.daemon = True
+            _dashboard_flush_timer.start()
+    if flush_now:
+        flush_dashboard_visits()
+
+
+def flush_dashboard_visits() -> int:
+    """Write the queued dashboard visit counters; returns how many visits were written."""
+    global _dashboard_flush_timer
+    with _dashboard_visits_guard:
+        batch = list(_pending_dashboard_visits)
+        _pending_dashboard_visits.clear()
+        _dashboard_flush_timer = None
+    if not batch:
+        return 0
+    try:
+        record_dashboard_visits(batch)
+    except Exception:
+        # Never break album rendering on analytics failures.
+        pass
+    return len(batch)
+
+
+atexit.register(flush_dashboard_visits)
 
 
 def get_all_stats() -> dict[str, Any]:
@@ -1035,48 +1344,129 @@ def _legacy_has_visit_data() -> bool:
     return False
 
 
-def _iter_visit_records_legacy():
-    yield from _iter_jsonl(_visits_old_file())
-    yield from _iter_jsonl(_visits_file())
+def _iter_visit_records_legacy(*, since: str = "", until: str = "", stats_key: str = ""):
+    for path in (_visits_old_file(), _visits_file()):
+        for rec in _iter_jsonl(path):
+            if stats_key and str(rec.get("token") or "") != stats_key:
+                continue
+            t = str(rec.get("time") or "")
+            if since and t < since:
+                continue
+            if until and t > until:
+                continue
+            yield rec
 
 
-def backfill_sqlite_from_legacy() -> dict[str, int]:
-    owner_id = _owner_id()
-    events_backfilled = 0
+_BACKFILL_CHUNK = 2000
+
+
+def _iter_legacy_visit_chunks(path: Path, chunk_size: int = _BACKFILL_CHUNK, tally: Counter[str] | None = None):
+    """Yield lists of (line_no, record) from a legacy JSONL file.
+
+    Lines that are not a JSON object with a token are counted in
+    ``tally["rows_skipped"]``.
+    """
+    tally = Counter() if tally is None else tally
+    chunk: list[tuple[int, dict[str, Any]]] = []
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                tally["rows_skipped"] += 1
+                continue
+            if not isinstance(rec, dict) or not str(rec.get("token") or ""):
+                tally["rows_skipped"] += 1
+                continue
+            chunk.append((line_no, rec))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def _legacy_backfill_row(path: Path, line_no: int, rec: dict[str, Any], location: tuple[str, str, str] | None) -> dict[str, str]:
+    city = str(rec.get("city") or "")
+    region = str(rec.get("region") or "")
+    country = str(rec.get("country") or "")
+    if location is not None:
+        city, region, country = location
+    token = str(rec.get("token") or "")
+    return {
+        "source_key": f"legacy:{path.name}:{line_no}",
+        "album_key": token,
+        "stats_key": token,
+        "ip_norm": _normalize_ip(str(rec.get("ip") or "")),
+        "ua": str(rec.get("ua") or ""),
+        "city": city,
+        "region": region,
+        "country": country,
+        "visited_at": str(rec.get("time") or "") or _now_bjt(),
+    }
+
+
+def _iter_legacy_backfill_rows(*, regeolocate: bool = False, tally: Counter[str] | None = None):
+    """Yield backfill rows from both legacy visit files.
+
+    Failures are contained and counted in ``tally``: an unreadable record in
+    ``rows_skipped``, records left with their stored location because the
+    GeoIP lookup for their chunk failed in ``rows_unlocated``, and files that
+    could not be read to the end in ``files_failed``.
+    """
+    tally = Counter() if tally is None else tally
     for path in (_visits_old_file(), _visits_file()):
         if not path.exists():
             continue
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                for line_no, line in enumerate(f, start=1):
+            for chunk in _iter_legacy_visit_chunks(path, tally=tally):
+                to_locate = {
+                    line_no: _normalize_ip(str(rec.get("ip") or ""))
+                    for line_no, rec in chunk
+                    if regeolocate or not (rec.get("city") or rec.get("region") or rec.get("country"))
+                }
+                try:
+                    located = _geoip_lookup_many(list(to_locate.values())) if to_locate else {}
+                except Exception:
+                    logger.warning("GeoIP lookup failed for %d records in %s", len(to_locate), path, exc_info=True)
+                    tally["rows_unlocated"] += len(to_locate)
+                    located = {}
+                for line_no, rec in chunk:
+                    ip = to_locate.get(line_no)
                     try:
-                        rec = json.loads((line or "").strip())
+                        row = _legacy_backfill_row(path, line_no, rec, located.get(ip) if ip is not None else None)
                     except Exception:
+                        logger.warning("skipping unreadable visit record %s:%d", path, line_no, exc_info=True)
+                        tally["rows_skipped"] += 1
                         continue
-                    if not isinstance(rec, dict):
-                        continue
-                    token = str(rec.get("token") or "")
-                    if not token:
-                        continue
-                    ip = _normalize_ip(str(rec.get("ip") or ""))
-                    visited_at = str(rec.get("time") or "") or _now_bjt()
-                    result = record_sqlite_visit(
-                        owner_id=owner_id,
-                        album_key=token,
-                        stats_key=token,
-                        ip_norm=ip,
-                        ua=str(rec.get("ua") or ""),
-                        city=str(rec.get("city") or ""),
-                        region=str(rec.get("region") or ""),
-                        country=str(rec.get("country") or ""),
-                        visited_at=visited_at,
-                        filter_reason="",
-                        source_key=f"legacy:{path.name}:{line_no}",
-                    )
-                    if result.get("event_inserted"):
-                        events_backfilled += 1
-        except Exception:
-            continue
+                    yield row
+        except OSError:
+            logger.warning("could not read legacy visit log %s", path, exc_info=True)
+            tally["files_failed"] += 1
+
+
+def backfill_sqlite_from_legacy(*, regeolocate: bool = False, progress=None) -> dict[str, int]:
+    """Copy legacy JSONL visits into SQLite in one bulk transaction.
+
+    Records without a location (or all records when ``regeolocate`` is set)
+    are resolved through one batched GeoIP lookup per chunk; with
+    ``regeolocate`` the new locations also replace those of records imported
+    earlier. ``progress`` is called with the number of rows staged so far.
+    Records that could not be imported or located are counted in
+    ``rows_skipped``/``rows_unlocated``, unreadable files in ``files_failed``.
+    """
+    owner_id = _owner_id()
+    tally: Counter[str] = Counter()
+    report = bulk_import_visits(
+        owner_id,
+        _iter_legacy_backfill_rows(regeolocate=regeolocate, tally=tally),
+        batch_size=_BACKFILL_CHUNK,
+        progress=progress,
+        update_locations=regeolocate,
+    )
+    events_backfilled = int(report["events_inserted"])
 
     stats_seeded = 0
     for stats_key, entry in _load_stats().items():
@@ -1091,7 +1481,18 @@ def backfill_sqlite_from_legacy() -> dict[str, int]:
         )
         stats_seeded += 1
 
-    return {"stats_seeded": stats_seeded, "events_backfilled": events_backfilled}
+    mark_dashboard_dirty(owner_id)
+    bump_owner_generation(owner_id, visits=True)
+    return {
+        "stats_seeded": stats_seeded,
+        "events_backfilled": events_backfilled,
+        "rows_read": int(report["rows_read"]),
+        "duplicates": int(report["duplicates"]),
+        "locations_updated": int(report.get("locations_updated", 0)),
+        "rows_skipped": tally["rows_skipped"],
+        "rows_unlocated": tally["rows_unlocated"],
+        "files_failed": tally["files_failed"],
+    }
 
 
 def compare_analytics_sources(limit: int = 20) -> dict[str, Any]:
@@ -1142,17 +1543,36 @@ def _iter_jsonl(path: Path):
         return
 
 
-def iter_visit_records():
-    if ANALYTICS_READ_SQLITE:
+def _analytics_reads_sqlite() -> bool:
+    if not ANALYTICS_READ_SQLITE:
+        return False
+    try:
+        return has_sqlite_visit_events(_owner_id()) or not _legacy_has_visit_data()
+    except Exception:
+        return False
+
+
+def iter_visit_records(*, since: str = "", until: str = "", stats_key: str = ""):
+    """Yield visit records oldest first.
+
+    ``since``/``until`` are inclusive ISO-string bounds and ``stats_key`` an
+    exact token match; callers that need exact day boundaries across time
+    zones should still re-check each record.
+    """
+    if _analytics_reads_sqlite():
+        yielded = False
         try:
-            rows = list(iter_sqlite_visit_events(_owner_id()))
-            if rows or not _legacy_has_visit_data():
-                yield from rows
-                return
+            for row in iter_sqlite_visit_events(_owner_id(), since=since, until=until, stats_key=stats_key):
+                yielded = True
+                yield row
+            return
         except Exception:
-            pass
+            # Once rows have gone out, replaying the legacy files would
+            # double-count them; only a failure before the first row falls back.
+            if yielded:
+                raise
     # Old file first, then current file. Both are capped by rotation (10MB each).
-    yield from _iter_visit_records_legacy()
+    yield from _iter_visit_records_legacy(since=since, until=until, stats_key=stats_key)
 
 
 def _normalize_city(city: str, ip: str) -> str:
@@ -1162,13 +1582,126 @@ def _normalize_city(city: str, ip: str) -> str:
     return c
 
 
+def _dashboard_key(d: Path) -> str | None:
+    # Mirrors build_tree: the root itself and hidden/underscore folders don't count.
+    key = _folder_key(d)
+    if key is None or key == "." or any(part.startswith(("_", ".")) for part in key.split("/")):
+        return None
+    return key
+
+
+def _note_folder_images(d: Path, count: int | None = None) -> None:
+    """Keep the dashboard's per-folder image count current; count=None rescans d."""
+    bump_generation()
+    key = _dashboard_key(d)
+    if key is None:
+        return
+    if count is None:
+        count = len(_image_names(scan_dir(d)))
+    set_dashboard_folder_count(_owner_id(), key, count)
+
+
+def invalidate_dashboard() -> None:
+    """Recount the dashboard on its next read (folders moved, copied or restored)."""
+    mark_dashboard_dirty(_owner_id())
+    bump_generation()
+
+
+def bump_generation(*, visits: bool = False) -> None:
+    """Invalidate the current owner's JSON ETags; call after the change is on disk.
+
+    visits=True is for visit counters only, which leaves the folder/album
+    listings' ETags alone.
+    """
+    bump_owner_generation(_owner_id(), visits=visits)
+
+
+def generation_etag(*, content: bool = True, visits: bool = False, daily: bool = False) -> str:
+    """ETag for a JSON view of the current owner's data, from one primary-key lookup.
+
+    content/visits pick the generations the view depends on; daily adds the
+    BJT date for views that roll over at midnight.
+    """
+    owner = _owner_id()
+    if visits:
+        # Visits still queued in this worker would otherwise keep the old tag.
+        flush_dashboard_visits()
+    content_gen, visits_gen = load_owner_generation(owner)
+    parts = [owner]
+    if content:
+        parts.append(f"c{content_gen}")
+    if visits:
+        parts.append(f"v{visits_gen}")
+    if daily:
+        parts.append(datetime.now(_BJT).date().isoformat())
+    return '"' + "-".join(parts) + '"'
+
+
+def _rebuild_dashboard(owner: str) -> None:
+    folders: dict[str, int] = {}
+    stack = [(_current_root(), "", scan_dir(_current_root()))]
+    while stack:
+        d, rel, entries = stack.pop()
+        for child in _visible_child_dirs(d, entries):
+            child_rel = f"{rel}/{child.name}" if rel else child.name
+            child_entries = scan_dir(child)
+            folders[child_rel] = len(_image_names(child_entries))
+            stack.append((child, child_rel, child_entries))
+
+    stats = get_all_stats()
+    total_visits = 0
+    activities = []
+    for sk, entry in stats.items():
+        if not isinstance(entry, dict):
+            continue
+        views = int(entry.get("views", 0) or 0)
+        total_visits += views
+        if "last_visit" in entry:
+            activities.append({"stats_key": str(sk or ""), "views": views, "last_visit": str(entry.get("last_visit") or "")})
+    today = get_daily_views(days=1)[-1]
+    replace_dashboard(
+        owner,
+        folders=folders,
+        total_visits=total_visits,
+        today_date=str(today["date"]),
+        today_visits=int(today["views"]),
+        activities=activities,
+    )
+
+
+def get_dashboard_summary(limit: int = 10) -> dict[str, Any]:
+    """Dashboard counters from the materialized summary, rebuilt only when missing or dirty."""
+    owner = _owner_id()
+    # This worker's queued visits first, so they are neither missing from the
+    # summary nor added again on top of a rebuild that already counted them.
+    flush_dashboard_visits()
+    data = load_dashboard(owner, limit)
+    if data is None:
+        _rebuild_dashboard(owner)
+        data = load_dashboard(owner, limit) or {}
+    today = datetime.now(_BJT).date().isoformat()
+    if data.get("today_date") != today:
+        data["today_visits"] = 0
+    data["today_date"] = today
+    untitled = {a["stats_key"]: infer_token_title(a["stats_key"]) for a in data.get("activities", []) if a["title"] is None}
+    if untitled:
+        set_dashboard_titles(owner, untitled)
+        for a in data["activities"]:
+            if a["title"] is None:
+                a["title"] = untitled[a["stats_key"]]
+    return data
+
+
 def get_daily_views(days: int = 7) -> list[dict[str, int | str]]:
     days = max(1, int(days or 7))
     today = datetime.now(_BJT).date()
     start_day = today - timedelta(days=days - 1)
     day_counts: dict[str, int] = {}
+    # Stored times mix "+08:00" and "Z" suffixes, so give the string bound a
+    # day of slack and let the exact date check below do the filtering.
+    since = (start_day - timedelta(days=1)).isoformat()
 
-    for rec in iter_visit_records():
+    for rec in iter_visit_records(since=since):
         t = str(rec.get("time") or "")
         if not t:
             continue
@@ -1191,8 +1724,40 @@ def get_daily_views(days: int = 7) -> list[dict[str, int | str]]:
     return result
 
 
-def _get_analytics_from_records(records, *, limit: int = 1000, include_local: bool = False) -> dict[str, Any]:
+def _cross_visit_from_counters(
+    ip_token: dict[str, Counter[str]], ip_city: dict[str, Counter[str]]
+) -> list[dict[str, Any]]:
+    cross_visit = []
+    for ip, tok_ctr in ip_token.items():
+        tokens = [t for t, c in tok_ctr.items() if t and c > 0]
+        if len(tokens) < 2:
+            continue
+        tokens_sorted = [t for t, _ in sorted(tok_ctr.items(), key=lambda x: (-x[1], x[0])) if t]
+        city = ""
+        if ip in ip_city and ip_city[ip]:
+            city = ip_city[ip].most_common(1)[0][0]
+        cross_visit.append(
+            {
+                "ip": ip,
+                "city": city,
+                "tokens": tokens_sorted,
+                "count": int(sum(tok_ctr.values())),
+            }
+        )
+    cross_visit.sort(key=lambda x: (-int(x.get("count") or 0), str(x.get("ip") or "")))
+    return cross_visit
+
+
+def _get_analytics_from_records(
+    records,
+    *,
+    limit: int = 1000,
+    include_local: bool = False,
+    cross_visit: list[dict[str, Any]] | None = None,
+) -> dict[str, Any]:
+    """Aggregate visit records; pass ``cross_visit`` to skip the per-IP pass."""
     limit = max(1, min(int(limit or 1000), 5000))
+    track_cross = cross_visit is None
 
     recent = deque(maxlen=limit)
     by_city: Counter[str] = Counter()
@@ -1222,29 +1787,13 @@ def _get_analytics_from_records(records, *, limit: int = 1000, include_local: bo
         by_city[city] += 1
         if ip:
             unique_ips.add(ip)
-            if token:
+            if track_cross and token:
                 ip_token[ip][token] += 1
-            if city:
+            if track_cross and city:
                 ip_city[ip][city] += 1
 
-    cross_visit = []
-    for ip, tok_ctr in ip_token.items():
-        tokens = [t for t, c in tok_ctr.items() if t and c > 0]
-        if len(tokens) < 2:
-            continue
-        tokens_sorted = [t for t, _ in sorted(tok_ctr.items(), key=lambda x: (-x[1], x[0])) if t]
-        city = ""
-        if ip in ip_city and ip_city[ip]:
-            city = ip_city[ip].most_common(1)[0][0]
-        cross_visit.append(
-            {
-                "ip": ip,
-                "city": city,
-                "tokens": tokens_sorted,
-                "count": int(sum(tok_ctr.values())),
-            }
-        )
-    cross_visit.sort(key=lambda x: (-int(x.get("count") or 0), str(x.get("ip") or "")))
+    if cross_visit is None:
+        cross_visit = _cross_visit_from_counters(ip_token, ip_city)
 
     today = datetime.now(_BJT).date().isoformat()
     today_count = int(by_date.get(today, 0))
@@ -1265,8 +1814,57 @@ def _get_analytics_from_records(records, *, limit: int = 1000, include_local: bo
     }
 
 
-def get_analytics(limit: int = 1000, include_local: bool = False) -> dict[str, Any]:
-    return _get_analytics_from_records(iter_visit_records(), limit=limit, include_local=include_local)
+def _cross_visits_from_sqlite(owner_id: str, *, limit: int, offset: int = 0) -> dict[str, Any]:
+    page = get_cross_visits(owner_id, limit=limit, offset=offset)
+    for item in page["items"]:
+        item["city"] = _normalize_city(str(item.get("city") or ""), str(item.get("ip") or ""))
+    return page
+
+
+def get_cross_visit_page(limit: int = 50, offset: int = 0) -> dict[str, Any]:
+    limit = max(1, min(int(limit or 50), 1000))
+    offset = max(0, int(offset or 0))
+    if _analytics_reads_sqlite():
+        try:
+            return _cross_visits_from_sqlite(_owner_id(), limit=limit, offset=offset)
+        except Exception:
+            pass
+    ip_token: dict[str, Counter[str]] = defaultdict(Counter)
+    ip_city: dict[str, Counter[str]] = defaultdict(Counter)
+    for rec in _iter_visit_records_legacy():
+        ip = str(rec.get("ip") or "")
+        token = str(rec.get("token") or "")
+        if not ip:
+            continue
+        if token:
+            ip_token[ip][token] += 1
+        ip_city[ip][_normalize_city(str(rec.get("city") or ""), ip)] += 1
+    items = _cross_visit_from_counters(ip_token, ip_city)
+    return {"items": items[offset : offset + limit], "total": len(items), "limit": limit, "offset": offset}
+
+
+def get_analytics(limit: int = 1000, include_local: bool = False, cross_limit: int = 200) -> dict[str, Any]:
+    """Visit analytics; ``cross_visit`` holds the busiest ``cross_limit`` visitors
+    and ``cross_visit_total`` how many there are in all."""
+    cross_limit = max(1, int(cross_limit or 200))
+    if _analytics_reads_sqlite():
+        try:
+            cross = _cross_visits_from_sqlite(_owner_id(), limit=cross_limit)
+        except Exception:
+            cross = None
+        if cross is not None:
+            data = _get_analytics_from_records(
+                iter_visit_records(),
+                limit=limit,
+                include_local=include_local,
+                cross_visit=cross["items"],
+            )
+            data["cross_visit_total"] = int(cross["total"])
+            return data
+    data = _get_analytics_from_records(_iter_visit_records_legacy(), limit=limit, include_local=include_local)
+    data["cross_visit_total"] = len(data["cross_visit"])
+    data["cross_visit"] = data["cross_visit"][:cross_limit]
+    return data
 
 
 def _load_slugs_from_fs() -> dict[str, Any]:
@@ -1299,9 +1897,14 @@ def _load_slugs() -> dict[str, Any]:
 def _save_slugs(data: dict[str, Any]):
     slugs_file = _slugs_file()
     slugs_file.parent.mkdir(parents=True, exist_ok=True)
-    slugs_file.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    # Slugs are the public links: always durable, including the rename itself.
+    atomic_write_text(slugs_file, json.dumps(data, ensure_ascii=False, indent=2), dir_fsync=True)
     if metadata_backend() in {"dual", "sqlite"}:
         save_slugs_snapshot(data)
+    # Titles of untitled tokens can come from slugs.
+    forget_token_summaries()
+    forget_dashboard_titles()
+    bump_generation()
 
 
 def _slug_entry_owner(entry: Any) -> str:
@@ -0,0 +1,154 @@
+"""Resumable chunked uploads.
+
+A session reserves a sparse ``<id>.part`` file of the announced size under
+_system/upload_sessions/<owner>/ and records which byte ranges have arrived
+in ``<id>.json``. Chunks may come in any order and from parallel streams
+(or different uvicorn workers): each one is written with ``pwrite`` at its
+offset and merged into the range list under a per-session ``FileLock``.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import secrets
+import time
+from pathlib import Path
+from typing import Any
+
+from app.atomic_io import atomic_write_text
+from app.locks import FileLock
+from app.users import SYSTEM_DIR
+
+SESSIONS_DIR = SYSTEM_DIR / "upload_sessions"
+SESSION_TTL_S = max(300, int(os.environ.get("UPLOAD_SESSION_TTL_S", str(24 * 3600))))
+CHUNK_MAX_BYTES = max(1, int(os.environ.get("UPLOAD_CHUNK_MAX_MB", "16"))) * 1024 * 1024
+
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+
+def _session_dir(owner_id: str) -> Path:
+    return SESSIONS_DIR / owner_id
+
+
+def _meta_path(owner_id: str, session_id: str) -> Path:
+    return _session_dir(owner_id) / f"{session_id}.json"
+
+
+def part_path(owner_id: str, session_id: str) -> Path:
+    return _session_dir(owner_id) / f"{session_id}.part"
+
+
+def session_lock(owner_id: str, session_id: str) -> FileLock:
+    return FileLock(_session_dir(owner_id) / f".{session_id}.lock")
+
+
+def merge_range(ranges: list[list[int]], start: int, end: int) -> list[list[int]]:
+    """Add [start, end) to a sorted list of disjoint ranges, merging overlaps and neighbours."""
+    out: list[list[int]] = []
+    for s, e in sorted([*ranges, [start, end]]):
+        if out and s <= out[-1][1]:
+            out[-1][1] = max(out[-1][1], e)
+        else:
+            out.append([s, e])
+    return out
+
+
+def missing_ranges(ranges: list[list[int]], size: int) -> list[list[int]]:
+    gaps: list[list[int]] = []
+    pos = 0
+    for s, e in ranges:
+        if s > pos:
+            gaps.append([pos, s])
+        pos = max(pos, e)
+    if pos < size:
+        gaps.append([pos, size])
+    return gaps
+
+
+def _write_meta(path: Path, meta: dict[str, Any]) -> None:
+    atomic_write_text(path, json.dumps(meta, ensure_ascii=False), fsync=False)
+
+
+def create_session(owner_id: str, *, kind: str, size: int, filename: str, path: str, sha256: str = "", **extra: Any) -> dict[str, Any]:
+    purge_expired()
+    session_id = secrets.token_urlsafe(16)
+    d = _session_dir(owner_id)
+    d.mkdir(parents=True, exist_ok=True)
+    with part_path(owner_id, session_id).open("wb") as f:
+        f.truncate(size)
+    meta = {
+        "id": session_id,
+        "kind": kind,
+        "size": size,
+        "filename": filename,
+        "path": path,
+        "sha256": sha256.lower(),
+        "received": [],
+        "created_at": time.time(),
+        **extra,
+    }
+    _write_meta(_meta_path(owner_id, session_id), meta)
+    return meta
+
+
+def load_session(owner_id: str, session_id: str) -> dict[str, Any] | None:
+    if not _SESSION_ID_RE.match(session_id or ""):
+        return None
+    try:
+        meta = json.loads(_meta_path(owner_id, session_id).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return meta if isinstance(meta, dict) else None
+
+
+def write_chunk(owner_id: str, session_id: str, offset: int, data: bytes) -> dict[str, Any]:
+    """Write data at offset and record the range; returns the updated session."""
+    fd = os.open(part_path(owner_id, session_id), os.O_WRONLY)
+    try:
+        view = memoryview(data)
+        pos = offset
+        while view:
+            n = os.pwrite(fd, view, pos)
+            view = view[n:]
+            pos += n
+    finally:
+        os.close(fd)
+    with session_lock(owner_id, session_id):
+        meta = load_session(owner_id, session_id)
+        if meta is None:
+            raise FileNotFoundError(session_id)
+        meta["received"] = merge_range(meta.get("received") or [], offset, offset + len(data))
+        _write_meta(_meta_path(owner_id, session_id), meta)
+    return meta
+
+
+def drop_session(owner_id: str, session_id: str, *, keep_part: bool = False) -> None:
+    if not _SESSION_ID_RE.match(session_id or ""):
+        return
+    if not keep_part:
+        part_path(owner_id, session_id).unlink(missing_ok=True)
+    _meta_path(owner_id, session_id).unlink(missing_ok=True)
+    (_session_dir(owner_id) / f".{session_id}.lock").unlink(missing_ok=True)
+
+
+def purge_expired(now: float | None = None) -> int:
+    now = time.time() if now is None else now
+    removed = 0
+    try:
+        owners = [e for e in os.scandir(SESSIONS_DIR) if e.is_dir()]
+    except FileNotFoundError:
+        return 0
+    for owner in owners:
+        for entry in os.scandir(owner.path):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                expired = now - entry.stat().st_mtime > SESSION_TTL_S
+            except FileNotFoundError:
+                continue
+            if expired:
+                drop_session(owner.name, entry.name[: -len(".json")])
+                removed += 1
+    return removed
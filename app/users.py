@@ -1,13 +1,17 @@
 import hashlib
+import hmac
 import os
 import secrets
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from contextvars import ContextVar
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import cast, TypedDict
 
-from app.config import BASE_DIR, UPLOAD_SECRET
+from app.config import AUTH_CACHE_SIZE, AUTH_CACHE_TTL_S, BASE_DIR, UPLOAD_SECRET
 
 LEGACY_USER_ID = "legacy-admin"
 USERS_ROOT = (BASE_DIR / "_users").resolve()
@@ -30,6 +34,24 @@ class UserRecord(TypedDict):
 _current_user: ContextVar[UserRecord | None] = ContextVar("current_user", default=None)
 _current_root: ContextVar[Path] = ContextVar("current_root", default=BASE_DIR)
 
+# Successful credential checks, keyed by HMAC(process-local key, credential) so
+# plaintext secrets never sit in memory as dict keys. Entries hold the verified
+# user record and a monotonic expiry; any user write clears the whole cache.
+_credential_cache_key = secrets.token_bytes(32)
+_credential_cache: OrderedDict[bytes, tuple[float, UserRecord]] = OrderedDict()
+_credential_cache_lock = threading.Lock()
+
+# Cookie sessions -> user record. An entry lives until the session's own
+# expires_at or AUTH_CACHE_TTL_S, whichever comes first; the TTL bounds how
+# long a logout in another worker process can go unnoticed here.
+_session_cache: OrderedDict[str, tuple[float, UserRecord]] = OrderedDict()
+_session_cache_lock = threading.Lock()
+_SESSION_PURGE_INTERVAL_S = 3600.0
+
+_legacy_password_lock = threading.Lock()
+_legacy_password_synced = False
+_last_session_purge = 0.0
+
 
 def _utc_now() -> str:
     return datetime.now(timezone.utc).isoformat()
@@ -114,26 +136,68 @@ def init_user_store() -> None:
     finally:
         conn.close()
     ensure_legacy_user()
+    purge_expired_sessions()
 
 
 def ensure_legacy_user() -> None:
+    """Make sure the legacy admin row exists with the expected attributes.
+
+    Only a first boot hashes UPLOAD_SECRET here. Checking an existing hash
+    costs a full scrypt run, so it is deferred to the first password login as
+    ``admin`` (see ``_sync_legacy_password``). Requests that send
+    UPLOAD_SECRET itself never read the stored hash.
+    """
+    global _legacy_password_synced
     conn = _connect()
     try:
-        row = conn.execute("SELECT id FROM users WHERE id = ?", (LEGACY_USER_ID,)).fetchone()
-        password_hash = _hash_password(UPLOAD_SECRET)
-        if row:
-            _ = conn.execute(
-                "UPDATE users SET username = ?, password_hash = ?, root_path = ?, role = 'admin', is_active = 1, is_legacy = 1 WHERE id = ?",
-                ("admin", password_hash, str(BASE_DIR), LEGACY_USER_ID),
-            )
-        else:
+        row = conn.execute("SELECT * FROM users WHERE id = ?", (LEGACY_USER_ID,)).fetchone()
+        if row is None:
             _ = conn.execute(
                 "INSERT INTO users (id, username, password_hash, root_path, role, is_active, is_legacy, created_at) VALUES (?, ?, ?, ?, 'admin', 1, 1, ?)",
-                (LEGACY_USER_ID, "admin", password_hash, str(BASE_DIR), _utc_now()),
+                (LEGACY_USER_ID, "admin", _hash_password(UPLOAD_SECRET), str(BASE_DIR), _utc_now()),
             )
-        conn.commit()
+            conn.commit()
+            _legacy_password_synced = True
+        else:
+            if not (
+                row["username"] == "admin"
+                and row["root_path"] == str(BASE_DIR)
+                and row["role"] == "admin"
+                and bool(row["is_active"])
+                and bool(row["is_legacy"])
+            ):
+                _ = conn.execute(
+                    "UPDATE users SET username = ?, root_path = ?, role = 'admin', is_active = 1, is_legacy = 1 WHERE id = ?",
+                    ("admin", str(BASE_DIR), LEGACY_USER_ID),
+                )
+                conn.commit()
+            _legacy_password_synced = False
     finally:
         conn.close()
+    invalidate_credential_cache()
+
+
+def _sync_legacy_password() -> None:
+    """Re-hash UPLOAD_SECRET into the legacy row if it no longer verifies."""
+    global _legacy_password_synced
+    if _legacy_password_synced:
+        return
+    with _legacy_password_lock:
+        if _legacy_password_synced:
+            return
+        conn = _connect()
+        try:
+            row = conn.execute("SELECT password_hash FROM users WHERE id = ?", (LEGACY_USER_ID,)).fetchone()
+            if row is not None and not verify_password(UPLOAD_SECRET, row["password_hash"]):
+                _ = conn.execute(
+                    "UPDATE users SET password_hash = ? WHERE id = ?",
+                    (_hash_password(UPLOAD_SECRET), LEGACY_USER_ID),
+                )
+                conn.commit()
+        finally:
+            conn.close()
+        _legacy_password_synced = True
+    invalidate_credential_cache()
 
 
 def list_users() -> list[UserRecord]:
@@ -165,6 +229,9 @@ def get_user_by_id(user_id: str) -> UserRecord | None:
 
 def authenticate(username: str, password: str) -> UserRecord | None:
     user = get_user_by_username(username)
+    if user and user["is_legacy"] and not _legacy_password_synced:
+        _sync_legacy_password()
+        user = get_user_by_username(username)
     if not user or not user.get("is_active"):
         return None
     if not verify_password(password, user["password_hash"]):
@@ -172,10 +239,55 @@ def authenticate(username: str, password: str) -> UserRecord | None:
     return user
 
 
+def _credential_digest(raw: str) -> bytes:
+    return hmac.new(_credential_cache_key, raw.encode("utf-8"), hashlib.sha256).digest()
+
+
+def _cached_credential(digest: bytes) -> UserRecord | None:
+    with _credential_cache_lock:
+        entry = _credential_cache.get(digest)
+        if entry is None:
+            return None
+        expires, user = entry
+        if expires <= time.monotonic():
+            del _credential_cache[digest]
+            return None
+        _credential_cache.move_to_end(digest)
+        return user
+
+
+def _remember_credential(digest: bytes, user: UserRecord) -> None:
+    if AUTH_CACHE_TTL_S <= 0 or AUTH_CACHE_SIZE <= 0:
+        return
+    with _credential_cache_lock:
+        _credential_cache[digest] = (time.monotonic() + AUTH_CACHE_TTL_S, user)
+        _credential_cache.move_to_end(digest)
+        while len(_credential_cache) > AUTH_CACHE_SIZE:
+            _credential_cache.popitem(last=False)
+
+
+def invalidate_credential_cache() -> None:
+    with _credential_cache_lock:
+        _credential_cache.clear()
+    with _session_cache_lock:
+        _session_cache.clear()
+
+
 def authenticate_credential(credential: str) -> UserRecord | None:
     raw = (credential or "").strip()
     if not raw:
         return None
+    digest = _credential_digest(raw)
+    cached = _cached_credential(digest)
+    if cached is not None:
+        return cached
+    user = _authenticate_credential_uncached(raw)
+    if user is not None:
+        _remember_credential(digest, user)
+    return user
+
+
+def _authenticate_credential_uncached(raw: str) -> UserRecord | None:
     if raw == UPLOAD_SECRET:
         return get_user_by_id(LEGACY_USER_ID)
     if ":" not in raw:
@@ -198,10 +310,14 @@ def create_session(user_id: str) -> str:
         conn.commit()
     finally:
         conn.close()
+    if time.monotonic() - _last_session_purge >= _SESSION_PURGE_INTERVAL_S:
+        purge_expired_sessions()
     return session_id
 
 
 def delete_session(session_id: str) -> None:
+    with _session_cache_lock:
+        _session_cache.pop(session_id, None)
     conn = _connect()
     try:
         _ = conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
@@ -210,18 +326,69 @@ def delete_session(session_id: str) -> None:
         conn.close()
 
 
+def purge_expired_sessions() -> int:
+    """Delete every expired session row in one statement; returns the count."""
+    global _last_session_purge
+    _last_session_purge = time.monotonic()
+    now = time.time()
+    with _session_cache_lock:
+        for sid in [sid for sid, (expires, _user) in _session_cache.items() if expires <= now]:
+            del _session_cache[sid]
+    conn = _connect()
+    try:
+        cur = conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (_utc_now(),))
+        conn.commit()
+        return cur.rowcount
+    finally:
+        conn.close()
+
+
+def _cached_session(session_id: str) -> UserRecord | None:
+    with _session_cache_lock:
+        entry = _session_cache.get(session_id)
+        if entry is None:
+            return None
+        expires, user = entry
+        if expires <= time.time():
+            del _session_cache[session_id]
+            return None
+        _session_cache.move_to_end(session_id)
+        return user
+
+
+def _remember_session(session_id: str, user: UserRecord, expires_at: str) -> None:
+    if AUTH_CACHE_TTL_S <= 0 or AUTH_CACHE_SIZE <= 0:
+        return
+    try:
+        session_expiry = datetime.fromisoformat(expires_at).timestamp()
+    except ValueError:
+        return
+    expires = min(session_expiry, time.time() + AUTH_CACHE_TTL_S)
+    with _session_cache_lock:
+        _session_cache[session_id] = (expires, user)
+        _session_cache.move_to_end(session_id)
+        while len(_session_cache) > AUTH_CACHE_SIZE:
+            _session_cache.popitem(last=False)
+
+
 def get_user_by_session(session_id: str | None) -> UserRecord | None:
     if not session_id:
         return None
+    cached = _cached_session(session_id)
+    if cached is not None:
+        return cached
     conn = _connect()
     try:
         row = conn.execute(
-            "SELECT u.* FROM sessions s JOIN users u ON u.id = s.user_id WHERE s.session_id = ? AND s.expires_at > ?",
+            "SELECT u.*, s.expires_at AS session_expires_at FROM sessions s JOIN users u ON u.id = s.user_id WHERE s.session_id = ? AND s.expires_at > ?",
             (session_id, _utc_now()),
         ).fetchone()
-        return _normalize_user(row)
+        user = _normalize_user(row)
     finally:
         conn.close()
+    if user is not None and row is not None:
+        _remember_session(session_id, user, row["session_expires_at"])
+    return user
 
 
 def create_user(username: str, password: str) -> UserRecord:
@@ -258,6 +425,7 @@ def create_user(username: str, password: str) -> UserRecord:
         conn.commit()
     finally:
         conn.close()
+    invalidate_credential_cache()
     return get_user_by_id(user_id) or user
 
 
@@ -476,6 +476,18 @@ document.addEventListener('DOMContentLoaded', () => {
         renderHomeUploadPreview();
     }
 
+    // ZIP imports run as background jobs: poll until the job settles.
+    async function waitForImportJob(resp) {
+        if (!resp || resp.ok !== true || !resp.job_id) return resp;
+        for (;;) {
+            await new Promise(resolve => setTimeout(resolve, 500));
+            const job = await window.PushFileAuth.apiGet('/api/upload/jobs/' + encodeURIComponent(resp.job_id), { base });
+            if (!job || job.ok !== true) return job;
+            if (job.status === 'done') return job;
+            if (job.status === 'failed') return { ok: false, detail: job.error || 'ZIP 导入失败' };
+        }
+    }
+
     function initHomeUpload() {
         const zone = document.getElementById('homeUploadZone');
         const fileInput = document.getElementById('homeUploadFileInput');
@@ -577,7 +589,8 @@ document.addEventListener('DOMContentLoaded', () => {
                         fd.append('file', p.file);
                         fd.append('destination', destination);
                         fd.append('folder_name', folderName);
-                        const r = await window.PushFileAuth.apiPost('/api/upload/zip-import', fd, { base });
+                        fd.append('background', '1');
+                        const r = await waitForImportJob(await window.PushFileAuth.apiPost('/api/upload/zip-import', fd, { base }));
                         if (!r || r.ok !== true) throw new Error((r && r.detail) || 'ZIP 上传失败');
                     }
 
@@ -3588,6 +3588,19 @@ function updateUploadProgress(current, total, file) {
     el.textContent = `${current} / ${total}${name}`;
 }
 
+// ZIP imports run as background jobs: poll until the job settles.
+async function waitForImportJob(resp, onProgress) {
+    if (!resp || resp.ok !== true || !resp.job_id) return resp;
+    for (;;) {
+        await new Promise(resolve => setTimeout(resolve, 500));
+        const job = await api.get(`/api/upload/jobs/${encodeURIComponent(resp.job_id)}`);
+        if (!job || job.ok !== true) return job;
+        if (job.status === 'done') return job;
+        if (job.status === 'failed') return { ok: false, detail: job.error || 'ZIP 导入失败' };
+        if (onProgress) onProgress(job);
+    }
+}
+
 function setUploadingUI(files) {
     const dropzoneContent = document.querySelector('.dropzone-content');
     if (!dropzoneContent) return null;
@@ -3701,7 +3714,11 @@ window.startPendingUpload = async function() {
                 fd.append('file', file);
                 fd.append('destination', destination);
                 fd.append('folder_name', folderName);
-                const data = await api.post('/api/upload/zip-import', fd);
+                fd.append('background', '1');
+                const data = await waitForImportJob(await api.post('/api/upload/zip-import', fd), job => {
+                    const el = document.getElementById('upload-progress');
+                    if (el && job.total) el.textContent = `${i + 1} / ${zipFiles.length} (${file.name}) ${job.processed} / ${job.total}`;
+                });
                 if (!data || data.ok !== true) {
                     throw new Error((data && data.detail) || 'ZIP 上传失败');
                 }
@@ -0,0 +1,60 @@
+"""Cost of JSON metadata writes: plain write_text vs atomic replace.
+
+Rewrites a stats-sized JSON file in a loop the way _save_stats and
+save_manifest do, comparing:
+
+  - write_text        the previous direct write (not crash-safe)
+  - atomic, no fsync  temp + rename only
+  - atomic, fsync     temp + fsync + rename (+ directory fsync)
+  - atomic, coalesced fsync at most once per ATOMIC_WRITE_SYNC_INTERVAL_MS
+
+Usage: python scripts/bench_atomic_write.py [--writes 500] [--entries 2000] [--dir /path/on/target/disk]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.atomic_io import atomic_write_text, flush_pending  # noqa: E402
+
+
+def _payload(entries: int) -> str:
+    data = {f"album{i}": {"views": i, "last_visit": "2026-01-01T00:00:00Z"} for i in range(entries)}
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+
+def _time(label: str, writes: int, write) -> None:
+    start = time.perf_counter()
+    for _ in range(writes):
+        write()
+    elapsed = time.perf_counter() - start
+    print(f"{label:>18}: {elapsed / writes * 1e3:8.3f} ms/write  ({writes / elapsed:9.1f} writes/s)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writes", type=int, default=500)
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--dir", default=None, help="directory on the disk to measure (default: system temp)")
+    args = parser.parse_args()
+
+    text = _payload(args.entries)
+    print(f"payload: {len(text) / 1024:.1f} KiB, {args.writes} writes")
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        target = Path(tmp) / "_stats.json"
+        _time("write_text", args.writes, lambda: target.write_text(text, encoding="utf-8"))
+        _time("atomic, no fsync", args.writes, lambda: atomic_write_text(target, text, fsync=False))
+        _time("atomic, fsync", args.writes, lambda: atomic_write_text(target, text, dir_fsync=True))
+        _time("atomic, coalesced", args.writes, lambda: atomic_write_text(target, text, coalesce=True))
+        flush_pending()
+
+
+if __name__ == "__main__":
+    main()
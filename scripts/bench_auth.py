@@ -0,0 +1,63 @@
+"""Authenticated API request rate with and without the credential cache.
+
+Spins up the app against a throwaway UPLOAD_BASE, creates a user and hits
+/api/tokens with a ``user:password`` key through TestClient.
+
+Usage: python scripts/bench_auth.py [--requests 200]
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def _load_app(base: Path, ttl: str):
+    os.environ["UPLOAD_SECRET"] = "bench-secret"
+    os.environ["UPLOAD_BASE"] = str(base)
+    os.environ["AUTH_CACHE_TTL_S"] = ttl
+    for name in list(sys.modules):
+        if name == "app" or name.startswith("app."):
+            del sys.modules[name]
+    main = importlib.import_module("app.main")
+    logging.disable(logging.INFO)
+    users = importlib.import_module("app.users")
+    return main.app, users
+
+
+def _run(label: str, ttl: str, requests: int) -> None:
+    from fastapi.testclient import TestClient
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app, users = _load_app(Path(tmp), ttl)
+        if users.get_user_by_username("bench") is None:
+            users.create_user("bench", "bench-password")
+        key = "bench:bench-password"
+        with TestClient(app) as client:
+            assert client.get("/api/tokens", params={"key": key}).status_code == 200
+            start = time.perf_counter()
+            for _ in range(requests):
+                client.get("/api/tokens", params={"key": key})
+            elapsed = time.perf_counter() - start
+    print(f"{label:>12}: {requests / elapsed:8.1f} req/s  ({elapsed / requests * 1e3:.2f} ms/request)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    _run("no cache", "0", args.requests)
+    _run("cached", "60", args.requests)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""ip2region lookup cost and memory per GEOIP_MODE (buffer, vector, mmap, file).
+
+Each mode runs in its own subprocess so RSS numbers are not polluted by the
+previous one. RssAnon is private heap (multiplied by the worker count);
+RssFile is page cache that every worker mapping the file shares.
+
+Without --db a synthetic IPv4 xdb is written to a temp dir, with one segment
+per /24 across the first --blocks /16 blocks.
+
+Usage: python scripts/bench_geoip.py [--db ip2region.xdb] [--lookups 200000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import ipaddress
+import json
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def _write_synthetic_xdb(path: Path, blocks: int) -> None:
+    header_len, vector_len, entry_len = 256, 256 * 256 * 8, 14
+    base = header_len + vector_len
+    regions = bytearray()
+    region_ptrs: list[tuple[int, int]] = []
+    for i in range(512):
+        raw = f"国家{i % 7}|省份{i % 31}|城市{i}|ISP{i % 5}|C{i % 7}".encode("utf-8")
+        region_ptrs.append((base + len(regions), len(raw)))
+        regions += raw
+
+    index_start = base + len(regions)
+    vector = bytearray(vector_len)
+    index = bytearray()
+    n = 0
+    for block in range(blocks):
+        first = index_start + n * entry_len
+        for sub in range(256):
+            start = (block << 16) | (sub << 8)
+            ptr, length = region_ptrs[(block * 256 + sub) % len(region_ptrs)]
+            index += struct.pack("<IIHI", start, start | 0xFF, length, ptr)
+            n += 1
+        struct.pack_into("<II", vector, block * 8, first, index_start + (n - 1) * entry_len)
+
+    header = bytearray(header_len)
+    struct.pack_into("<HHIII", header, 0, 2, 1, 0, index_start, index_start + len(index) - entry_len)
+    path.write_bytes(bytes(header) + bytes(vector) + bytes(regions) + bytes(index))
+
+
+def _rss_kb() -> dict[str, int]:
+    out = {"RssAnon": 0, "RssFile": 0}
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            name, _, value = line.partition(":")
+            if name in out:
+                out[name] = int(value.split()[0])
+    except OSError:
+        pass
+    return out
+
+
+def _child(db: str, mode: str, lookups: int, blocks: int) -> None:
+    from app import geoip
+
+    rng = random.Random(1)
+    ips = [str(ipaddress.IPv4Address((rng.randrange(blocks) << 16) | rng.getrandbits(16))) for _ in range(lookups)]
+    before = _rss_kb()
+    start = time.perf_counter()
+    searcher = geoip.open_searcher(Path(db), mode)
+    open_ms = (time.perf_counter() - start) * 1e3
+    start = time.perf_counter()
+    for ip in ips:
+        searcher.search(ip)
+    elapsed = time.perf_counter() - start
+    after = _rss_kb()
+    print(json.dumps({
+        "mode": mode,
+        "open_ms": open_ms,
+        "us_per_lookup": elapsed / lookups * 1e6,
+        "anon_kb": after["RssAnon"] - before["RssAnon"],
+        "file_kb": after["RssFile"] - before["RssFile"],
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="")
+    parser.add_argument("--lookups", type=int, default=200_000)
+    parser.add_argument("--blocks", type=int, default=4096, help="/16 blocks in the synthetic db")
+    parser.add_argument("--child", nargs=2, metavar=("DB", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.child[0], args.child[1], args.lookups, args.blocks)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Path(args.db) if args.db else Path(tmp) / "synthetic.xdb"
+        blocks = args.blocks if not args.db else 65536
+        if not args.db:
+            _write_synthetic_xdb(db, blocks)
+        print(f"db: {db} ({db.stat().st_size / 1e6:.1f} MB), {args.lookups} lookups")
+        for mode in ("buffer", "vector", "mmap", "file"):
+            out = subprocess.check_output(
+                [sys.executable, __file__, "--child", str(db), mode, "--lookups", str(args.lookups), "--blocks", str(blocks)],
+                text=True,
+            )
+            r = json.loads(out)
+            print(
+                f"{r['mode']:>7}: open {r['open_ms']:7.2f} ms  {r['us_per_lookup']:6.2f} us/lookup  "
+                f"private +{r['anon_kb'] / 1024:6.1f} MiB  shared file +{r['file_kb'] / 1024:6.1f} MiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
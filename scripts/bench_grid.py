@@ -0,0 +1,70 @@
+"""Nine-grid generation: previous serial pipeline vs the shared-crop, parallel-encode engine.
+
+Usage: python scripts/bench_grid.py [--size 6000] [--format JPEG] [--repeat 3]
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image  # noqa: E402
+
+from app import grid_processor as gp  # noqa: E402
+
+
+def _legacy(src: Image.Image, fmt: str, quality: int) -> tuple[bytes, list[bytes]]:
+    # The pre-refactor flow: compose crops the source, split crops it again,
+    # every tile is converted on its own and all 10 encodes run serially.
+    preview = gp.compose_nine_grid_preview(src, line_color=(255, 255, 255, 255), line_width=4, gap=6, padding=10, bg_color=(255, 255, 255, 255))
+    tiles = gp.split_into_grid(src, grid_size=3)
+
+    def encode(img: Image.Image) -> bytes:
+        buf = io.BytesIO()
+        if fmt == "JPEG":
+            gp.convert_to_rgb(img, (255, 255, 255)).save(buf, format="JPEG", quality=quality, subsampling=0)
+        else:
+            (img if img.mode == "RGBA" else img.convert("RGBA")).save(buf, format="PNG")
+        return buf.getvalue()
+
+    return encode(preview), [encode(t) for t in tiles]
+
+
+def _engine(src: Image.Image, fmt: str, quality: int) -> tuple[bytes, list[bytes]]:
+    return gp.process_nine_grid(src, line_width=4, gap=6, padding=10, output_format=fmt, quality=quality)
+
+
+def _source(size: int) -> Image.Image:
+    # Smooth gradients with some noise: closer to a photo than flat colour.
+    base = Image.linear_gradient("L").resize((size, size))
+    noise = Image.effect_noise((size, size), 40)
+    return Image.merge("RGB", (base, noise, base.transpose(Image.Transpose.ROTATE_90)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=6000)
+    parser.add_argument("--format", default="JPEG", choices=["JPEG", "PNG"])
+    parser.add_argument("--quality", type=int, default=95)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    src = _source(args.size)
+    print(f"{args.size}x{args.size} {args.format}, encode workers: {gp._ENCODE_WORKERS}")
+    for name, fn in (("legacy", _legacy), ("engine", _engine)):
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            preview, tiles = fn(src, args.format, args.quality)
+            best = min(best, time.perf_counter() - start)
+        total = len(preview) + sum(len(t) for t in tiles)
+        print(f"{name:>7}: {best * 1e3:8.1f} ms (best of {args.repeat}), {total / 1e6:.1f} MB out")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Per-request IP classification cost: ip_network scans vs IPRangeMatcher.
+
+Usage: python scripts/bench_ip_classify.py [--nets 50] [--ips 20000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import ipaddress
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.security import IPRangeMatcher  # noqa: E402
+
+LOCAL_V4 = ("10.0.0.0/8", "192.168.0.0/16", "172.16.0.0/12")
+
+
+def _legacy_is_local(ip: str) -> bool:
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    if addr.is_loopback:
+        return True
+    if addr.version == 4:
+        return any(addr in ipaddress.ip_network(net) for net in LOCAL_V4)
+    return addr.is_private or addr.is_link_local
+
+
+def _legacy_in(nets, ip: str) -> bool:
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(addr in net for net in nets)
+
+
+def _sample_ips(count: int) -> list[str]:
+    rng = random.Random(42)
+    out = []
+    for _ in range(count):
+        if rng.random() < 0.8:
+            out.append(str(ipaddress.IPv4Address(rng.getrandbits(32))))
+        else:
+            out.append(str(ipaddress.IPv6Address(rng.getrandbits(128))))
+    return out
+
+
+def _sample_nets(count: int) -> list[str]:
+    rng = random.Random(7)
+    return [f"{ipaddress.IPv4Address(rng.getrandbits(32) & 0xFFFFFF00)}/24" for _ in range(count)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nets", type=int, default=50, help="excluded/trusted CIDRs")
+    parser.add_argument("--ips", type=int, default=20000)
+    args = parser.parse_args()
+
+    ips = _sample_ips(args.ips)
+    cidrs = _sample_nets(args.nets)
+    legacy_nets = [ipaddress.ip_network(n) for n in cidrs]
+    local = IPRangeMatcher([*LOCAL_V4, "127.0.0.0/8", "::1/128", "fc00::/7", "fe80::/10"])
+    excluded = IPRangeMatcher(cidrs)
+
+    def legacy(ip: str) -> bool:
+        # local check, excluded check, trusted-proxy check: three parses per request
+        return _legacy_is_local(ip) or _legacy_in(legacy_nets, ip) or _legacy_in(legacy_nets, ip)
+
+    def compiled(ip: str) -> bool:
+        addr = ipaddress.ip_address(ip)
+        return local.contains(addr) or excluded.contains(addr) or excluded.contains(addr)
+
+    for name, fn in (("ip_network scan", legacy), ("IPRangeMatcher", compiled)):
+        start = time.perf_counter()
+        for ip in ips:
+            fn(ip)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>16}: {elapsed / len(ips) * 1e6:8.2f} us/request  ({len(ips)} ips, {args.nets} nets)")
+
+
+if __name__ == "__main__":
+    main()
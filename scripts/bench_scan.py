@@ -0,0 +1,97 @@
+"""Directory scanning: Path.iterdir() + per-entry checks vs the os.scandir layer.
+
+Builds a throwaway folder with --entries files (a mix of images, other files
+and subfolders) and times the listings storage.py needs: image names, visible
+subfolders, and names with size and mtime.
+
+Usage: python scripts/bench_scan.py [--entries 50000] [--repeat 5] [--dir /path/on/target/disk]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.dirscan import scan_dir  # noqa: E402
+
+ALLOWED_SUFFIX = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+
+
+def _populate(d: Path, entries: int) -> None:
+    for i in range(entries):
+        if i % 100 == 0:
+            (d / f"folder{i:06d}").mkdir()
+        elif i % 10 == 0:
+            (d / f"note{i:06d}.txt").touch()
+        else:
+            (d / f"img{i:06d}.jpg").touch()
+
+
+def _legacy_images(d: Path) -> list[str]:
+    return [p.name for p in sorted(d.iterdir()) if p.is_file() and p.suffix.lower() in ALLOWED_SUFFIX]
+
+
+def _legacy_dirs(d: Path) -> list[Path]:
+    return [p for p in d.iterdir() if p.is_dir() and not p.name.startswith(("_", ".")) and not p.is_symlink()]
+
+
+def _legacy_stat(d: Path) -> list[tuple[str, int, float]]:
+    out = []
+    for p in d.iterdir():
+        if p.is_file():
+            st = p.stat()
+            out.append((p.name, st.st_size, st.st_mtime))
+    return out
+
+
+def _scan_images(d: Path) -> list[str]:
+    return sorted(e.name for e in scan_dir(d) if e.is_file and e.suffix in ALLOWED_SUFFIX)
+
+
+def _scan_dirs(d: Path) -> list[Path]:
+    return [d / e.name for e in scan_dir(d) if e.is_dir and not e.name.startswith(("_", "."))]
+
+
+def _scan_stat(d: Path) -> list[tuple[str, int, float]]:
+    return [(e.name, e.size, e.mtime) for e in scan_dir(d, with_stat=True) if e.is_file]
+
+
+def _time(fn, d: Path, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(d)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--dir", default=None, help="directory on the disk to measure (default: system temp)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        d = Path(tmp)
+        _populate(d, args.entries)
+        assert _legacy_images(d) == _scan_images(d)
+        assert sorted(_legacy_dirs(d)) == sorted(_scan_dirs(d))
+        print(f"{args.entries} entries, best of {args.repeat}")
+        for label, legacy, scan in (
+            ("image names", _legacy_images, _scan_images),
+            ("visible subdirs", _legacy_dirs, _scan_dirs),
+            ("name+size+mtime", _legacy_stat, _scan_stat),
+        ):
+            old = _time(legacy, d, args.repeat)
+            new = _time(scan, d, args.repeat)
+            print(f"{label:>16}: iterdir {old * 1e3:8.1f} ms   scandir {new * 1e3:8.1f} ms   ({old / new:4.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -50,7 +50,7 @@ def test_record_visit_skips_local_and_admin_origin(tmp_path: Path, monkeypatch):
 
 
 def test_record_visit_accepts_public_ip_and_respects_excluded_nets(tmp_path: Path, monkeypatch):
-    base_dir, storage = _import_storage(tmp_path, monkeypatch, excluded_nets="198.51.100.0/24")
+    _base_dir, storage = _import_storage(tmp_path, monkeypatch, excluded_nets="198.51.100.0/24")
 
     storage.record_visit("album1", "203.0.113.5", "pytest")
     storage.record_visit("album1", "198.51.100.12", "pytest")
@@ -66,3 +66,100 @@ def test_record_visit_accepts_public_ip_and_respects_excluded_nets(tmp_path: Pat
 def test_geoip_lookup_returns_unknown_when_region_trace_disabled(tmp_path: Path, monkeypatch):
     _base_dir, storage = _import_storage(tmp_path, monkeypatch, region_enabled="0")
     assert storage._geoip_lookup("8.8.8.8") == ("", "", "")
+
+
+def test_geoip_lookup_caches_and_batches_in_address_order(tmp_path: Path, monkeypatch):
+    _base_dir, storage = _import_storage(tmp_path, monkeypatch)
+
+    import importlib
+
+    geoip = importlib.import_module("app.geoip")
+    searched: list[str] = []
+
+    class FakeSearcher:
+        def search(self, ip: str) -> str:
+            searched.append(ip)
+            return "中国|湖南省|娄底市|电信|CN"
+
+    monkeypatch.setattr(geoip, "_searcher", FakeSearcher())
+    geoip.clear_cache()
+
+    assert storage._geoip_lookup("8.8.8.8") == ("娄底市", "湖南省", "CN")
+    assert storage._geoip_lookup("8.8.8.8") == ("娄底市", "湖南省", "CN")
+    assert searched == ["8.8.8.8"]
+
+    located = storage._geoip_lookup_many(["9.9.9.9", "1.1.1.1", "8.8.8.8", "127.0.0.1", "1.1.1.1"])
+    assert located["127.0.0.1"] == ("本地", "", "")
+    assert located["1.1.1.1"] == ("娄底市", "湖南省", "CN")
+    assert searched == ["8.8.8.8", "1.1.1.1", "9.9.9.9"]
+
+    stats = geoip.cache_stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 3
+    assert stats["size"] == 3
+
+
+def _write_xdb(path: Path, segments: list[tuple[str, str, str]]) -> None:
+    """Write a minimal IPv4 xdb (structure 2.0) for the given sorted segments."""
+    import ipaddress
+    import struct
+
+    header_len, vector_len, entry_len = 256, 256 * 256 * 8, 14
+    base = header_len + vector_len
+    regions = bytearray()
+    region_ptrs: dict[str, int] = {}
+    entries: list[tuple[int, int, int, int]] = []
+    for start, end, region in segments:
+        raw = region.encode("utf-8")
+        if region not in region_ptrs:
+            region_ptrs[region] = base + len(regions)
+            regions += raw
+        s, e = int(ipaddress.IPv4Address(start)), int(ipaddress.IPv4Address(end))
+        while s <= e:
+            seg_end = min(e, s | 0xFFFF)
+            entries.append((s, seg_end, len(raw), region_ptrs[region]))
+            s = seg_end + 1
+
+    index_start = base + len(regions)
+    vector = bytearray(vector_len)
+    index = bytearray()
+    for i, (s, e, data_len, data_ptr) in enumerate(entries):
+        ptr = index_start + i * entry_len
+        index += struct.pack("<IIHI", s, e, data_len, data_ptr)
+        cell = (s >> 16) * 8
+        first, _last = struct.unpack_from("<II", vector, cell)
+        struct.pack_into("<II", vector, cell, first or ptr, ptr)
+
+    header = bytearray(header_len)
+    struct.pack_into("<HHIII", header, 0, 2, 1, 0, index_start, index_start + len(index) - entry_len)
+    path.write_bytes(bytes(header) + bytes(vector) + bytes(regions) + bytes(index))
+
+
+def test_geoip_maps_xdb_read_only(tmp_path: Path, monkeypatch):
+    _base_dir, _storage = _import_storage(tmp_path, monkeypatch)
+
+    import importlib
+    import mmap
+
+    geoip = importlib.import_module("app.geoip")
+    db = tmp_path / "ip2region.xdb"
+    _write_xdb(
+        db,
+        [
+            ("1.2.3.0", "1.2.3.255", "中国|湖南省|娄底市|电信|CN"),
+            ("8.8.8.0", "8.8.8.255", "美国|0|0|Level3|US"),
+        ],
+    )
+    monkeypatch.setattr(geoip, "_DB_PATH", db)
+    monkeypatch.setattr(geoip, "_searcher", None)
+    monkeypatch.setattr(geoip, "_unavailable", False)
+    geoip.clear_cache()
+
+    assert geoip.lookup("1.2.3.4") == ("娄底市", "湖南省", "CN")
+    assert geoip.lookup("8.8.8.8") == ("", "", "US")
+    assert geoip.lookup("9.9.9.9") == ("", "", "")
+    assert isinstance(geoip._searcher.c_buffer, mmap.mmap)
+
+    for mode in ("buffer", "vector", "file"):
+        searcher = geoip.open_searcher(db, mode)
+        assert geoip._search(searcher, "1.2.3.4") == ("娄底市", "湖南省", "CN")
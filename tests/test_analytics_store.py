@@ -134,11 +134,14 @@ def test_main_import_survives_analytics_init_failure(tmp_path: Path, monkeypatch
     def _boom() -> None:
         raise RuntimeError("boom")
 
-    setattr(fake_module, "init_analytics_store", _boom)
-    setattr(fake_module, "record_sqlite_visit", lambda **_kwargs: None)
-    setattr(fake_module, "get_stats_rollups", lambda *_args, **_kwargs: {})
-    setattr(fake_module, "iter_sqlite_visit_events", lambda *_args, **_kwargs: iter(()))
-    setattr(fake_module, "seed_stats_rollup", lambda **_kwargs: None)
+    monkeypatch.setattr(fake_module, "init_analytics_store", _boom, raising=False)
+    monkeypatch.setattr(fake_module, "record_sqlite_visit", lambda **_kwargs: None, raising=False)
+    monkeypatch.setattr(fake_module, "get_stats_rollups", lambda *_args, **_kwargs: {}, raising=False)
+    monkeypatch.setattr(fake_module, "iter_sqlite_visit_events", lambda *_args, **_kwargs: iter(()), raising=False)
+    monkeypatch.setattr(fake_module, "has_sqlite_visit_events", lambda *_args, **_kwargs: False, raising=False)
+    monkeypatch.setattr(fake_module, "get_cross_visits", lambda *_args, **_kwargs: {"items": [], "total": 0}, raising=False)
+    monkeypatch.setattr(fake_module, "seed_stats_rollup", lambda **_kwargs: None, raising=False)
+    monkeypatch.setattr(fake_module, "bulk_import_visits", lambda *_args, **_kwargs: {"rows_read": 0, "events_inserted": 0, "duplicates": 0}, raising=False)
     monkeypatch.setitem(sys.modules, "app.analytics_store", fake_module)
 
     import importlib
@@ -169,9 +172,186 @@ def test_dual_write_records_events_and_unique_visitors(analytics_app_ctx):
         conn.close()
 
 
-def test_sqlite_write_failure_does_not_break_legacy_stats(analytics_app_ctx, monkeypatch: pytest.MonkeyPatch):
-    base_dir = analytics_app_ctx["base_dir"]
+def test_iter_sqlite_visit_events_pages_and_filters(analytics_app_ctx):
+    analytics_store = analytics_app_ctx["analytics_store"]
+    for i in range(7):
+        analytics_store.record_sqlite_visit(
+            owner_id="owner-a",
+            album_key="folder-a",
+            stats_key="album1" if i % 2 == 0 else "album2",
+            ip_norm=f"203.0.113.{i + 1}",
+            ua="pytest",
+            city="",
+            region="",
+            country="",
+            visited_at="2026-01-01T10:00:00+08:00" if i < 4 else f"2026-01-0{i - 2}T10:00:00+08:00",
+        )
+
+    rows = list(analytics_store.iter_sqlite_visit_events("owner-a", batch_size=2))
+    assert [row["ip"] for row in rows] == [f"203.0.113.{i + 1}" for i in range(7)]
+
+    album1 = list(analytics_store.iter_sqlite_visit_events("owner-a", stats_key="album1", batch_size=1))
+    assert {row["token"] for row in album1} == {"album1"}
+    assert len(album1) == 4
+
+    ranged = list(
+        analytics_store.iter_sqlite_visit_events(
+            "owner-a",
+            since="2026-01-02T00:00:00+08:00",
+            until="2026-01-03T23:59:59+08:00",
+        )
+    )
+    assert [row["time"][:10] for row in ranged] == ["2026-01-02", "2026-01-03"]
+    assert list(analytics_store.iter_sqlite_visit_events("owner-b")) == []
+
+
+def test_cross_visit_index_is_incremental_and_rebuildable(analytics_app_ctx):
+    analytics_store = analytics_app_ctx["analytics_store"]
+    visits = [
+        ("album1", "203.0.113.5", "娄底市", "2026-01-01T10:00:00+08:00"),
+        ("album1", "203.0.113.5", "娄底市", "2026-01-01T11:00:00+08:00"),
+        ("album2", "203.0.113.5", "长沙市", "2026-01-01T12:00:00+08:00"),
+        ("album1", "203.0.113.6", "", "2026-01-01T13:00:00+08:00"),
+    ]
+    for stats_key, ip, city, visited_at in visits:
+        analytics_store.record_sqlite_visit(
+            owner_id="owner-a",
+            album_key=stats_key,
+            stats_key=stats_key,
+            ip_norm=ip,
+            ua="pytest",
+            city=city,
+            region="",
+            country="",
+            visited_at=visited_at,
+        )
+
+    page = analytics_store.get_cross_visits("owner-a")
+    assert page["total"] == 1
+    item = page["items"][0]
+    assert item["ip"] == "203.0.113.5"
+    assert item["city"] == "娄底市"
+    assert item["tokens"] == ["album1", "album2"]
+    assert item["count"] == 3
+
+    analytics_store.rebuild_visitor_index()
+    rebuilt = analytics_store.get_cross_visits("owner-a")
+    assert rebuilt["items"] == page["items"]
+    assert analytics_store.get_cross_visits("owner-a", offset=1)["items"] == []
+
+
+def test_schema_upgrade_rebuilds_visitor_profiles(analytics_app_ctx):
+    analytics_store = analytics_app_ctx["analytics_store"]
+    for city, visited_at in [("长沙市", "2026-01-01T10:00:00+08:00"), ("长沙市", "2026-01-01T11:00:00+08:00"), ("娄底市", "2026-01-01T12:00:00+08:00")]:
+        analytics_store.record_sqlite_visit(
+            owner_id="owner-a",
+            album_key="album1",
+            stats_key="album1",
+            ip_norm="203.0.113.5",
+            ua="pytest",
+            city=city,
+            region="",
+            country="",
+            visited_at=visited_at,
+        )
+    conn = analytics_store._connect()
+    try:
+        conn.execute("DELETE FROM visitor_profiles")
+        conn.execute("UPDATE schema_meta SET value = '3' WHERE key = 'schema_version'")
+        conn.commit()
+    finally:
+        conn.close()
+
+    analytics_store.init_analytics_store()
+    conn = analytics_store._connect()
+    try:
+        row = conn.execute("SELECT city, total_visits FROM visitor_profiles WHERE owner_id = 'owner-a'").fetchone()
+        version = conn.execute("SELECT value FROM schema_meta WHERE key = 'schema_version'").fetchone()
+    finally:
+        conn.close()
+    assert (row["city"], row["total_visits"]) == ("长沙市", 3)
+    assert int(version["value"]) == analytics_store.SCHEMA_VERSION
 
+
+def test_bulk_import_matches_per_row_recording(analytics_app_ctx):
+    analytics_store = analytics_app_ctx["analytics_store"]
+    visits = [
+        ("album1", "203.0.113.5", "娄底市", "2026-01-01T10:00:00+08:00", ""),
+        ("album1", "203.0.113.5", "", "2026-01-01T11:00:00+08:00", ""),
+        ("album2", "203.0.113.5", "", "2026-01-01T12:00:00+08:00", ""),
+        ("album1", "203.0.113.6", "", "2026-01-01T13:00:00+08:00", ""),
+        ("album2", "10.0.0.1", "", "2026-01-01T14:00:00+08:00", "local_ip"),
+    ]
+    rows = [
+        {
+            "source_key": f"bulk:{i}",
+            "album_key": stats_key,
+            "stats_key": stats_key,
+            "ip_norm": ip,
+            "ua": "pytest",
+            "city": city,
+            "visited_at": visited_at,
+            "filter_reason": reason,
+        }
+        for i, (stats_key, ip, city, visited_at, reason) in enumerate(visits)
+    ]
+    for i, (stats_key, ip, city, visited_at, reason) in enumerate(visits):
+        analytics_store.record_sqlite_visit(
+            owner_id="per-row",
+            album_key=stats_key,
+            stats_key=stats_key,
+            ip_norm=ip,
+            ua="pytest",
+            city=city,
+            region="",
+            country="",
+            visited_at=visited_at,
+            filter_reason=reason,
+            source_key=f"row:{i}",
+        )
+
+    progress: list[int] = []
+    report = analytics_store.bulk_import_visits("bulk", rows, batch_size=2, progress=progress.append)
+    assert report == {"rows_read": 5, "events_inserted": 5, "duplicates": 0, "locations_updated": 0}
+    assert progress == [2, 4, 5]
+    again = analytics_store.bulk_import_visits("bulk", rows[:3])
+    assert again == {"rows_read": 3, "events_inserted": 0, "duplicates": 3, "locations_updated": 0}
+
+    assert analytics_store.get_stats_rollups("bulk") == analytics_store.get_stats_rollups("per-row")
+    assert analytics_store.get_cross_visits("bulk") == analytics_store.get_cross_visits("per-row")
+    conn = analytics_store._connect()
+    try:
+        columns = "album_key, visitor_hash, first_seen_at, last_seen_at, city"
+        query = f"SELECT {columns} FROM unique_visitors WHERE owner_id = ? ORDER BY album_key, visitor_hash"
+        bulk_unique = [tuple(r) for r in conn.execute(query, ("bulk",)).fetchall()]
+        assert bulk_unique == [tuple(r) for r in conn.execute(query, ("per-row",)).fetchall()]
+        assert len(bulk_unique) == 3
+    finally:
+        conn.close()
+
+
+def test_backfill_cli_reports_progress(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]):
+    legacy_ctx = _import_modules_with_flags(tmp_path, monkeypatch, write_sqlite="0", read_sqlite="0")
+    legacy_storage = cast(Any, legacy_ctx["storage"])
+    legacy_storage.record_visit("album1", "203.0.113.5", "pytest")
+    legacy_storage.record_visit("album2", "203.0.113.8", "pytest")
+
+    _import_modules_with_flags(tmp_path, monkeypatch, write_sqlite="1", read_sqlite="0")
+    import importlib
+    import json
+
+    cli = importlib.import_module("app.cli")
+    assert cli.main(["backfill-analytics"]) == 0
+    out, err = capsys.readouterr()
+    report = json.loads(out)
+    assert report["events_backfilled"] == 2
+    assert report["rows_read"] == 2
+    assert "staged 2 rows" in err
+
+    assert cli.main(["backfill-analytics", "--owner", "nobody"]) == 2
+
+
+def test_sqlite_write_failure_does_not_break_legacy_stats(analytics_app_ctx, monkeypatch: pytest.MonkeyPatch):
     import importlib
 
     storage = importlib.import_module("app.storage")
@@ -217,6 +397,63 @@ def test_backfill_is_idempotent_and_seeds_rollups(tmp_path: Path, monkeypatch: p
         conn.close()
 
 
+def test_backfill_counts_bad_records_and_geoip_failures(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]):
+    legacy_ctx = _import_modules_with_flags(tmp_path, monkeypatch, write_sqlite="0", read_sqlite="0")
+    legacy_storage = cast(Any, legacy_ctx["storage"])
+    legacy_storage.record_visit("album1", "203.0.113.5", "pytest")
+    visits_file = legacy_storage._visits_file()
+    with visits_file.open("a", encoding="utf-8") as f:
+        f.write('{"token": "album1", "ip": \n')
+        f.write('["not", "a", "record"]\n')
+    legacy_storage.record_visit("album2", "203.0.113.6", "pytest")
+
+    sqlite_ctx = _import_modules_with_flags(tmp_path, monkeypatch, write_sqlite="1", read_sqlite="0")
+    storage = cast(Any, sqlite_ctx["storage"])
+
+    def _geoip_down(_ips):
+        raise OSError("ip2region.xdb missing")
+
+    monkeypatch.setattr(storage, "_geoip_lookup_many", _geoip_down)
+    report = storage.backfill_sqlite_from_legacy(regeolocate=True)
+    assert report["events_backfilled"] == 2
+    assert (report["rows_skipped"], report["rows_unlocated"], report["files_failed"]) == (2, 2, 0)
+
+    import importlib
+
+    cli = importlib.import_module("app.cli")
+    assert cli.main(["backfill-analytics", "--quiet"]) == 1
+    assert "skipped 2 records" in capsys.readouterr().err
+
+
+def test_backfill_regeolocate_updates_imported_locations(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    legacy_ctx = _import_modules_with_flags(tmp_path, monkeypatch, write_sqlite="0", read_sqlite="0")
+    legacy_storage = cast(Any, legacy_ctx["storage"])
+    legacy_storage.record_visit("album1", "203.0.113.5", "pytest")
+    legacy_storage.record_visit("album2", "203.0.113.5", "pytest")
+
+    sqlite_ctx = _import_modules_with_flags(tmp_path, monkeypatch, write_sqlite="1", read_sqlite="0")
+    storage = cast(Any, sqlite_ctx["storage"])
+    analytics_store = cast(Any, sqlite_ctx["analytics_store"])
+
+    def resolver(city: str):
+        return lambda ips: {ip: (city, "湖南省", "中国") for ip in ips}
+
+    monkeypatch.setattr(storage, "_geoip_lookup_many", resolver("娄底市"))
+    assert storage.backfill_sqlite_from_legacy()["events_backfilled"] == 2
+    monkeypatch.setattr(storage, "_geoip_lookup_many", resolver("长沙市"))
+    assert storage.backfill_sqlite_from_legacy()["locations_updated"] == 0
+    report = storage.backfill_sqlite_from_legacy(regeolocate=True)
+    assert (report["events_backfilled"], report["locations_updated"]) == (0, 2)
+
+    conn = analytics_store._connect()
+    try:
+        for table in ("visit_events", "unique_visitors", "visitor_profiles"):
+            cities = {row["city"] for row in conn.execute(f"SELECT city FROM {table}")}
+            assert cities == {"长沙市"}, table
+    finally:
+        conn.close()
+
+
 def test_sqlite_read_can_replace_legacy_and_fallback_when_empty(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
     legacy_ctx = _import_modules_with_flags(tmp_path, monkeypatch, write_sqlite="0", read_sqlite="0")
     legacy_storage = cast(Any, legacy_ctx["storage"])
@@ -265,6 +502,34 @@ def test_sqlite_read_supports_dashboard_and_analytics_api(tmp_path: Path, monkey
         assert analytics_data["unique_ip_count"] == 2
 
 
+def test_cross_visit_city_and_total_match_between_sources(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    ctx = _import_modules_with_flags(tmp_path, monkeypatch, write_sqlite="1", read_sqlite="0")
+    storage = cast(Any, ctx["storage"])
+    visits = [
+        ("album1", "203.0.113.5", "娄底市"),
+        ("album1", "203.0.113.5", "娄底市"),
+        ("album2", "203.0.113.5", "长沙市"),
+        ("album1", "203.0.113.6", "长沙市"),
+        ("album2", "203.0.113.6", "长沙市"),
+        ("album3", "203.0.113.6", "长沙市"),
+        ("album3", "203.0.113.6", "长沙市"),
+    ]
+    for token, ip, city in visits:
+        monkeypatch.setattr(storage, "_geoip_lookup", lambda _ip, city=city: (city, "湖南省", "中国"))
+        storage.record_visit(token, ip, "pytest")
+
+    legacy = storage.get_analytics(cross_limit=1)
+    read_ctx = _import_modules_with_flags(tmp_path, monkeypatch, write_sqlite="1", read_sqlite="1")
+    sqlite = cast(Any, read_ctx["storage"]).get_analytics(cross_limit=1)
+    for data in (legacy, sqlite):
+        assert data["cross_visit_total"] == 2
+        assert [(item["ip"], item["city"]) for item in data["cross_visit"]] == [("203.0.113.6", "长沙市")]
+    assert [(item["ip"], item["city"]) for item in cast(Any, read_ctx["storage"]).get_cross_visit_page()["items"]] == [
+        ("203.0.113.6", "长沙市"),
+        ("203.0.113.5", "娄底市"),
+    ]
+
+
 def test_compare_analytics_sources_reports_legacy_and_sqlite(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
     legacy_ctx = _import_modules_with_flags(tmp_path, monkeypatch, write_sqlite="0", read_sqlite="0")
     legacy_storage = cast(Any, legacy_ctx["storage"])
@@ -279,3 +544,77 @@ def test_compare_analytics_sources_reports_legacy_and_sqlite(tmp_path: Path, mon
     assert compare["sqlite"]["total_visits"] == 2
     assert compare["legacy"]["stats_keys"] == 2
     assert compare["sqlite"]["stats_keys"] == 2
+
+
+def test_dashboard_is_materialized_and_updated_incrementally(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    ctx = _import_modules_with_flags(tmp_path, monkeypatch)
+    storage = cast(Any, ctx["storage"])
+    base_dir = cast(Path, ctx["base_dir"])
+    headers = {"X-Upload-Key": "analytics-secret"}
+    png = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+    (base_dir / "album1").mkdir()
+    (base_dir / "album1" / "a.png").write_bytes(png)
+    storage.record_visit("album1", "203.0.113.5", "pytest")
+
+    with TestClient(ctx["app"]) as client:
+        first = client.get("/api/stats/dashboard", headers=headers)
+        assert first.status_code == 200
+        data = first.json()
+        assert (data["photo_count"], data["album_count"], data["total_visits"], data["today_visits"]) == (1, 1, 1, 1)
+        assert data["recent_activities"][0]["name"] == "album1"
+        # the first read saves the album order while inferring titles
+        etag = client.get("/api/stats/dashboard", headers=headers).headers["etag"]
+
+        # From here on the endpoint must not walk the tree or the visit log.
+        monkeypatch.setattr(storage, "_rebuild_dashboard", lambda owner: pytest.fail("rebuilt"))
+        again = client.get("/api/stats/dashboard", headers={**headers, "If-None-Match": etag})
+        assert again.status_code == 304
+
+        r = client.post("/api/upload/album2", headers=headers, files={"file": ("b.png", png + b"\x01", "image/png")})
+        assert r.status_code == 200
+        storage.record_visit("album2", "203.0.113.6", "pytest")
+        r = client.post("/api/manage/album1/delete", headers=headers, json={"name": "a.png"})
+        assert r.status_code == 200
+
+        changed = client.get("/api/stats/dashboard", headers={**headers, "If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["etag"] != etag
+        data = changed.json()
+        assert (data["photo_count"], data["album_count"], data["total_visits"], data["today_visits"]) == (1, 1, 2, 2)
+        assert [a["name"] for a in data["recent_activities"]] == ["album2", "album1"]
+
+        # Visits are queued and written in one batch; a worker restart keeps the summary.
+        batches: list[int] = []
+        real_record = storage.record_dashboard_visits
+        monkeypatch.setattr(storage, "record_dashboard_visits", lambda visits: (batches.append(len(visits)), real_record(visits)))
+        for ip in ("203.0.113.7", "203.0.113.8", "203.0.113.9"):
+            storage.record_visit("album2", ip, "pytest")
+        assert batches == []
+        from app.metadata_store import init_metadata_store
+
+        init_metadata_store()
+        data = client.get("/api/stats/dashboard", headers=headers).json()
+        assert batches == [3]
+        assert (data["total_visits"], data["today_visits"]) == (5, 5)
+
+
+def test_sqlite_read_failure_falls_back_to_legacy(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    import sqlite3
+
+    ctx = _import_modules_with_flags(tmp_path, monkeypatch, write_sqlite="1", read_sqlite="1")
+    storage = cast(Any, ctx["storage"])
+    storage.record_visit("album1", "203.0.113.5", "pytest")
+    storage.record_visit("album1", "203.0.113.6", "pytest")
+
+    def _broken(*_args, **_kwargs):
+        raise sqlite3.OperationalError("database disk image is malformed")
+        yield  # pragma: no cover
+
+    monkeypatch.setattr(storage, "iter_sqlite_visit_events", _broken)
+
+    assert len(list(storage.iter_visit_records())) == 2
+    assert storage.get_all_stats()["album1"]["views"] == 2
+    analytics = storage.get_analytics()
+    assert analytics["total_visit_count"] == 2
+    assert sum(int(d["views"]) for d in storage.get_daily_views(7)) == 2
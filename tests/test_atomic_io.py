@@ -0,0 +1,40 @@
+import os
+from pathlib import Path
+
+import pytest
+
+
+def test_failed_write_keeps_previous_content(tmp_path: Path, monkeypatch):
+    from app import atomic_io
+
+    target = tmp_path / "_stats.json"
+    atomic_io.atomic_write_text(target, '{"a": 1}')
+
+    def boom(fd):
+        raise OSError("disk gone")
+
+    monkeypatch.setattr(atomic_io.os, "fsync", boom)
+    with pytest.raises(OSError):
+        atomic_io.atomic_write_text(target, '{"a": 2}')
+    assert target.read_text(encoding="utf-8") == '{"a": 1}'
+    assert [p.name for p in tmp_path.iterdir()] == ["_stats.json"]
+
+
+def test_coalesced_writes_fsync_once_per_interval(tmp_path: Path, monkeypatch):
+    from app import atomic_io
+
+    # drop syncs deferred by writes from earlier tests sharing this module
+    atomic_io.flush_pending()
+    synced: list[int] = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(atomic_io.os, "fsync", lambda fd: (synced.append(fd), real_fsync(fd)))
+    monkeypatch.setattr(atomic_io, "SYNC_INTERVAL_S", 60.0)
+
+    target = tmp_path / ".manifest.json"
+    for i in range(20):
+        atomic_io.atomic_write_text(target, f'{{"n": {i}}}', coalesce=True)
+    assert len(synced) == 1
+    assert target.read_text(encoding="utf-8") == '{"n": 19}'
+
+    assert atomic_io.flush_pending() == 1
+    assert len(synced) == 2
@@ -32,3 +32,27 @@ def test_delete_folder_success(client, upload_secret, base_dir):
     assert r.json()["mode"] == "trash"
     assert not (base_dir / "foo").exists()
     assert (base_dir / "_archived" / "trash").exists()
+
+
+def test_folder_tree_lists_each_folder_once(client, upload_secret, base_dir, monkeypatch):
+    from app import storage
+
+    (base_dir / "trip" / "day1").mkdir(parents=True)
+    (base_dir / "trip" / "day1" / "a.jpg").write_bytes(b"a")
+    (base_dir / "trip" / "day1" / "notes.txt").write_text("x")
+    (base_dir / "trip" / "cover.png").write_bytes(b"p")
+    (base_dir / "trip" / ".pfv").mkdir()
+    (base_dir / "linked").symlink_to(base_dir / "trip", target_is_directory=True)
+
+    scanned: list[str] = []
+    real_scan = storage.scan_dir
+    monkeypatch.setattr(storage, "scan_dir", lambda d, **kw: (scanned.append(str(d)), real_scan(d, **kw))[1])
+
+    r = client.get(f"/api/folders/tree?key={upload_secret}")
+    assert r.status_code == 200
+    tree = r.json()["tree"]
+    assert [n["name"] for n in tree] == ["trip"]
+    trip = tree[0]
+    assert (trip["image_count"], trip["is_album"]) == (1, False)
+    assert [(c["name"], c["image_count"], c["is_album"]) for c in trip["children"]] == [("day1", 1, True)]
+    assert len(scanned) == len(set(scanned))
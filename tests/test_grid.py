@@ -0,0 +1,232 @@
+import io
+
+from PIL import Image, ImageChops
+
+
+def _gradient(w: int, h: int, mode: str = "RGBA") -> Image.Image:
+    img = Image.new("RGBA", (w, h))
+    img.putdata([(x * 255 // w, y * 255 // h, (x + y) % 256, 255 if x % 7 else 128) for y in range(h) for x in range(w)])
+    return img.convert(mode)
+
+
+def _decode(data: bytes) -> Image.Image:
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    return img
+
+
+def test_png_grid_matches_compose_and_split(app_ctx):
+    from app.grid_processor import compose_nine_grid_preview, process_nine_grid, split_into_grid
+
+    src = _gradient(61, 47)
+    preview, tiles = process_nine_grid(
+        src, line_width=3, gap=2, padding=4, line_color=(255, 0, 0, 200), output_format="PNG", transparent_bg=True
+    )
+    expected_preview = compose_nine_grid_preview(src, line_color=(255, 0, 0, 200), line_width=3, gap=2, padding=4, bg_color=None)
+    assert ImageChops.difference(_decode(preview), expected_preview).getbbox() is None
+    assert len(tiles) == 9
+    for got, want in zip(tiles, split_into_grid(src)):
+        assert ImageChops.difference(_decode(got), want).getbbox() is None
+
+
+def test_jpeg_grid_flattens_alpha_once_and_blends_lines(app_ctx):
+    from app.grid_processor import convert_to_rgb, process_nine_grid
+
+    src = _gradient(90, 90)
+    preview, tiles = process_nine_grid(
+        src, line_width=4, gap=0, padding=0, line_color=(0, 0, 0, 128), bg_color=(255, 255, 255), quality=100
+    )
+    decoded = _decode(preview)
+    assert decoded.mode == "RGB"
+    assert decoded.size == (90 + 8, 90 + 8)
+    r, g, b = decoded.getpixel((31, 10))
+    assert abs(r - 127) <= 6 and abs(g - 127) <= 6 and abs(b - 127) <= 6
+
+    flat = convert_to_rgb(src, (255, 255, 255))
+    first = _decode(tiles[0])
+    assert first.size == (30, 30)
+    diff = ImageChops.difference(first, flat.crop((0, 0, 30, 30)))
+    assert max(hi for _lo, hi in diff.getextrema()) <= 12
+
+
+def test_grid_without_separators_reuses_source(app_ctx):
+    from app.grid_processor import process_nine_grid
+
+    src = _gradient(30, 30, "RGB")
+    preview, _tiles = process_nine_grid(src, line_width=0, gap=0, padding=0, output_format="PNG")
+    assert _decode(preview).size == (30, 30)
+
+
+def test_grid_preview_encode_overlaps_last_row(app_ctx, monkeypatch):
+    from app import grid_processor
+
+    src = _gradient(60, 60, "RGB")
+    order: list[tuple[int, int]] = []
+    real_encode = grid_processor._encode
+
+    def recording_encode(img, fmt, quality):
+        order.append(img.size)
+        return real_encode(img, fmt, quality)
+
+    monkeypatch.setattr(grid_processor, "_ENCODE_WORKERS", 1)
+    monkeypatch.setattr(grid_processor, "_encode_pool", None)
+    monkeypatch.setattr(grid_processor, "_encode", recording_encode)
+    preview, tiles = grid_processor.process_nine_grid(src, line_width=2)
+
+    # 单线程池按提交顺序执行：预览排在最后一行切片之前
+    assert order[6] == (64, 64)
+    assert len(order) == 10 and len(tiles) == 9
+    assert _decode(preview).size == (64, 64)
+
+
+def _jpeg_bytes(w: int, h: int) -> bytes:
+    buf = io.BytesIO()
+    _gradient(64, 64, "RGB").resize((w, h)).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def test_preview_renders_at_display_resolution(client, upload_secret):
+    resp = client.post(
+        "/api/grid/preview",
+        files={"file": ("big.jpg", _jpeg_bytes(3000, 1500), "image/jpeg")},
+        data={"line_width": "8", "gap": "0", "padding": "0", "max_size": "600"},
+        headers={"X-Upload-Key": upload_secret},
+    )
+    assert resp.status_code == 200
+    preview = _decode(resp.content)
+    # 3000 → 600 缩放 1/5，线宽 8 → 2（每条分隔线占 2 像素）
+    assert preview.size == (600 + 4, 300 + 4)
+
+
+def test_grid_jobs_respect_memory_budget(client, upload_secret, monkeypatch):
+    import pytest
+
+    from app import grid_processor
+
+    budget = grid_processor.MemoryBudget(1000)
+    with budget.reserve(800):
+        with pytest.raises(grid_processor.GridBusy):
+            with budget.reserve(400, timeout=0.05):
+                pass
+    with budget.reserve(1000):
+        assert budget.used == 1000
+    assert budget.used == 0
+    with pytest.raises(grid_processor.GridBudgetExceeded):
+        with budget.reserve(1001):
+            pass
+
+    monkeypatch.setattr(grid_processor, "memory_budget", grid_processor.MemoryBudget(1024 * 1024))
+    resp = client.post(
+        "/api/grid/split",
+        files={"file": ("big.jpg", _jpeg_bytes(1200, 1200), "image/jpeg")},
+        headers={"X-Upload-Key": upload_secret},
+    )
+    assert resp.status_code == 413
+
+
+def test_grid_session_previews_from_cached_copy_and_saves_full_res(client, upload_secret, base_dir, monkeypatch):
+    from app import grid_sessions
+
+    headers = {"X-Upload-Key": upload_secret}
+    resp = client.post(
+        "/api/grid/session",
+        files={"file": ("photo.jpg", _jpeg_bytes(3000, 3000), "image/jpeg")},
+        headers=headers,
+    )
+    assert resp.status_code == 200
+    body = resp.json()
+    sid = body["session_id"]
+    assert (body["width"], body["height"]) == (3000, 3000)
+    assert max(body["preview_width"], body["preview_height"]) <= grid_sessions.GRID_PREVIEW_MAX_PX
+
+    # 预览只传参数，不再上传/解码原图
+    def no_decode(*_a, **_k):
+        raise AssertionError("preview must not reopen the source")
+
+    monkeypatch.setattr(grid_sessions, "open_source", no_decode)
+    for lw in ("0", "6"):
+        resp = client.post(
+            "/api/grid/preview",
+            data={"session_id": sid, "line_width": lw, "max_size": "500", "output_format": "PNG"},
+            headers=headers,
+        )
+        assert resp.status_code == 200
+        assert max(_decode(resp.content).size) <= 504
+    monkeypatch.undo()
+
+    # LRU 被清空（或换了 worker）时从落盘原图重建
+    grid_sessions._cache.clear()
+    resp = client.post("/api/grid/preview", data={"session_id": sid}, headers=headers)
+    assert resp.status_code == 200
+
+    resp = client.post(
+        "/api/grid/save",
+        data={"session_id": sid, "destination": "grids", "line_width": "0"},
+        headers=headers,
+    )
+    assert resp.status_code == 200
+    saved = resp.json()
+    assert saved["files"][0] == "photo_preview.jpg"
+    tile = Image.open(base_dir / saved["destination"] / "photo_1.jpg")
+    assert tile.size == (1000, 1000)
+
+    assert client.delete(f"/api/grid/session/{sid}", headers=headers).status_code == 200
+    resp = client.post("/api/grid/preview", data={"session_id": sid}, headers=headers)
+    assert resp.status_code == 404
+
+
+def test_grid_job_cancelled_when_client_disconnects(app_ctx, monkeypatch):
+    import asyncio
+    import threading
+
+    import pytest
+    from fastapi import HTTPException
+
+    from app import grid_processor
+    from app.routes import grid as grid_routes
+
+    with pytest.raises(grid_processor.GridCancelled):
+        grid_processor.process_nine_grid(_gradient(30, 30, "RGB"), should_cancel=lambda: True)
+
+    started = threading.Event()
+    observed: list[bool] = []
+
+    def job(should_cancel):
+        started.set()
+        for _ in range(200):
+            if should_cancel():
+                observed.append(True)
+                raise grid_processor.GridCancelled()
+            threading.Event().wait(0.01)
+        return b"done"
+
+    class GoneRequest:
+        async def is_disconnected(self) -> bool:
+            return started.is_set()
+
+    monkeypatch.setattr(grid_routes, "_DISCONNECT_POLL_S", 0.01)
+
+    async def run():
+        with pytest.raises(HTTPException) as exc:
+            await grid_routes._run_grid_job(GoneRequest(), 0, job)
+        assert exc.value.status_code == 499
+        for _ in range(100):
+            if observed:
+                break
+            await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert observed == [True]
+
+    monkeypatch.setattr(grid_processor, "GRID_MAX_PENDING", 0)
+    with pytest.raises(grid_processor.GridBusy):
+        grid_processor.submit_job(lambda: None)
+
+
+def test_health_reports_event_loop_lag(client):
+    from app import loop_lag
+
+    loop_lag.monitor.record(12.0)
+    stats = client.get("/health").json()["event_loop"]
+    assert stats["samples"] >= 1
+    assert stats["max_ms"] >= 12.0
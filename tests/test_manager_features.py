@@ -60,3 +60,75 @@ def test_manage_export_returns_attachment_for_single_file(client, upload_secret,
     )
     assert resp.status_code == 200
     assert "attachment" in (resp.headers.get("content-disposition") or "")
+
+
+def test_token_list_is_served_from_summary_index(client, upload_secret, base_dir, monkeypatch):
+    import os
+
+    from app import storage
+
+    (base_dir / "alpha").mkdir()
+    (base_dir / "alpha" / "a.png").write_bytes(_png_bytes())
+    (base_dir / "beta").mkdir()
+    client.post(
+        "/api/manage/beta/meta", headers={"X-Upload-Key": upload_secret}, json={"title": "Beta trip"}
+    )
+
+    first = client.get(f"/api/tokens?key={upload_secret}").json()["tokens"]
+    assert [(t["token"], t["count"], t["title"]) for t in first] == [("alpha", 1, "a"), ("beta", 0, "Beta trip")]
+
+    summarized: list[str] = []
+    real = storage._summarize_token
+    monkeypatch.setattr(storage, "_summarize_token", lambda token, d: (summarized.append(token), real(token, d))[1])
+    assert client.get(f"/api/tokens?key={upload_secret}").json()["tokens"] == first
+    assert summarized == []
+
+    # Files dropped in behind the app's back change the directory mtime.
+    (base_dir / "alpha" / "b.png").write_bytes(_png_bytes())
+    os.utime(base_dir / "alpha", ns=(0, 10**18))
+    client.post("/api/manage/beta/meta", headers={"X-Upload-Key": upload_secret}, json={"title": "Beta 2"})
+    tokens = client.get(f"/api/tokens?key={upload_secret}").json()["tokens"]
+    assert [(t["token"], t["count"], t["title"]) for t in tokens] == [("alpha", 2, "a"), ("beta", 0, "Beta 2")]
+    assert sorted(summarized) == ["alpha", "beta"]
+
+
+def test_manager_json_answers_304_until_something_changes(client, upload_secret, base_dir, monkeypatch):
+    from app import storage
+    from app.routes import folders
+
+    headers = {"X-Upload-Key": upload_secret}
+    (base_dir / "alpha").mkdir()
+    (base_dir / "alpha" / "a.png").write_bytes(_png_bytes())
+
+    # First reads write back what they discover (slugs, the album order): changes themselves.
+    client.get(f"/api/folders/tree?key={upload_secret}")
+    client.get(f"/api/manage/alpha?key={upload_secret}")
+    tree = client.get(f"/api/folders/tree?key={upload_secret}")
+    listing = client.get(f"/api/manage/alpha?key={upload_secret}")
+    stats = client.get("/api/stats", headers=headers)
+    etags = {name: r.headers["etag"] for name, r in [("tree", tree), ("listing", listing), ("stats", stats)]}
+
+    def fail(*_args, **_kwargs):
+        raise AssertionError("304 must not touch the tree")
+
+    monkeypatch.setattr(folders, "build_tree", fail)
+    r = client.get(f"/api/folders/tree?key={upload_secret}", headers={"If-None-Match": etags["tree"]})
+    assert r.status_code == 304 and r.headers["etag"] == etags["tree"]
+    assert client.get(f"/api/manage/alpha?key={upload_secret}", headers={"If-None-Match": etags["listing"]}).status_code == 304
+
+    # Another worker starting up leaves every ETag valid.
+    from app.metadata_store import init_metadata_store
+
+    init_metadata_store()
+    assert client.get("/api/stats", headers={**headers, "If-None-Match": etags["stats"]}).status_code == 304
+
+    # A visit only moves the stats ETag.
+    storage.record_visit("alpha", "203.0.113.9", "pytest")
+    assert client.get(f"/api/folders/tree?key={upload_secret}", headers={"If-None-Match": etags["tree"]}).status_code == 304
+    assert client.get("/api/stats", headers={**headers, "If-None-Match": etags["stats"]}).status_code == 200
+
+    client.post("/api/manage/alpha/order", headers=headers, json={"names": ["a.png"]})
+    monkeypatch.undo()
+    r = client.get(f"/api/folders/tree?key={upload_secret}", headers={"If-None-Match": etags["tree"]})
+    assert r.status_code == 200 and r.headers["etag"] != etags["tree"]
+    assert client.get(f"/api/manage/alpha?key={upload_secret}", headers={"If-None-Match": etags["listing"]}).status_code == 200
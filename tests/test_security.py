@@ -38,3 +38,192 @@ def test_rate_limiter_blocks_after_limit():
     assert rl.allow("k", now=100.0) is True
     assert rl.allow("k", now=100.0) is False
 
+
+
+def test_ip_range_matcher_merges_ranges_and_separates_versions():
+    from app.security import IPRangeMatcher
+
+    matcher = IPRangeMatcher(["10.0.0.0/8", "10.1.0.0/16", "192.168.1.0/24", "fc00::/7", "not-a-net", ""])
+    assert matcher.contains("10.255.255.255")
+    assert matcher.contains("192.168.1.7")
+    assert not matcher.contains("192.168.2.1")
+    assert not matcher.contains("11.0.0.0")
+    assert matcher.contains("fd12::1")
+    assert not matcher.contains("2001:db8::1")
+    assert not matcher.contains("garbage")
+    assert "10.0.0.1" in matcher
+    assert not IPRangeMatcher.from_csv("")
+
+
+def test_local_ip_classification_matches_previous_rules(app_ctx):
+    from app.storage import _is_local_ip, _visit_filter_reason
+
+    for ip in ("127.0.0.1", "10.2.3.4", "172.16.0.1", "192.168.10.10", "::1", "fe80::1", "fd00::1", "::ffff:10.0.0.1"):
+        assert _is_local_ip(ip), ip
+    for ip in ("8.8.8.8", "172.32.0.1", "169.254.1.1", "2606:4700::1111", "::ffff:8.8.8.8", "unknown"):
+        assert not _is_local_ip(ip), ip
+    assert _visit_filter_reason("192.168.1.1") == "local_ip"
+    assert _visit_filter_reason("8.8.8.8", has_admin_session=True) == "admin_session"
+
+
+def test_local_ip_classification_matches_ipaddress(app_ctx):
+    import ipaddress
+
+    from app.storage import _is_local_ip
+
+    def reference(ip: str) -> bool:
+        # The rule _is_local_ip replaced, evaluated with ipaddress.
+        addr = ipaddress.ip_address(ip)
+        if addr.is_loopback:
+            return True
+        if addr.version == 4:
+            return any(addr in ipaddress.ip_network(n) for n in ("10.0.0.0/8", "192.168.0.0/16", "172.16.0.0/12"))
+        return addr.is_private or addr.is_link_local
+
+    table = [
+        "0.0.0.0", "9.255.255.255", "10.0.0.0", "10.255.255.255", "11.0.0.0",
+        "100.64.0.1", "100.127.255.254", "126.255.255.255", "127.0.0.1", "127.255.255.255", "128.0.0.0",
+        "169.254.0.1", "172.15.255.255", "172.16.0.0", "172.31.255.255", "172.32.0.0",
+        "192.0.0.8", "192.0.2.1", "192.88.99.1", "192.167.255.255", "192.168.0.0", "192.168.255.255",
+        "192.169.0.0", "198.18.0.1", "198.51.100.7", "203.0.113.9", "224.0.0.1", "240.0.0.1", "255.255.255.255",
+        "::", "::1", "::2", "::ffff:8.8.8.8", "::ffff:10.0.0.1", "::ffff:100.64.0.1", "::ffff:192.0.2.1",
+        "::ffff:127.0.0.1", "64:ff9b::808:808", "100::1", "2001::1", "2001:2::1", "2001:10::1",
+        "2001:db8::1", "2002::1", "2606:4700::1111", "fbff::1", "fc00::1", "fdff::1", "fe80::1",
+        "febf::1", "fec0::1", "ff02::1",
+    ]
+    for ip in table:
+        assert _is_local_ip(ip) == reference(ip), ip
+
+
+def test_client_ip_skips_trusted_proxies_in_forwarded_chain(app_ctx):
+    from starlette.requests import Request
+    from app.routes.pages import _client_ip
+
+    def make(peer: str, headers: dict[str, str]) -> Request:
+        raw = [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+        return Request({"type": "http", "headers": raw, "client": (peer, 1234)})
+
+    assert _client_ip(make("127.0.0.1", {"X-Forwarded-For": "203.0.113.9, 127.0.0.1"})) == "203.0.113.9"
+    assert _client_ip(make("127.0.0.1", {"CF-Connecting-IP": "198.51.100.4"})) == "198.51.100.4"
+    assert _client_ip(make("203.0.113.1", {"X-Forwarded-For": "198.51.100.4"})) == "203.0.113.1"
+
+
+def test_credential_cache_skips_scrypt_and_resets_on_user_change(app_ctx, monkeypatch):
+    from app import users
+
+    user = users.create_user("alice", "correct-horse")
+    calls = []
+    real_verify = users.verify_password
+
+    def _counting_verify(password, stored):
+        calls.append(password)
+        return real_verify(password, stored)
+
+    monkeypatch.setattr(users, "verify_password", _counting_verify)
+    assert users.authenticate_credential("alice:correct-horse")["id"] == user["id"]
+    assert users.authenticate_credential("alice:correct-horse")["id"] == user["id"]
+    assert len(calls) == 1
+    assert not any(b"correct-horse" in key for key in users._credential_cache)
+
+    assert users.authenticate_credential("alice:wrong-password") is None
+    assert users.authenticate_credential("alice:wrong-password") is None
+    assert len(calls) == 3
+
+    users.create_user("bob-1", "another-pass")
+    assert users.authenticate_credential("alice:correct-horse")["id"] == user["id"]
+    assert len(calls) == 4
+
+    monkeypatch.setattr(users, "_credential_cache", users.OrderedDict())
+    monkeypatch.setattr(users, "AUTH_CACHE_TTL_S", 0.0)
+    assert users.authenticate_credential("alice:correct-horse") is not None
+    assert users.authenticate_credential("alice:correct-horse") is not None
+    assert len(calls) == 6
+
+
+def test_session_cache_skips_sqlite_and_honours_logout_and_expiry(app_ctx, monkeypatch):
+    from app import users
+
+    session_id = users.create_session(users.LEGACY_USER_ID)
+    assert users.get_user_by_session(session_id)["id"] == users.LEGACY_USER_ID
+
+    real_connect = users._connect
+    opened = []
+
+    def _counting_connect():
+        opened.append(1)
+        return real_connect()
+
+    monkeypatch.setattr(users, "_connect", _counting_connect)
+    assert users.get_user_by_session(session_id)["id"] == users.LEGACY_USER_ID
+    assert opened == []
+
+    users.delete_session(session_id)
+    assert users.get_user_by_session(session_id) is None
+
+    conn = real_connect()
+    try:
+        conn.execute(
+            "INSERT INTO sessions (session_id, user_id, created_at, expires_at) VALUES (?, ?, ?, ?)",
+            ("stale", users.LEGACY_USER_ID, "2020-01-01T00:00:00+00:00", "2020-01-02T00:00:00+00:00"),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    assert users.get_user_by_session("stale") is None
+    assert users.purge_expired_sessions() == 1
+
+
+def test_sqlite_rate_limiter_is_shared_between_instances(tmp_path):
+    from app.security import SQLiteRateLimiter
+
+    db = tmp_path / "ratelimit.sqlite3"
+    worker_a = SQLiteRateLimiter(db, "d404", limit=3, window_s=10.0)
+    worker_b = SQLiteRateLimiter(db, "d404", limit=3, window_s=10.0)
+    other = SQLiteRateLimiter(db, "login", limit=3, window_s=10.0)
+
+    assert worker_a.allow("1.2.3.4", now=100.0)
+    assert worker_b.allow("1.2.3.4", now=100.5)
+    assert worker_a.allow("1.2.3.4", now=101.0)
+    assert not worker_b.allow("1.2.3.4", now=101.5)
+    assert other.allow("1.2.3.4", now=101.5)
+    assert worker_b.allow("5.6.7.8", now=101.5)
+    assert worker_b.allow("1.2.3.4", now=110.1)
+
+
+def test_sqlite_rate_limiter_starts_from_empty_base_dir(tmp_path):
+    from app.security import SQLiteRateLimiter
+
+    db = tmp_path / "fresh" / "_system" / "ratelimit.sqlite3"
+    limiter = SQLiteRateLimiter(db, "d404", limit=2, window_s=10.0)
+
+    assert limiter.allow("1.2.3.4", now=100.0)
+    assert limiter.allow("1.2.3.4", now=100.1)
+    assert not limiter.allow("1.2.3.4", now=100.2)
+    assert db.exists()
+    # Each thread keeps its connection instead of reopening per request.
+    assert limiter._connect() is limiter._connect()
+
+
+def test_file_lock_serializes_processes(tmp_path):
+    import subprocess
+    import sys
+    import time
+    from pathlib import Path
+
+    from app.locks import FileLock
+
+    lock_path = tmp_path / "x.lock"
+    child = (
+        "import sys, time; sys.path.insert(0, sys.argv[2]);"
+        "from app.locks import FileLock;"
+        "t = time.monotonic();"
+        "lock = FileLock(sys.argv[1]); lock.__enter__();"
+        "print(time.monotonic() - t)"
+    )
+    root = str(Path(__file__).resolve().parent.parent)
+    with FileLock(lock_path):
+        proc = subprocess.Popen([sys.executable, "-c", child, str(lock_path), root], stdout=subprocess.PIPE, text=True)
+        time.sleep(0.3)
+        assert proc.poll() is None
+    out, _ = proc.communicate(timeout=10)
+    assert float(out) >= 0.2
@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# Self time of every app.* module on a warm start (legacy user already stored),
+# in microseconds. About 150ms on a dev box; the headroom is for slow CI.
+APP_IMPORT_BUDGET_US = 400_000
+
+_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _import_app_main(base_dir: Path) -> dict[str, int]:
+    env = {
+        **os.environ,
+        "UPLOAD_SECRET": "startup-secret",
+        "UPLOAD_BASE": str(base_dir),
+        "PYTHONPATH": str(_ROOT),
+    }
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=str(base_dir),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    self_us: dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us[fields[2].strip()] = int(fields[0])
+        except ValueError:
+            continue
+    return self_us
+
+
+def test_warm_start_stays_within_import_budget(tmp_path: Path):
+    _ = _import_app_main(tmp_path)
+    timings = _import_app_main(tmp_path)
+
+    assert "app.main" in timings
+    assert not any(name == "PIL" or name.startswith("PIL.") for name in timings)
+    app_total = sum(us for name, us in timings.items() if name == "app" or name.startswith("app."))
+    assert app_total < APP_IMPORT_BUDGET_US, sorted(timings.items(), key=lambda kv: -kv[1])[:10]
+
+
+def test_ensure_legacy_user_skips_rewrite_when_hash_verifies(app_ctx):
+    from app import users
+
+    before = users.get_user_by_id(users.LEGACY_USER_ID)
+    users.ensure_legacy_user()
+    # A rehash would store a fresh random salt.
+    assert users.get_user_by_id(users.LEGACY_USER_ID) == before
+
+
+def test_changed_upload_secret_is_rehashed_on_first_admin_login(app_ctx, monkeypatch):
+    from app import users
+
+    old_secret = users.UPLOAD_SECRET
+    monkeypatch.setattr(users, "UPLOAD_SECRET", "rotated-secret")
+    users.ensure_legacy_user()
+    assert users.authenticate("admin", old_secret) is None
+    assert users.authenticate("admin", "rotated-secret")["id"] == users.LEGACY_USER_ID
@@ -103,12 +103,84 @@ def test_sqlite_metadata_backend_reads_title_and_order_without_manifest(sqlite_c
     )
     assert order_resp.status_code == 200
 
-    manifest_path = album_dir / ".manifest.json"
-    assert manifest_path.exists()
-    manifest_path.unlink()
+    assert not (album_dir / ".manifest.json").exists()
 
     list_resp = sqlite_client.get(f"/api/manage/album1?key={secret}")
     assert list_resp.status_code == 200
     assert list_resp.json()["title"] == "SQLite 相册"
     assert list_resp.json()["files"] == ["b.jpg", "a.jpg"]
     assert (base_dir / "_system" / "metadata.sqlite3").exists()
+
+
+@pytest.fixture()
+def legacy_metadata_tree(tmp_path: Path) -> Path:
+    base_dir = tmp_path / "uploads"
+    for rel in ("trip", "trip/day1", "trip/day2", "plain"):
+        (base_dir / rel).mkdir(parents=True, exist_ok=True)
+    (base_dir / "trip" / "day1" / "a.jpg").write_bytes(b"a")
+    (base_dir / "trip" / "day1" / "b.jpg").write_bytes(b"b")
+    (base_dir / "trip" / "day1" / ".manifest.json").write_text(
+        json.dumps({"title": "Day 1", "order": ["b.jpg", "a.jpg"]}), encoding="utf-8"
+    )
+    (base_dir / "trip" / ".folder_order.json").write_text(json.dumps(["day2", "day1"]), encoding="utf-8")
+    return base_dir
+
+
+def test_sqlite_backend_migrates_once_and_serves_reads_without_files(
+    legacy_metadata_tree, sqlite_client, sqlite_app_ctx, monkeypatch
+):
+    from app import metadata_store, storage
+    from app.users import LEGACY_USER_ID
+
+    secret = sqlite_app_ctx["secret"]
+    assert metadata_store.is_metadata_migrated(LEGACY_USER_ID)
+    # Startup migrated everything; from here on the JSON files are never read.
+    monkeypatch.setattr(storage, "_read_manifest_file", lambda p: pytest.fail(f"read {p}"))
+    monkeypatch.setattr(storage, "_load_subfolder_order_from_fs", lambda d: pytest.fail(f"read {d}"))
+    calls: list[str] = []
+    real_batch = storage.load_folder_orders_under
+    monkeypatch.setattr(storage, "load_folder_orders_under", lambda *a: (calls.append(a[1]), real_batch(*a))[1])
+    monkeypatch.setattr(storage, "load_folder_order_record", lambda *a: pytest.fail("per-folder query"))
+
+    assert storage.get_token_title("trip/day1") == "Day 1"
+    assert storage.list_images("trip/day1") == ["b.jpg", "a.jpg"]
+    assert sqlite_client.get(f"/api/manage/plain?key={secret}").json()["files"] == []
+
+    tree = storage.build_tree()
+    trip = next(n for n in tree if n["name"] == "trip")
+    assert [c["name"] for c in trip["children"]] == ["day2", "day1"]
+    assert calls == ["."]
+
+
+def test_sqlite_metadata_follows_folder_rename_move_and_trash(sqlite_client, sqlite_app_ctx):
+    from app import storage
+
+    base_dir = sqlite_app_ctx["base_dir"]
+    secret = sqlite_app_ctx["secret"]
+    headers = {"X-Upload-Key": secret}
+    (base_dir / "a" / "inner").mkdir(parents=True)
+    (base_dir / "dest").mkdir()
+    for name in ("x.jpg", "y.jpg"):
+        (base_dir / "a" / name).write_bytes(name.encode())
+    sqlite_client.post("/api/manage/a/meta", headers=headers, json={"title": "My Album"})
+    sqlite_client.post("/api/manage/a/order", headers=headers, json={"names": ["y.jpg", "x.jpg"]})
+    storage.set_token_title("a/inner", "Inner")
+
+    assert sqlite_client.post("/api/folders/rename", headers=headers, json={"path": "a", "new_name": "b"}).status_code == 200
+    listing = sqlite_client.get(f"/api/manage/b?key={secret}").json()
+    assert (listing["title"], listing["files"]) == ("My Album", ["y.jpg", "x.jpg"])
+    assert storage.get_token_title("b/inner") == "Inner"
+
+    assert sqlite_client.post("/api/folders/move", headers=headers, json={"path": "b", "dest": "dest"}).status_code == 200
+    assert storage.get_token_title("dest/b") == "My Album"
+    assert storage.list_images("dest/b") == ["y.jpg", "x.jpg"]
+    assert storage.get_token_title("dest/b/inner") == "Inner"
+
+    # A new folder reusing an old name starts clean.
+    (base_dir / "a").mkdir()
+    assert sqlite_client.get(f"/api/manage/a?key={secret}").json()["title"] == ""
+
+    deleted = sqlite_client.post("/api/folders/delete", headers=headers, json={"path": "dest/b"}).json()
+    sqlite_client.post("/api/trash/restore", headers=headers, json={"id": deleted["trash_item"]["id"]})
+    assert storage.get_token_title("dest/b") == "My Album"
+    assert storage.list_images("dest/b") == ["y.jpg", "x.jpg"]
@@ -24,3 +24,298 @@ def test_upload_with_key_succeeds(client, upload_secret, base_dir):
     assert data["file"].endswith(".png")
     assert (base_dir / "testtoken" / data["file"]).exists()
 
+
+def test_upload_names_by_content_hash_and_hands_bytes_to_variants(client, upload_secret, base_dir, monkeypatch):
+    import hashlib
+    import sqlite3
+
+    from app.routes import upload
+
+    queued: list[tuple[str, bytes | None]] = []
+    monkeypatch.setattr(upload, "_queue_variant", lambda path, data=None: queued.append((path.name, data)))
+
+    body = _png_bytes() + b"\x01" * (3 * 1024 * 1024)
+    r = client.post(
+        "/api/upload/testtoken",
+        headers={"X-Upload-Key": upload_secret},
+        files={"file": ("x.png", body, "image/png")},
+    )
+    assert r.status_code == 200
+    name = r.json()["file"]
+    sha = hashlib.sha256(body).hexdigest()
+    assert name.endswith(f"_{sha[:16]}.png")
+    assert (base_dir / "testtoken" / name).read_bytes() == body
+    assert queued == [(name, body)]
+    assert not list((base_dir / "testtoken").glob(".upload-*"))
+
+    with sqlite3.connect(base_dir / "_system" / "metadata.sqlite3") as conn:
+        row = conn.execute("SELECT rel_path, sha256, size FROM content_hashes").fetchone()
+    assert row == (f"testtoken/{name}", sha, len(body))
+
+
+def test_upload_too_large_leaves_no_partial_file(client, upload_secret, base_dir, monkeypatch):
+    from app.routes import upload
+
+    monkeypatch.setattr(upload, "MAX_BYTES", 1024)
+    r = client.post(
+        "/api/upload/testtoken",
+        headers={"X-Upload-Key": upload_secret},
+        files={"file": ("x.png", _png_bytes() + b"\x00" * 4096, "image/png")},
+    )
+    assert r.status_code == 413
+    assert [p.name for p in (base_dir / "testtoken").iterdir() if not p.name.startswith(".manifest")] == []
+
+
+def test_duplicate_uploads_are_linked_or_skipped(client, upload_secret, base_dir):
+    import io
+    import zipfile
+
+    headers = {"X-Upload-Key": upload_secret}
+    body = _png_bytes() + b"\x02" * 4096
+
+    first = client.post("/api/upload/albuma", headers=headers, files={"file": ("x.png", body, "image/png")}).json()
+    assert first["status"] == "stored"
+    original = base_dir / "albuma" / first["file"]
+    variant = original.parent / ".pfv" / original.name / "download-q3.jpg"
+    variant.parent.mkdir(parents=True, exist_ok=True)
+    variant.write_bytes(b"jpeg")
+
+    again = client.post("/api/upload/albuma", headers=headers, files={"file": ("y.png", body, "image/png")}).json()
+    assert again["status"] == "duplicate"
+    assert again["file"] == first["file"]
+
+    other = client.post("/api/upload/albumb", headers=headers, files={"file": ("x.png", body, "image/png")}).json()
+    assert other["status"] == "linked"
+    copy = base_dir / "albumb" / other["file"]
+    assert copy.stat().st_ino == original.stat().st_ino
+    assert (copy.parent / ".pfv" / copy.name / "download-q3.jpg").stat().st_ino == variant.stat().st_ino
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("shoot/a.png", body)
+        zf.writestr("shoot/b.png", _png_bytes() + b"\x03" * 10)
+    r = client.post("/api/upload/zip-import", headers=headers, files={"file": ("s.zip", buf.getvalue(), "application/zip")})
+    assert r.json() == {"ok": True, "imported": 2, "linked": 1, "duplicates": 0}
+    assert (base_dir / "shoot" / "a.png").stat().st_ino == original.stat().st_ino
+
+    r = client.post(
+        "/api/upload/folder-import",
+        headers=headers,
+        files=[("files", ("a.png", body, "image/png"))],
+        data={"paths": ["shoot/a.png"]},
+    )
+    assert r.json() == {"ok": True, "imported": 0, "linked": 0, "duplicates": 1}
+
+
+def test_zip_import_background_job_reports_progress(client, upload_secret, base_dir):
+    import io
+    import time
+    import zipfile
+
+    headers = {"X-Upload-Key": upload_secret}
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for i in range(6):
+            zf.writestr(f"trip/{i}.png", _png_bytes() + bytes([i]) * 100)
+        zf.writestr("trip/fake.png", b"not an image at all")
+        zf.writestr("trip/notes.txt", b"hello")
+    r = client.post(
+        "/api/upload/zip-import",
+        headers=headers,
+        data={"background": "true"},
+        files={"file": ("trip.zip", buf.getvalue(), "application/zip")},
+    )
+    assert r.status_code == 202
+    job_id = r.json()["job_id"]
+
+    for _ in range(200):
+        job = client.get(f"/api/upload/jobs/{job_id}", headers=headers).json()
+        if job["status"] in ("done", "failed"):
+            break
+        time.sleep(0.02)
+    assert job["status"] == "done"
+    assert (job["total"], job["processed"], job["imported"]) == (8, 8, 6)
+    assert job["skipped"] == {"type": 1, "ext": 1}
+    assert sorted(p.name for p in (base_dir / "trip").glob("*.png")) == [f"{i}.png" for i in range(6)]
+
+    assert client.get("/api/upload/jobs/nope", headers=headers).status_code == 404
+
+    r = client.post(
+        "/api/upload/zip-import",
+        headers=headers,
+        files={"file": ("bad.zip", b"PK\x03\x04garbage", "application/zip")},
+    )
+    assert r.status_code == 400
+
+
+def test_zip_import_defaults_to_background_for_large_archives(client, upload_secret, monkeypatch):
+    import io
+    import time
+    import zipfile
+
+    from app.routes import upload as upload_routes
+
+    headers = {"X-Upload-Key": upload_secret}
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("big/a.png", _png_bytes())
+    archive = buf.getvalue()
+
+    monkeypatch.setattr(upload_routes, "_ZIP_BACKGROUND_BYTES", len(archive))
+    r = client.post("/api/upload/zip-import", headers=headers, files={"file": ("big.zip", archive, "application/zip")})
+    assert r.status_code == 202
+    job_id = r.json()["job_id"]
+    for _ in range(200):
+        if client.get(f"/api/upload/jobs/{job_id}", headers=headers).json()["status"] in ("done", "failed"):
+            break
+        time.sleep(0.02)
+
+    r = client.post(
+        "/api/upload/zip-import",
+        headers=headers,
+        data={"background": "false", "destination": "sync"},
+        files={"file": ("big.zip", archive, "application/zip")},
+    )
+    assert r.status_code == 200 and r.json()["ok"] is True
+
+
+def test_chunked_upload_session_resumes_out_of_order(client, upload_secret, base_dir):
+    import hashlib
+    from concurrent.futures import ThreadPoolExecutor
+
+    headers = {"X-Upload-Key": upload_secret}
+    body = _png_bytes() + bytes(range(256)) * 40
+    sha = hashlib.sha256(body).hexdigest()
+    r = client.post(
+        "/api/upload/sessions",
+        headers=headers,
+        data={"filename": "big.png", "size": str(len(body)), "path": "albumc", "sha256": sha},
+    )
+    assert r.status_code == 200
+    sid = r.json()["session_id"]
+
+    step = 1024
+    offsets = list(range(0, len(body), step))
+    # Upload the tail first, then "reconnect" and ask what is still missing.
+    for off in offsets[len(offsets) // 2 :]:
+        r = client.put(f"/api/upload/sessions/{sid}?offset={off}", headers=headers, content=body[off : off + step])
+        assert r.status_code == 200
+    status = client.get(f"/api/upload/sessions/{sid}", headers=headers).json()
+    assert status["missing"] == [[0, offsets[len(offsets) // 2]]]
+    r = client.post(f"/api/upload/sessions/{sid}/finalize", headers=headers)
+    assert r.status_code == 409
+
+    def put(off: int) -> int:
+        return client.put(f"/api/upload/sessions/{sid}?offset={off}", headers=headers, content=body[off : off + step]).status_code
+
+    with ThreadPoolExecutor(4) as pool:
+        assert set(pool.map(put, reversed(offsets[: len(offsets) // 2]))) == {200}
+    assert client.get(f"/api/upload/sessions/{sid}", headers=headers).json()["complete"] is True
+
+    r = client.post(f"/api/upload/sessions/{sid}/finalize", headers=headers)
+    assert r.status_code == 200
+    data = r.json()
+    assert data["status"] == "stored"
+    assert (base_dir / "albumc" / data["file"]).read_bytes() == body
+    assert client.get(f"/api/upload/sessions/{sid}", headers=headers).status_code == 404
+
+    r = client.post(
+        "/api/upload/sessions",
+        headers=headers,
+        data={"filename": "x.png", "size": "200", "path": "albumc"},
+    )
+    sid = r.json()["session_id"]
+    r = client.put(f"/api/upload/sessions/{sid}?offset=0", headers=headers, content=b"not an image")
+    assert r.status_code == 400
+    r = client.put(f"/api/upload/sessions/{sid}?offset=190", headers=headers, content=b"\x00" * 20)
+    assert r.status_code == 416
+
+
+def test_chunked_finalize_failure_keeps_session_resumable(client, upload_secret, base_dir, monkeypatch):
+    import pytest
+
+    from app.routes import upload as upload_routes
+
+    headers = {"X-Upload-Key": upload_secret}
+    body = _png_bytes() + bytes(range(256)) * 4
+    r = client.post(
+        "/api/upload/sessions",
+        headers=headers,
+        data={"filename": "keep.png", "size": str(len(body)), "path": "albumk"},
+    )
+    sid = r.json()["session_id"]
+    assert client.put(f"/api/upload/sessions/{sid}?offset=0", headers=headers, content=body).status_code == 200
+
+    def _disk_full(*_args, **_kwargs):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as m:
+        m.setattr(upload_routes, "place_stored_file", _disk_full)
+        with pytest.raises(OSError):
+            client.post(f"/api/upload/sessions/{sid}/finalize", headers=headers)
+
+    assert client.get(f"/api/upload/sessions/{sid}", headers=headers).json()["complete"] is True
+    assert not list((base_dir / "albumk").glob(".upload-*"))
+    r = client.post(f"/api/upload/sessions/{sid}/finalize", headers=headers)
+    assert r.status_code == 200
+    assert (base_dir / "albumk" / r.json()["file"]).read_bytes() == body
+    assert client.post(f"/api/upload/sessions/{sid}/finalize", headers=headers).status_code == 404
+
+
+def test_concurrent_appends_share_one_manifest_write(client, base_dir, monkeypatch):
+    import json
+    import threading
+
+    from app import storage
+
+    album = base_dir / "burst"
+    album.mkdir()
+    (album / "old.png").write_bytes(_png_bytes())
+    storage.update_order("burst", ["old.png"])
+
+    writes: list[list[str]] = []
+    real_save = storage.save_manifest
+    monkeypatch.setattr(storage, "save_manifest", lambda token, data: (writes.append(list(data["order"])), real_save(token, data)))
+    monkeypatch.setattr(storage, "_APPEND_WINDOW_S", 0.2)
+
+    names = [f"{i:02d}.png" for i in range(12)]
+    for name in names:
+        (album / name).write_bytes(_png_bytes())
+    threads = [threading.Thread(target=storage.append_in_order, args=("burst", name)) for name in names]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(writes) == 1
+    order = json.loads((album / ".manifest.json").read_text(encoding="utf-8"))["order"]
+    assert order[0] == "old.png"
+    assert sorted(order[1:]) == names
+    assert storage.list_images("burst") == order
+
+
+def test_dedup_index_follows_renames_and_ignores_replaced_files(client, upload_secret, base_dir):
+    import os
+
+    headers = {"X-Upload-Key": upload_secret}
+    body = _png_bytes() + b"\x03" * 4096
+    impostor = _png_bytes() + b"\x04" * 4096
+
+    first = client.post("/api/upload/albumc", headers=headers, files={"file": ("x.png", body, "image/png")}).json()
+    assert first["status"] == "stored"
+    r = client.post("/api/manage/albumc/rename", headers=headers, json={"oldName": first["file"], "newName": "y.png"})
+    assert r.status_code == 200
+    # Different bytes of the same size reappear under the old name.
+    (base_dir / "albumc" / first["file"]).write_bytes(impostor)
+
+    linked = client.post("/api/upload/albumd", headers=headers, files={"file": ("x.png", body, "image/png")}).json()
+    assert linked["status"] == "linked"
+    assert (base_dir / "albumd" / linked["file"]).stat().st_ino == (base_dir / "albumc" / "y.png").stat().st_ino
+
+    # Rewritten in place (same size, same inode): no longer trusted as a copy.
+    renamed = base_dir / "albumc" / "y.png"
+    renamed.write_bytes(impostor)
+    os.utime(renamed, ns=(0, renamed.stat().st_mtime_ns + 10**9))
+    fresh = client.post("/api/upload/albume", headers=headers, files={"file": ("x.png", body, "image/png")}).json()
+    assert fresh["status"] == "stored"
+    assert (base_dir / "albume" / fresh["file"]).read_bytes() == body